@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from typing import Optional
+from functools import lru_cache
 import os
 from pathlib import Path
 from pydantic import Field
@@ -11,18 +12,13 @@ class Settings(BaseSettings):
     """
     
     # AI Configuration - Gemini API (Primary)
-    gemini_api_key: str = Field("your-gemini-api-key", env="GEMINI_API_KEY")
+    gemini_api_key: str = Field("your-gemini-api-key")
     
     # OpenAI Configuration (Fallback)
-    openai_api_key: str = Field("sk-your-openai-api-key", env="OPENAI_API_KEY")
+    openai_api_key: str = Field("sk-your-openai-api-key")
     
-    # Midjourney/Image Generation
-    midjourney_api_key: Optional[str] = Field(None, env="MIDJOURNEY_API_KEY")
-    midjourney_server_id: Optional[str] = Field(None, env="MIDJOURNEY_SERVER_ID")
-    midjourney_channel_id: Optional[str] = Field(None, env="MIDJOURNEY_CHANNEL_ID")
-    
-    # Piapi.ai (Midjourney API Service)
-    piapi_api_key: Optional[str] = Field(None, env="PIAPI_API_KEY")
+    # Giới hạn request/phút gửi tới AI provider (mặc định theo quota free tier của Gemini Flash)
+    ai_requests_per_minute: int = 15
     
     # Google APIs
     google_credentials_file: str = Field("credentials.json")
@@ -47,38 +43,58 @@ class Settings(BaseSettings):
     images_storage_path: str = "./data/images"
     logs_path: str = "./logs"
     
+    # Ghi lại channel_mapping_config.json sau mỗi thay đổi kênh thay vì chỉ khi change log dài
+    channel_config_compact_every_change: bool = False
+    
     # Content Creator Info
     channel_owner_name: str = "Team AI"
     default_channel_name: str = Field("Demo Channel")
     default_channel_description: str = Field("Kênh demo để thử nghiệm tạo nội dung tự động")
     
-    # AI Services API Keys
-    midjourney_api_key: Optional[str] = Field(None, env="MIDJOURNEY_API_KEY")
-    
     # Midjourney Integration Options
-    # Option 1: Replicate API (Recommended)
-    replicate_api_token: Optional[str] = Field(None, env="REPLICATE_API_TOKEN")
+    # (tên biến môi trường trùng tên field, không phân biệt hoa thường, ví dụ PIAPI_API_KEY)
+    # Option 1: Piapi.ai (Midjourney API Service)
+    piapi_api_key: Optional[str] = None
     
     # Option 2: GoAPI (Midjourney API Service)
-    goapi_token: Optional[str] = Field(None, env="GOAPI_TOKEN")
+    goapi_token: Optional[str] = None
+    
+    # Option 3: Replicate API
+    replicate_api_token: Optional[str] = None
     
-    # Option 3: Discord Bot Integration
-    midjourney_server_id: Optional[str] = Field(None, env="MIDJOURNEY_SERVER_ID")
-    midjourney_channel_id: Optional[str] = Field(None, env="MIDJOURNEY_CHANNEL_ID")
-    discord_bot_token: Optional[str] = Field(None, env="DISCORD_BOT_TOKEN")
+    # Option 4: Discord Bot Integration
+    midjourney_api_key: Optional[str] = None
+    midjourney_server_id: Optional[str] = None
+    midjourney_channel_id: Optional[str] = None
+    discord_bot_token: Optional[str] = None
     
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
         case_sensitive = False
 
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        # Tạo các thư mục cần thiết
-        Path(self.data_storage_path).mkdir(parents=True, exist_ok=True)
-        Path(self.images_storage_path).mkdir(parents=True, exist_ok=True)
-        Path(self.logs_path).mkdir(parents=True, exist_ok=True)
+    def ensure_dirs(self):
+        """
+        Tạo các thư mục lưu trữ cần thiết.
+        Gọi một lần từ entry point thay vì trong __init__ để import module không phát sinh syscall.
+        """
+        for path in (self.data_storage_path, self.images_storage_path, self.logs_path):
+            # Một stat cho thư mục đã tồn tại thay vì stat + mkdir + stat của mkdir(exist_ok=True)
+            if not os.path.isdir(path):
+                Path(path).mkdir(parents=True, exist_ok=True)
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """
+    Trả về Settings singleton, chỉ đọc .env và validate ở lần gọi đầu tiên
+    """
+    return Settings()
 
 
-# Global settings instance
-settings = Settings() 
\ No newline at end of file
+def __getattr__(name: str):
+    # Giữ tương thích với `from config.settings import settings`:
+    # instance chỉ được tạo khi thực sự có người truy cập
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
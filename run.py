@@ -8,23 +8,23 @@ Script chạy ứng dụng
 
 import sys
 import os
+import importlib.util
 import subprocess
 from pathlib import Path
 
 def check_requirements():
     """Kiểm tra requirements.txt"""
-    try:
-        import fastapi
-        import uvicorn
-        import openai
-        import gspread
-        import pydantic_settings
-        print("✅ Tất cả dependencies đã được cài đặt")
-        return True
-    except ImportError as e:
-        print(f"❌ Thiếu dependency: {e}")
-        print("Chạy: pip install -r requirements.txt")
-        return False
+    # find_spec chỉ tìm module, không thực thi code import (openai, gspread... rất nặng)
+    required_modules = ("fastapi", "uvicorn", "openai", "gspread", "pydantic_settings")
+    
+    for name in required_modules:
+        if importlib.util.find_spec(name) is None:
+            print(f"❌ Thiếu dependency: No module named '{name}'")
+            print("Chạy: pip install -r requirements.txt")
+            return False
+    
+    print("✅ Tất cả dependencies đã được cài đặt")
+    return True
 
 def check_env_file():
     """Kiểm tra file .env"""
@@ -46,9 +46,10 @@ def check_env_file():
 def check_directories():
     """Tạo các thư mục cần thiết"""
     directories = ["data", "data/images", "logs", "templates", "static"]
-    
     for directory in directories:
-        Path(directory).mkdir(parents=True, exist_ok=True)
+        # Chỉ mkdir những thư mục còn thiếu
+        if not os.path.isdir(directory):
+            os.makedirs(directory, exist_ok=True)
     
     print("✅ Các thư mục đã được tạo/kiểm tra")
 
@@ -68,25 +69,32 @@ def main():
     
     # Tạo thư mục
     check_directories()
+    from config.settings import get_settings
+    settings = get_settings()
+    settings.ensure_dirs()
     
     # Chạy ứng dụng
     print("\n🔥 Đang khởi động ứng dụng...")
-    print("📱 Truy cập: http://localhost:8000")
-    print("📊 Dashboard: http://localhost:8000/dashboard")
-    print("🔍 API Docs: http://localhost:8000/docs")
+    print(f"📱 Truy cập: http://localhost:{settings.app_port}")
+    print(f"📊 Dashboard: http://localhost:{settings.app_port}/dashboard")
+    print(f"🔍 API Docs: http://localhost:{settings.app_port}/docs")
     print("\n⏹️  Nhấn Ctrl+C để dừng")
     print("=" * 50)
     
     try:
-        # Import và chạy ứng dụng
-        from src.main import app
         import uvicorn
         
+        # Truyền import string để worker tự import app, reload chỉ bật khi debug.
+        # loop/http "auto" chọn uvloop + httptools khi đã cài (uvicorn[standard]).
+        # Giữ 1 worker vì content packages đang được lưu trong bộ nhớ process.
         uvicorn.run(
-            app,
-            host="0.0.0.0",
-            port=8000,
-            reload=True
+            "src.main:app",
+            host=settings.app_host,
+            port=settings.app_port,
+            reload=settings.debug,
+            loop="auto",
+            http="auto",
+            workers=1
         )
         
     except KeyboardInterrupt:
@@ -6,15 +6,20 @@ Script để setup các kênh YouTube từ file cấu hình
 import json
 import sys
 import os
-from pathlib import Path
-
-# Thêm thư mục src vào path
-src_dir = Path(__file__).parent / "src"
-sys.path.append(str(src_dir))
+from operator import itemgetter
 
 from src.models import ChannelConfig
-from src.channel_manager import channel_manager
-from config.settings import settings
+from src.channel_manager import get_channel_manager
+from config.settings import get_settings
+
+# Dùng chung instance Settings đã cache, không parse lại env
+settings = get_settings()
+
+# Số kênh mỗi lần ghi file cấu hình
+BATCH_SIZE = 64
+
+# Các trường bắt buộc của mỗi kênh trong file cấu hình
+_required_fields = itemgetter("channel_id", "channel_name", "channel_description", "google_sheet_name")
 
 
 def load_channel_config():
@@ -29,6 +34,18 @@ def load_channel_config():
         return json.load(f)
 
 
+def iter_batches(items, batch_size: int = BATCH_SIZE):
+    """Chia danh sách thành các batch kích thước cố định"""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
 def setup_channels():
     """Setup tất cả các kênh"""
     print("🚀 Bắt đầu setup các kênh YouTube...")
@@ -45,41 +62,49 @@ def setup_channels():
         # Cập nhật settings (có thể cần update .env file)
         settings.google_sheets_id = spreadsheet_id
     
-    # Setup từng kênh
+    # Tạo ChannelConfig cho từng kênh
     channels_data = config.get("channels", [])
-    success_count = 0
+    channel_configs = []
+    lines = []
     
     for channel_data in channels_data:
         try:
-            # Tạo ChannelConfig
-            channel_config = ChannelConfig(
-                channel_id=channel_data["channel_id"],
-                channel_name=channel_data["channel_name"],
-                channel_description=channel_data["channel_description"],
-                google_sheets_id=spreadsheet_id,  # Cùng một spreadsheet
-                google_sheet_name=channel_data["google_sheet_name"],  # Khác sheet name
-                content_style=channel_data.get("content_style"),
-                target_audience=channel_data.get("target_audience"),
-                content_topics=channel_data.get("content_topics", [])
-            )
-            
-            # Thêm vào channel manager
-            success = channel_manager.add_channel(channel_config)
-            
-            if success:
-                print(f"✅ Đã setup kênh: {channel_config.channel_name} → Sheet: {channel_data['google_sheet_name']}")
-                success_count += 1
-            else:
-                print(f"❌ Lỗi setup kênh: {channel_config.channel_name}")
-                
+            channel_id, channel_name, channel_description, sheet_name = _required_fields(channel_data)
+            channel_configs.append(ChannelConfig.model_validate({
+                "channel_id": channel_id,
+                "channel_name": channel_name,
+                "channel_description": channel_description,
+                "google_sheets_id": spreadsheet_id,  # Cùng một spreadsheet
+                "google_sheet_name": sheet_name,  # Khác sheet name
+                "content_style": channel_data.get("content_style"),
+                "target_audience": channel_data.get("target_audience"),
+                "content_topics": channel_data.get("content_topics", [])
+            }))
         except Exception as e:
-            print(f"❌ Lỗi khi setup kênh {channel_data.get('channel_name', 'Unknown')}: {str(e)}")
+            lines.append(f"❌ Lỗi khi setup kênh {channel_data.get('channel_name', 'Unknown')}: {str(e)}\n")
+    
+    # Thêm vào channel manager theo batch - mỗi batch chỉ ghi file cấu hình một lần
+    success_count = 0
+    for batch in iter_batches(channel_configs):
+        added = get_channel_manager().add_channels_bulk(batch)
+        
+        if added:
+            for channel_config in batch:
+                lines.append(f"✅ Đã setup kênh: {channel_config.channel_name} → Sheet: {channel_config.google_sheet_name}\n")
+            success_count += added
+        else:
+            for channel_config in batch:
+                lines.append(f"❌ Lỗi setup kênh: {channel_config.channel_name}\n")
+    
+    # Ghi log một lần thay vì print từng dòng
+    sys.stdout.write("".join(lines))
+    sys.stdout.flush()
     
     print(f"\n🎯 Đã setup thành công {success_count}/{len(channels_data)} kênh")
     
     # Hiển thị danh sách kênh
     print("\n📋 Danh sách kênh đã setup:")
-    all_channels = channel_manager.get_all_channels()
+    all_channels = get_channel_manager().get_all_channels()
     for channel_id, channel in all_channels.items():
         sheet_name = getattr(channel, 'google_sheet_name', 'Sheet mặc định')
         print(f"   • {channel.channel_name} (ID: {channel_id}) → {sheet_name}")
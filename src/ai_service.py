@@ -2,7 +2,8 @@ import openai
 import json
 import asyncio
 import re
-from typing import List, Dict, Any, Tuple, Optional
+import string
+from typing import List, Dict, Any, AsyncIterator, Tuple, Optional
 import sys
 import pathlib
 
@@ -16,10 +17,146 @@ from config.settings import settings
 from src.prompt_manager import prompt_manager
 import logging
 import httpx
+import orjson
+import hashlib
 import os
+import time
+from collections import Counter, OrderedDict, deque
 
 logger = logging.getLogger(__name__)
 
+# Regex dùng khi parse/clean tags - compile một lần khi import module
+_TAG_JSON_RE = re.compile(r'\{[^}]*"tags":\s*\[([^\]]+)\][^}]*\}', re.DOTALL)
+_TAG_ARRAY_RE = re.compile(r'\[([^\]]+)\]', re.DOTALL)
+_LEADING_JUNK_RE = re.compile(r'^["\'\-\*\d\.\s]+')
+_CLEAN_LEAD_RE = re.compile(r'^[#\-\*\d\.\s"\'\(\)\[\]]+')
+
+# Code block trong response Midjourney prompts và JSON object trong response fallback
+_CODE_BLOCK_RE = re.compile(r'```(.*?)```', re.DOTALL)
+_JSON_OBJ_RE = re.compile(r'\{.*\}', re.DOTALL)
+
+# Ký tự bị xoá khi tạo fallback tags từ topic/title và từ tên kênh
+_FALLBACK_PUNCT = str.maketrans('', '', '.,!?')
+_CHANNEL_PUNCT = str.maketrans('', '', ' .,')
+
+# Stop words chung (fallback tags) và bộ chặt hơn cho việc lọc tags (frozenset để check O(1))
+_GENERIC_STOPWORDS = frozenset({'with', 'and', 'the', 'for', 'of', 'in', 'to', 'a', 'an', 'is', 'are', 'was', 'were'})
+_STRICT_STOPWORDS = _GENERIC_STOPWORDS | frozenset({
+    'youtube', 'video', 'content', 'amazing', 'subscribe', 'like', 'share', 'comment',
+    'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
+    'could', 'should', 'may', 'might', 'must', 'can', 'tag', 'tags', 'watch', 'now'
+})
+
+# Tags phổ biến dùng để bổ sung khi tạo fallback tags
+_RELAXATION_TAGS = (
+    "music", "relax", "healingmusic", "piano", "watersounds",
+    "relaxingcalming", "helios4k", "sleepmusic", "innerpeace",
+    "relaxingmusic", "meditation", "mindfulness", "peaceful",
+    "nature", "ambient", "calming", "soothing", "zen", "spa"
+)
+
+# Các approach khác nhau cho mỗi content variation, hậu tố context dựng sẵn
+_APPROACH_SUFFIXES: Dict[str, str] = {
+    approach: f" | Style: {approach} | Make content unique and different"
+    for approach in (
+        "detailed_analysis",    # Phân tích chi tiết
+        "quick_guide",          # Hướng dẫn nhanh
+        "beginner_tips",        # Tips cho người mới
+        "advanced_insights",    # Góc nhìn nâng cao
+        "practical_tutorial",   # Tutorial thực hành
+    )
+}
+_APPROACH_KEYS = tuple(_APPROACH_SUFFIXES)
+
+# Title + thumbnail text theo format của system prompt title generator
+_TITLE_THUMB_RE = re.compile(
+    r'\*\*OPTIMIZED TITLE:\*\*[ \t]*\n?\s*(?P<title>[^\n]+).*?\*\*THUMBNAIL TEXT:\*\*[ \t]*\n?\s*(?P<thumb>[^\n]+)',
+    re.DOTALL
+)
+
+# Xoá toàn bộ dấu câu (kể cả '-') và mọi khoảng trắng ASCII (space, tab, xuống dòng)
+# để tag thành một từ ghép - không cần strip() sau đó
+_TAG_STRIP_TABLE = str.maketrans('', '', string.punctuation + string.whitespace)
+
+# Gemini chỉ tạo cachedContent khi nội dung đủ số token tối thiểu (4096 với dòng Flash);
+# ước lượng ~4 ký tự/token để khỏi gửi request tạo cache chắc chắn bị từ chối (400)
+_GEMINI_CACHE_MIN_TOKENS = 4096
+_GEMINI_CACHE_MIN_CHARS = _GEMINI_CACHE_MIN_TOKENS * 4
+
+# Lỗi mạng tạm thời của Gemini đáng để retry
+_GEMINI_TRANSIENT_ERRORS = (httpx.TimeoutException, httpx.RemoteProtocolError)
+
+
+class GeminiAPIError(Exception):
+    """Gemini trả về HTTP status khác 200"""
+    
+    def __init__(self, status_code: int):
+        super().__init__(f"Gemini API error: {status_code}")
+        self.status_code = status_code
+
+
+def _clean_tag(tag: str) -> str:
+    """
+    Chuẩn hoá một tag về dạng một từ ghép: bỏ số thứ tự/bullet ở đầu, rồi xoá mọi dấu câu
+    và khoảng trắng trong một lượt translate (dấu câu ở cuối cũng bị xoá luôn)
+    """
+    return _CLEAN_LEAD_RE.sub('', tag.lower()).translate(_TAG_STRIP_TABLE)
+
+
+def _extend_unique_tokens(out: List[str], seen: set, text: str, stopwords: frozenset) -> None:
+    """
+    Thêm các từ (lowercase, bỏ dấu câu một lượt cho cả chuỗi) dài hơn 2 ký tự,
+    không phải stop word và chưa có trong `seen` vào cuối `out`
+    """
+    for word in text.lower().translate(_FALLBACK_PUNCT).split():
+        if len(word) > 2 and word not in stopwords and word not in seen:
+            seen.add(word)
+            out.append(word)
+
+
+def _first_word(text: str) -> str:
+    """Từ đầu tiên (lowercase) - partition không tạo list toàn bộ các từ như split()"""
+    return text.lstrip().partition(' ')[0].lower()
+
+
+def _extract_tag_list(tags_data: Any) -> Optional[List[str]]:
+    """Lấy list tags từ JSON đã parse: list, {"tags": [...]} hoặc list đầu tiên trong dict"""
+    if isinstance(tags_data, list):
+        return tags_data
+    if isinstance(tags_data, dict):
+        if 'tags' in tags_data:
+            return tags_data['tags']
+        for value in tags_data.values():
+            if isinstance(value, list):
+                return value
+    return None
+
+
+class _AsyncRateLimiter:
+    """Token bucket đơn giản: tối đa `rate` lần acquire trong mỗi `period` giây"""
+    
+    def __init__(self, rate: int, period: float):
+        self.rate = rate
+        self.period = period
+        self._tokens = float(rate)
+        self._updated_at = time.monotonic()
+    
+    async def acquire(self):
+        # Nạp token và giữ chỗ không có await xen giữa nên không cần lock; token âm là số lượt
+        # đã giữ chỗ trước, mỗi caller tự ngủ đến lượt của mình thay vì xếp hàng sau người đang ngủ
+        now = time.monotonic()
+        self._tokens = min(self.rate, self._tokens + (now - self._updated_at) * self.rate / self.period)
+        self._updated_at = now
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return
+        try:
+            await asyncio.sleep(-self._tokens * self.period / self.rate)
+        except asyncio.CancelledError:
+            # Trả lại lượt đã giữ cho các caller sau
+            self._tokens += 1
+            raise
+
 
 class AIContentGenerator:
     """
@@ -29,7 +166,9 @@ class AIContentGenerator:
     def __init__(self):
         # Cấu hình Gemini API (ưu tiên)
         self.gemini_api_key = settings.gemini_api_key
-        self.gemini_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
+        self.gemini_base_url = "https://generativelanguage.googleapis.com"
+        self.gemini_model = "models/gemini-2.0-flash"
+        self.gemini_stream_path = f"/v1beta/{self.gemini_model}:streamGenerateContent"
         self.use_gemini = bool(self.gemini_api_key and self.gemini_api_key != "your-gemini-api-key")
         
         if self.use_gemini:
@@ -37,23 +176,98 @@ class AIContentGenerator:
         else:
             logger.warning("Gemini API key không khả dụng, sử dụng OpenAI")
         
-        # Cấu hình OpenAI (dự phòng)
-        http_client = httpx.AsyncClient()
-        self.openai_client = openai.AsyncOpenAI(api_key=settings.openai_api_key, http_client=http_client)
+        # Client HTTP dùng chung cho Gemini/OpenAI, tạo lười ở lần dùng đầu (và lại sau aclose)
+        self._gemini_http_client: Optional[httpx.AsyncClient] = None
+        self._openai_client = None
+        
+        # Gemini context caching: hash(stable_prefix) -> (cache name hoặc None nếu tạo lỗi, hết hạn lúc)
+        self._gemini_cache_ttl = 3600
+        self._gemini_cache_failure_ttl = 60  # Lỗi tạm thời chỉ nhớ ngắn rồi thử tạo lại
+        self._gemini_cached_contents: Dict[str, Tuple[Optional[str], float]] = {}
+        self._gemini_cache_locks: Dict[str, asyncio.Lock] = {}  # Mỗi prefix chỉ một request tạo cache
+        self._gemini_uncacheable_prefixes: set = set()  # Prefix quá ngắn để cache (đã log một lần)
         
         self.config = WorkflowConfig()
         self.prompt_manager = prompt_manager
+        self._rate_limiter = _AsyncRateLimiter(settings.ai_requests_per_minute, 60.0)
+        
+        # Cache response theo prompt trùng khớp hoàn toàn: hash -> (text, hết hạn lúc)
+        self._response_cache: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._response_cache_maxsize = 10_000
+        self._response_cache_ttl = 86400
+        self._response_cache_max_temperature = 0.85
         
         # Title diversity tracking để tránh repetition
-        self.recent_title_starts = []  # Track recent starting words
         self.max_diversity_history = 20  # Remember last 20 titles
+        self.recent_title_starts = deque(maxlen=self.max_diversity_history)  # Track recent starting words ([word] mỗi title)
+        self._title_start_counter = Counter()  # Đếm tăng dần, không phải quét lại history
+        self._title_retry_count = 0  # Số lần phải gọi lại LLM vì title trùng từ mở đầu
         
         # Tag diversity tracking để tránh repetition
-        self.recent_tag_patterns = []  # Track recent tag patterns
         self.max_tag_diversity_history = 15  # Remember last 15 tag sets
+        self.recent_tag_patterns = deque(maxlen=self.max_tag_diversity_history)  # Track recent tag patterns
+        self.recent_full_tags = deque(maxlen=self.max_tag_diversity_history)
+        self._tag_pattern_counter = Counter()
+        self._full_tag_counter = Counter()
+    
+    async def _get_gemini_cached_content(self, stable_prefix: str) -> Optional[str]:
+        """
+        Lấy (hoặc tạo) cachedContent cho phần prompt cố định.
+        Trả về None nếu prefix quá ngắn để cache hoặc Gemini không tạo được cache
+        (lỗi chỉ được nhớ _gemini_cache_failure_ttl giây rồi thử tạo lại).
+        """
+        key = hashlib.sha256(stable_prefix.encode("utf-8")).hexdigest()
+        
+        if len(stable_prefix) < _GEMINI_CACHE_MIN_CHARS:
+            if key not in self._gemini_uncacheable_prefixes:
+                self._gemini_uncacheable_prefixes.add(key)
+                logger.info(
+                    f"Prompt prefix ~{len(stable_prefix) // 4} tokens, dưới mức tối thiểu "
+                    f"{_GEMINI_CACHE_MIN_TOKENS} tokens của Gemini context caching - gửi prompt đầy đủ"
+                )
+            return None
+        
+        cached = self._gemini_cached_contents.get(key)
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+        
+        # Các request đồng thời cùng prefix chờ một lần tạo cache thay vì tạo trùng
+        lock = self._gemini_cache_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            now = time.monotonic()
+            cached = self._gemini_cached_contents.get(key)
+            if cached and cached[1] > now:
+                return cached[0]
+            
+            cache_name = None
+            ttl = self._gemini_cache_failure_ttl
+            try:
+                response = await self._gemini_http.post(
+                    f"/v1beta/cachedContents?key={self.gemini_api_key}",
+                    content=orjson.dumps({
+                        "model": self.gemini_model,
+                        "contents": [{"role": "user", "parts": [{"text": stable_prefix}]}],
+                        "ttl": f"{self._gemini_cache_ttl}s"
+                    }),
+                    headers={"Content-Type": "application/json"}
+                )
+                if response.status_code == 200:
+                    cache_name = orjson.loads(response.content).get("name")
+                    # Hết hạn sớm hơn phía server một chút để không dùng cache đã bị xoá
+                    ttl = self._gemini_cache_ttl - 60
+                    logger.info(f"Đã tạo Gemini cached content: {cache_name}")
+                else:
+                    logger.warning(f"Không tạo được Gemini cached content: {response.status_code}")
+            except Exception as e:
+                logger.warning(f"Lỗi khi tạo Gemini cached content: {str(e)}")
+            
+            self._gemini_cached_contents[key] = (cache_name, now + ttl)
+            return cache_name
     
-    async def _generate_with_gemini(self, prompt: str, temperature: float = 0.8) -> str:
-        """Tạo nội dung bằng Gemini REST API"""
+    async def _generate_with_gemini(self, prompt: str, temperature: float = 0.8,
+                                    stable_prefix: Optional[str] = None,
+                                    first_chunk: Optional[asyncio.Event] = None) -> str:
+        """Tạo nội dung bằng Gemini REST API (first_chunk được set khi nhận được đoạn text đầu tiên)"""
         try:
             payload = {
                 "contents": [{
@@ -67,29 +281,94 @@ class AIContentGenerator:
                 }
             }
             
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f"{self.gemini_url}?key={self.gemini_api_key}",
-                    json=payload,
-                    headers={"Content-Type": "application/json"},
-                    timeout=30.0
-                )
-                
+            # Chỉ gửi phần prompt thay đổi nếu phần cố định đã được cache phía Gemini
+            if stable_prefix and prompt.startswith(stable_prefix):
+                cache_name = await self._get_gemini_cached_content(stable_prefix)
+                if cache_name:
+                    payload["cachedContent"] = cache_name
+                    payload["contents"][0]["parts"][0]["text"] = prompt[len(stable_prefix):].lstrip()
+            
+            # Stream SSE: nhận và decode từng chunk trong lúc model vẫn đang sinh nội dung
+            # (orjson encode/decode nhanh hơn json stdlib)
+            parts = []
+            async with self._gemini_http.stream(
+                "POST",
+                f"{self.gemini_stream_path}?alt=sse&key={self.gemini_api_key}",
+                content=orjson.dumps(payload),
+                headers={"Content-Type": "application/json"}
+            ) as response:
                 if response.status_code != 200:
-                    raise Exception(f"Gemini API error: {response.status_code} - {response.text}")
+                    # Chỉ đọc body khi thực sự cần log ở mức DEBUG
+                    if logger.isEnabledFor(logging.DEBUG):
+                        await response.aread()
+                        logger.debug(f"Gemini error body: {response.text}")
+                    raise GeminiAPIError(response.status_code)
                 
-                result = response.json()
-                
-                if "candidates" not in result or not result["candidates"]:
-                    raise Exception("Gemini không trả về candidates")
-                
-                content = result["candidates"][0]["content"]["parts"][0]["text"]
-                return content.strip()
+                async for line in response.aiter_lines():
+                    if not line.startswith("data: "):
+                        continue
+                    
+                    chunk = orjson.loads(line[6:])
+                    for candidate in chunk.get("candidates", [])[:1]:
+                        for part in candidate.get("content", {}).get("parts", []):
+                            if "text" in part:
+                                parts.append(part["text"])
+                                if first_chunk is not None:
+                                    first_chunk.set()
+            
+            if not parts:
+                raise Exception("Gemini không trả về candidates")
+            
+            return "".join(parts).strip()
                 
         except Exception as e:
             logger.error(f"Lỗi Gemini API: {str(e)}")
             raise
     
+    @property
+    def _gemini_http(self) -> httpx.AsyncClient:
+        """
+        Client HTTP dùng chung cho Gemini - giữ kết nối keep-alive giữa các request,
+        HTTP/2 để các request song song (description + tags) dùng chung một kết nối TLS
+        """
+        if self._gemini_http_client is None or self._gemini_http_client.is_closed:
+            self._gemini_http_client = httpx.AsyncClient(
+                base_url=self.gemini_base_url,
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=60.0),
+                timeout=httpx.Timeout(connect=3.0, read=30.0, write=5.0, pool=5.0)
+            )
+        return self._gemini_http_client
+    
+    @property
+    def openai_client(self):
+        """Client OpenAI (dự phòng)"""
+        if self._openai_client is None:
+            openai_http = httpx.AsyncClient(
+                http2=True,
+                limits=httpx.Limits(max_keepalive_connections=20, max_connections=100, keepalive_expiry=60.0)
+            )
+            self._openai_client = openai.AsyncOpenAI(api_key=settings.openai_api_key, http_client=openai_http)
+        return self._openai_client
+    
+    async def aclose(self):
+        """
+        Đóng các HTTP client dùng chung (gọi khi app shutdown). Instance vẫn dùng được sau đó:
+        client được tạo lại ở lần dùng tiếp theo (ví dụ lifespan mới của test client hoặc reload)
+        """
+        gemini_http, self._gemini_http_client = self._gemini_http_client, None
+        openai_client, self._openai_client = self._openai_client, None
+        if gemini_http is not None:
+            await gemini_http.aclose()
+        if openai_client is not None:
+            await openai_client.close()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.aclose()
+    
     async def _generate_with_openai(self, prompt: str, temperature: float = 0.8) -> str:
         """Tạo nội dung bằng OpenAI API (dự phòng)"""
         try:
@@ -105,19 +384,140 @@ class AIContentGenerator:
             logger.error(f"Lỗi OpenAI API: {str(e)}")
             raise
     
-    async def _generate_content(self, prompt: str, temperature: float = 0.8) -> str:
-        """Tạo nội dung với AI (ưu tiên Gemini, dự phòng OpenAI)"""
+    async def _generate_content(self, prompt: str, temperature: float = 0.8,
+                                stable_prefix: Optional[str] = None) -> str:
+        """
+        Tạo nội dung với AI (ưu tiên Gemini, dự phòng OpenAI).
+        stable_prefix: phần đầu cố định của prompt (persona + system prompt) để Gemini cache lại
+        """
+        # Temperature cao là cố ý muốn output khác nhau mỗi lần nên không cache
+        cache_key = None
+        if temperature <= self._response_cache_max_temperature:
+            cache_key = hashlib.sha256(f"{temperature}\x00{prompt}".encode("utf-8")).hexdigest()
+            cached = self._get_cached_response(cache_key)
+            if cached is not None:
+                logger.info("Dùng response đã cache cho prompt trùng khớp")
+                return cached
+        
+        # Giữ số request/phút dưới quota của provider khi chạy batch
+        await self._rate_limiter.acquire()
+        
         if self.use_gemini:
-            try:
-                logger.info("Sử dụng Gemini API để tạo nội dung")
-                return await self._generate_with_gemini(prompt, temperature)
-            except Exception as e:
-                logger.warning(f"Gemini API lỗi, chuyển sang OpenAI: {str(e)}")
-                return await self._generate_with_openai(prompt, temperature)
+            logger.info("Sử dụng Gemini API để tạo nội dung")
+            response_text = await self._call_with_fallback(prompt, temperature, stable_prefix)
         else:
             logger.info("Sử dụng OpenAI API để tạo nội dung")
-            return await self._generate_with_openai(prompt, temperature)
+            response_text = await self._generate_with_openai(prompt, temperature)
+        
+        if cache_key and response_text:
+            self._store_cached_response(cache_key, response_text)
+        return response_text
+    
+    def _get_cached_response(self, cache_key: str) -> Optional[str]:
+        """Lấy response đã cache nếu còn hạn"""
+        cached = self._response_cache.get(cache_key)
+        if not cached:
+            return None
+        
+        response_text, expires_at = cached
+        if expires_at <= time.monotonic():
+            del self._response_cache[cache_key]
+            return None
+        
+        self._response_cache.move_to_end(cache_key)
+        return response_text
+    
+    def _store_cached_response(self, cache_key: str, response_text: str):
+        """Lưu response vào cache LRU có TTL"""
+        self._response_cache[cache_key] = (response_text, time.monotonic() + self._response_cache_ttl)
+        self._response_cache.move_to_end(cache_key)
+        while len(self._response_cache) > self._response_cache_maxsize:
+            self._response_cache.popitem(last=False)
+    
+    async def _generate_with_gemini_retry(self, prompt: str, temperature: float,
+                                          stable_prefix: Optional[str] = None,
+                                          first_chunk: Optional[asyncio.Event] = None,
+                                          hedge_started: Optional[asyncio.Event] = None) -> str:
+        """
+        Gọi Gemini, retry với exponential backoff khi gặp lỗi tạm thời (timeout, 429, 503).
+        Không retry nữa khi hedge_started đã set (OpenAI đang chạy song song).
+        """
+        max_attempts = self.config.gemini_max_attempts
+        for attempt in range(max_attempts):
+            try:
+                return await self._generate_with_gemini(prompt, temperature, stable_prefix, first_chunk)
+            except _GEMINI_TRANSIENT_ERRORS as e:
+                error, reason = e, str(e)
+            except GeminiAPIError as e:
+                if e.status_code not in (429, 503):
+                    raise
+                error, reason = e, e.status_code
+            
+            if attempt == max_attempts - 1 or (hedge_started is not None and hedge_started.is_set()):
+                raise error
+            logger.warning(f"Gemini lỗi tạm thời ({reason}), thử lại (attempt {attempt + 1})")
+            await asyncio.sleep(min(0.5 * (2 ** attempt), 2.0))
+            if hedge_started is not None and hedge_started.is_set():
+                raise error
+    
+    async def _call_with_fallback(self, prompt: str, temperature: float = 0.8,
+                                  stable_prefix: Optional[str] = None) -> str:
+        """
+        Gọi Gemini với soft timeout cho chunk đầu tiên của stream. Chưa nhận được chunk nào sau soft timeout
+        thì gửi song song (hedge) sang OpenAI và lấy kết quả nào về trước; Gemini đã bắt đầu stream thì
+        chờ stream xong (response dài không bị hedge). Gemini lỗi hẳn thì chuyển sang OpenAI như trước.
+        """
+        first_chunk = asyncio.Event()
+        hedge_started = asyncio.Event()
+        gemini_task = asyncio.create_task(
+            self._generate_with_gemini_retry(prompt, temperature, stable_prefix, first_chunk, hedge_started)
+        )
+        first_chunk_task = asyncio.create_task(first_chunk.wait())
+        openai_task = None
+        
+        try:
+            done, _ = await asyncio.wait(
+                {gemini_task, first_chunk_task},
+                timeout=self.config.gemini_soft_timeout,
+                return_when=asyncio.FIRST_COMPLETED
+            )
+            
+            if done:
+                try:
+                    return await gemini_task
+                except Exception as e:
+                    logger.warning(f"Gemini API lỗi, chuyển sang OpenAI: {str(e)}")
+                    return await self._generate_with_openai(prompt, temperature)
+            
+            logger.warning(f"Gemini chưa trả về chunk nào sau {self.config.gemini_soft_timeout}s, gửi song song sang OpenAI")
+            hedge_started.set()
+            openai_task = asyncio.create_task(self._generate_with_openai(prompt, temperature))
+            last_error = None
+            
+            for next_done in asyncio.as_completed([gemini_task, openai_task]):
+                try:
+                    return await next_done
+                except Exception as e:
+                    last_error = e
+            raise last_error
+        finally:
+            # Huỷ request còn lại khi đã có kết quả hoặc khi chính caller bị huỷ, và chờ chúng dừng hẳn
+            pending = [
+                task for task in (gemini_task, first_chunk_task, openai_task)
+                if task is not None and not task.done()
+            ]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
 
+    def _stable_prefix(self, persona: str, prompt_name: str) -> Optional[str]:
+        """Phần prompt không đổi giữa các request: persona + system prompt gốc"""
+        system_prompt = self.prompt_manager.get_system_prompt(prompt_name)
+        if not system_prompt:
+            return None
+        return f"{persona}\n\n{system_prompt}"
+    
     def _create_content_generation_prompt(self, input_data: InputData) -> str:
         """Tạo prompt để generate nội dung - legacy method, giữ lại cho compatibility"""
         return self.prompt_manager.get_integrated_content_prompt(
@@ -127,46 +527,54 @@ class AIContentGenerator:
             additional_context=input_data.additional_context or ""
         )
     
+    @staticmethod
+    def _push_with_counter(history: deque, counter: Counter, items: List[str]):
+        """Thêm một tập items vào history có maxlen, cập nhật counter cho phần bị đẩy ra"""
+        if len(history) == history.maxlen:
+            counter.subtract(history[0])
+            # Bỏ các key về 0 để most_common() không trả về pattern đã hết hạn
+            for item in set(history[0]):
+                if counter[item] <= 0:
+                    del counter[item]
+        history.append(items)
+        counter.update(items)
+    
     def _track_title_diversity(self, title: str):
         """Track title starting words to ensure diversity"""
         if title:
-            first_word = title.split()[0].lower() if title.split() else ""
+            first_word = _first_word(title)
             if first_word:
-                self.recent_title_starts.append(first_word)
-                # Giữ chỉ N titles gần nhất
-                if len(self.recent_title_starts) > self.max_diversity_history:
-                    self.recent_title_starts.pop(0)
+                # Giữ chỉ N titles gần nhất, counter được cập nhật tăng dần như tag history
+                self._push_with_counter(self.recent_title_starts, self._title_start_counter, [first_word])
     
     def _is_title_diverse(self, title: str) -> bool:
         """Check if title is diverse enough compared to recent titles"""
         if not title or not self.recent_title_starts:
             return True
             
-        first_word = title.split()[0].lower() if title.split() else ""
+        first_word = _first_word(title)
         if not first_word:
             return True
             
         # Count occurrences of this first word in recent history
-        recent_count = self.recent_title_starts.count(first_word)
-        
-        # Allow max 2 times same starting word in last 20 titles (10% repetition)
-        max_allowed = max(1, self.max_diversity_history // 10)
+        recent_count = self._title_start_counter[first_word]
         
-        return recent_count < max_allowed
+        return recent_count < self._max_title_start_repeats()
+    
+    def _max_title_start_repeats(self) -> int:
+        """Allow max 2 times same starting word in last 20 titles (10% repetition)"""
+        return max(1, self.max_diversity_history // 10)
     
     def _get_diversity_instruction(self) -> str:
         """Generate instruction to avoid repetitive starting words"""
         if len(self.recent_title_starts) < 3:
             return ""
             
-        # Get most common starting words
-        from collections import Counter
-        common_starts = Counter(self.recent_title_starts).most_common(5)
-        
-        if common_starts:
-            avoid_words = [word for word, count in common_starts if count > 1]
-            if avoid_words:
-                return f"\n\n🚨 DIVERSITY REQUIREMENT: DO NOT start the title with these overused words: {', '.join(avoid_words)}. Use creative, fresh starting words to ensure variety!"
+        # Liệt kê đủ các từ mở đầu mà _is_title_diverse sẽ từ chối để lần gọi đầu đã tránh được
+        limit = self._max_title_start_repeats()
+        avoid_words = [word for word, count in self._title_start_counter.most_common() if count >= limit]
+        if avoid_words:
+            return f"\n\n🚨 DIVERSITY REQUIREMENT: DO NOT start the title with these overused words: {', '.join(avoid_words)}. Use creative, fresh starting words to ensure variety!"
         
         return ""
 
@@ -180,7 +588,7 @@ class AIContentGenerator:
             for tag in tags:
                 if tag:
                     # Track first word patterns
-                    first_word = tag.split()[0].lower() if tag.split() else ""
+                    first_word = _first_word(tag)
                     if first_word:
                         tag_patterns.append(first_word)
                     
@@ -189,21 +597,13 @@ class AIContentGenerator:
                     if full_tag:
                         full_tags.append(full_tag)
             
+            # Giữ chỉ N tag sets gần nhất, counter được cập nhật tăng dần
             if tag_patterns:
-                self.recent_tag_patterns.append(tag_patterns)
-                # Giữ chỉ N tag sets gần nhất
-                if len(self.recent_tag_patterns) > self.max_tag_diversity_history:
-                    self.recent_tag_patterns.pop(0)
+                self._push_with_counter(self.recent_tag_patterns, self._tag_pattern_counter, tag_patterns)
             
             # ENHANCED: Also track full tags for exact duplicate detection
             if full_tags:
-                if not hasattr(self, 'recent_full_tags'):
-                    self.recent_full_tags = []
-                
-                self.recent_full_tags.append(full_tags)
-                # Giữ chỉ N full tag sets gần nhất
-                if len(self.recent_full_tags) > self.max_tag_diversity_history:
-                    self.recent_full_tags.pop(0)
+                self._push_with_counter(self.recent_full_tags, self._full_tag_counter, full_tags)
     
     def _is_tags_diverse(self, tags: List[str]) -> bool:
         """Check if tags are diverse enough compared to recent tag sets"""
@@ -217,7 +617,7 @@ class AIContentGenerator:
         for tag in tags:
             if tag:
                 # Track first word patterns
-                first_word = tag.split()[0].lower() if tag.split() else ""
+                first_word = _first_word(tag)
                 if first_word:
                     current_patterns.append(first_word)
                 
@@ -228,36 +628,16 @@ class AIContentGenerator:
         
         if not current_patterns and not current_full_tags:
             return True
-            
-        # Count how many patterns overlap with recent history
-        all_recent_patterns = []
-        all_recent_full_tags = []
         
-        for pattern_set in self.recent_tag_patterns:
-            all_recent_patterns.extend(pattern_set)
-            
-        # Also track full tags from recent history (if available)
-        if hasattr(self, 'recent_full_tags'):
-            for tag_set in self.recent_full_tags:
-                all_recent_full_tags.extend(tag_set)
-        
-        from collections import Counter
-        recent_counter = Counter(all_recent_patterns)
-        recent_full_counter = Counter(all_recent_full_tags)
-        
-        # Check if too many current patterns are overused
-        overused_count = 0
-        duplicate_full_tags = 0
+        recent_counter = self._tag_pattern_counter
+        recent_full_counter = self._full_tag_counter
         
         # Check first word patterns
-        for pattern in current_patterns:
-            if recent_counter.get(pattern, 0) >= 2:  # Reduced threshold from 3 to 2
-                overused_count += 1
+        overused_set = {pattern for pattern, count in recent_counter.items() if count >= 2}  # Reduced threshold from 3 to 2
+        overused_count = sum(1 for pattern in current_patterns if pattern in overused_set)
         
-        # Check full tag duplicates
-        for full_tag in current_full_tags:
-            if recent_full_counter.get(full_tag, 0) >= 1:  # No exact duplicates allowed
-                duplicate_full_tags += 1
+        # Check full tag duplicates - counter chỉ giữ key có count >= 1 nên so khớp key là đủ
+        duplicate_full_tags = sum(1 for full_tag in current_full_tags if full_tag in recent_full_counter)
         
         # ENHANCED: More strict diversity requirements
         # Allow max 20% overlap with overused patterns (reduced from 30%)
@@ -281,20 +661,8 @@ class AIContentGenerator:
             return ""
             
         # Get most common tag patterns
-        all_recent_patterns = []
-        all_recent_full_tags = []
-        
-        for pattern_set in self.recent_tag_patterns:
-            all_recent_patterns.extend(pattern_set)
-            
-        # Also get full tags if available
-        if hasattr(self, 'recent_full_tags'):
-            for tag_set in self.recent_full_tags:
-                all_recent_full_tags.extend(tag_set)
-        
-        from collections import Counter
-        common_patterns = Counter(all_recent_patterns).most_common(10)
-        common_full_tags = Counter(all_recent_full_tags).most_common(10)
+        common_patterns = self._tag_pattern_counter.most_common(10)
+        common_full_tags = self._full_tag_counter.most_common(10)
         
         instruction_parts = []
         
@@ -326,23 +694,23 @@ class AIContentGenerator:
         """
         max_attempts = 3  # Try up to 3 times for diverse title
         
+        image_context = ""
+        if image_base64:
+            image_context = "Image provided for analysis"
+        
+        # Sử dụng system prompt chuyên biệt cho title - không đổi giữa các attempt nên chỉ render một lần
+        base_title_prompt = self.prompt_manager.render_title_prompt(
+            channel_name=input_data.channel_name,
+            channel_description=input_data.channel_description,
+            video_topic=input_data.video_topic or "Tạo nội dung phù hợp với kênh",
+            image_context=image_context
+        )
+        
         for attempt in range(max_attempts):
             try:
-                image_context = ""
-                if image_base64:
-                    image_context = "Image provided for analysis"
-                
-                # Sử dụng system prompt chuyên biệt cho title
-                title_prompt = self.prompt_manager.get_title_generation_prompt(
-                    channel_name=input_data.channel_name,
-                    channel_description=input_data.channel_description,
-                    video_topic=input_data.video_topic or "Tạo nội dung phù hợp với kênh",
-                    image_context=image_context
-                )
-                
                 # Thêm diversity instruction để tránh repetition
                 diversity_instruction = self._get_diversity_instruction()
-                title_prompt += diversity_instruction
+                title_prompt = base_title_prompt + diversity_instruction
                 
                 # Xây dựng message payload
                 user_content = [{"type": "text", "text": title_prompt}]
@@ -368,29 +736,21 @@ class AIContentGenerator:
                 full_prompt = f"{messages[0]['content']}\n\n{title_prompt}"
                 if image_base64:
                     full_prompt = f"[Ảnh được cung cấp để phân tích]\n\n{full_prompt}"
+                stable_prefix = self._stable_prefix(messages[0]['content'], 'title_generator')
                 
                 # Tăng temperature cho title generation để tăng creativity
                 creative_temp = 0.9 + (attempt * 0.05)  # Increase temp with each attempt
-                response_text = await self._generate_content(full_prompt, temperature=creative_temp)
+                response_text = await self._generate_content(full_prompt, temperature=creative_temp,
+                                                             stable_prefix=stable_prefix)
                 
-                # Parse response để lấy title và thumbnail text
+                # Parse response để lấy title và thumbnail text (cùng dòng hoặc dòng tiếp theo)
                 title = ""
                 thumbnail_text = ""
                 
-                lines = response_text.split('\n')
-                for i, line in enumerate(lines):
-                    if "**OPTIMIZED TITLE:**" in line:
-                        # Lấy title từ dòng tiếp theo hoặc cùng dòng
-                        if i + 1 < len(lines):
-                            title = lines[i + 1].strip()
-                        else:
-                            title = line.split("**OPTIMIZED TITLE:**")[-1].strip()
-                    elif "**THUMBNAIL TEXT:**" in line:
-                        # Lấy thumbnail text từ dòng tiếp theo hoặc cùng dòng
-                        if i + 1 < len(lines):
-                            thumbnail_text = lines[i + 1].strip()
-                        else:
-                            thumbnail_text = line.split("**THUMBNAIL TEXT:**")[-1].strip()
+                match = _TITLE_THUMB_RE.search(response_text)
+                if match:
+                    title = match.group('title').strip()
+                    thumbnail_text = match.group('thumb').strip()
                 
                 # Fallback parsing nếu format không chuẩn
                 if not title:
@@ -414,7 +774,9 @@ class AIContentGenerator:
                         "thumbnail_text": thumbnail_text
                     }
                 else:
-                    logger.warning(f"Title not diverse enough (attempt {attempt + 1}): {title}")
+                    self._title_retry_count += 1
+                    logger.warning(f"Title not diverse enough (attempt {attempt + 1}): {title} "
+                                   f"(tổng số lần retry title: {self._title_retry_count})")
                     if attempt < max_attempts - 1:
                         continue  # Try again with higher temperature
                 
@@ -442,21 +804,26 @@ class AIContentGenerator:
             
             # Bước 1: Tạo title và thumbnail text với system prompt chuyên biệt và diversity checking
             title_data = await self._generate_title_and_thumbnail(input_data, image_base64)
+            title = title_data["title"]
             
-            # Bước 2: Tạo description với system prompt chuyên biệt
-            description = await self._generate_description(title_data["title"], input_data)
+            # Bước 3+4: Tags chỉ cần title + channel context, image prompts nối tiếp ngay sau tags
+            async def tags_and_image_prompts():
+                tags = await self._generate_tags(title, "", input_data)
+                return tags, await self._generate_image_prompts(title, tags[:4])
             
-            # Bước 3: Tạo tags (có thể sử dụng system prompt riêng nếu có)
-            tags = await self._generate_tags(title_data["title"], description, input_data)
-            
-            # Bước 4: Tạo image prompts với Midjourney generator
-            image_prompts = await self._generate_image_prompts(title_data["title"], tags[:4])
+            # Bước 2 (description, lâu nhất) chạy song song với nhánh tags -> image prompts
+            async with asyncio.TaskGroup() as tg:
+                description_task = tg.create_task(self._generate_description(title, input_data))
+                tags_task = tg.create_task(tags_and_image_prompts())
+            description = description_task.result()
+            tags, image_prompts = tags_task.result()
             
             # Tạo GeneratedContent object
+            cfg = self.config
             generated_content = GeneratedContent(
-                title=title_data["title"][:self.config.max_title_length],
-                description=description[:self.config.max_description_length],
-                tags=tags[:self.config.number_of_tags],
+                title=title_data["title"][:cfg.max_title_length],
+                description=description[:cfg.max_description_length],
+                tags=tags[:cfg.number_of_tags],
                 thumbnail_name=title_data["thumbnail_text"],
                 image_prompts=image_prompts
             )
@@ -476,7 +843,7 @@ class AIContentGenerator:
         try:
             channel_context = f"{input_data.channel_name} - {input_data.channel_description}"
             
-            description_prompt = self.prompt_manager.get_description_generation_prompt(
+            description_prompt = self.prompt_manager.render_description_prompt(
                 title=title,
                 channel_context=channel_context
             )
@@ -491,7 +858,8 @@ class AIContentGenerator:
             
             # Tạo prompt đầy đủ cho Gemini/OpenAI
             full_prompt = f"{messages[0]['content']}\n\n{description_prompt}"
-            description = await self._generate_content(full_prompt)
+            stable_prefix = self._stable_prefix(messages[0]['content'], 'description_generator')
+            description = await self._generate_content(full_prompt, stable_prefix=stable_prefix)
             logger.info(f"Generated description length: {len(description)} characters")
             
             return description
@@ -518,26 +886,29 @@ Subscribe for more amazing videos!
         """
         max_attempts = 3  # Try up to 3 times for diverse tags
         
+        channel_context = f"{input_data.channel_name} - {input_data.channel_description}"
+        
+        # Sử dụng system prompt chuyên biệt cho tags - render một lần cho mọi attempt
+        base_tags_prompt = self.prompt_manager.render_tags_prompt(
+            title=title,
+            description=description,
+            channel_context=channel_context
+        )
+        
         for attempt in range(max_attempts):
             try:
-                channel_context = f"{input_data.channel_name} - {input_data.channel_description}"
-                
-                # Sử dụng system prompt chuyên biệt cho tags
-                tags_prompt = self.prompt_manager.get_tags_generation_prompt(
-                    title=title,
-                    description=description,
-                    channel_context=channel_context
-                )
-                
                 # Thêm diversity instruction để tránh repetition
                 diversity_instruction = self._get_tag_diversity_instruction()
-                tags_prompt += diversity_instruction
+                tags_prompt = base_tags_prompt + diversity_instruction
                 
                 # Tăng temperature cho attempts sau để tăng creativity
                 temperature = 0.9 + (attempt * 0.05)
                 
                 # Tạo nội dung với temperature cao hơn cho tags
-                tags_response = await self._generate_content(tags_prompt, temperature)
+                tags_response = await self._generate_content(
+                    tags_prompt, temperature,
+                    stable_prefix=self.prompt_manager.get_system_prompt('tags_generator')
+                )
                 
                 # Parse JSON response với nhiều fallback methods
                 tags = self._parse_tags_response(tags_response)
@@ -577,39 +948,29 @@ Subscribe for more amazing videos!
     def _parse_tags_response(self, tags_response: str) -> List[str]:
         """Parse tags from AI response with multiple fallback methods"""
         try:
-            # Method 1: Direct JSON parsing
-            tags_data = json.loads(tags_response)
-            
-            if isinstance(tags_data, list):
-                return tags_data
-            elif isinstance(tags_data, dict) and 'tags' in tags_data:
-                return tags_data['tags']
-            else:
-                # Try to get first list value
-                for value in tags_data.values():
-                    if isinstance(value, list):
-                        return value
-                        
-        except json.JSONDecodeError:
+            # Method 1: Direct JSON parsing (trường hợp phổ biến - trả về ngay, không chạy regex)
+            tags = _extract_tag_list(orjson.loads(tags_response))
+            if tags is not None:
+                return tags
+        except orjson.JSONDecodeError:
             pass
         
         # Method 2: Extract JSON array from text
-        import re
-        json_match = re.search(r'\{[^}]*"tags":\s*\[([^\]]+)\][^}]*\}', tags_response, re.DOTALL)
+        json_match = _TAG_JSON_RE.search(tags_response)
         if json_match:
             try:
                 json_str = json_match.group(0)
-                tags_data = json.loads(json_str)
+                tags_data = orjson.loads(json_str)
                 return tags_data.get('tags', [])
             except:
                 pass
         
         # Method 3: Extract array from text
-        array_match = re.search(r'\[([^\]]+)\]', tags_response, re.DOTALL)
+        array_match = _TAG_ARRAY_RE.search(tags_response)
         if array_match:
             try:
                 array_str = f"[{array_match.group(1)}]"
-                return json.loads(array_str)
+                return orjson.loads(array_str)
             except:
                 pass
         
@@ -619,81 +980,39 @@ Subscribe for more amazing videos!
         for line in lines:
             line = line.strip()
             if line and not line.startswith('#') and not line.startswith('*'):
-                # Remove quotes and extra characters
-                clean_line = re.sub(r'^["\'\-\*\d\.\s]+', '', line)
-                clean_line = re.sub(r'["\'\,\.\s]*$', '', clean_line)  # Also remove periods
-                
-                # ENHANCED: Remove ALL periods and punctuation throughout the line
-                clean_line = re.sub(r'[\.]+', '', clean_line)  # Remove all periods
-                clean_line = re.sub(r'[,]+', '', clean_line)   # Remove all commas
-                
-                # Remove other punctuation except hyphens and spaces
-                import string
-                clean_line = ''.join(char for char in clean_line if char not in string.punctuation or char in ['-', ' '])
-                
-                # CRITICAL: Convert to single word format like YouTube expects
-                # Remove spaces and hyphens to create compound words
-                clean_line = clean_line.replace(' ', '').replace('-', '')
-                clean_line = clean_line.strip()
+                # Remove leading quotes/bullets/numbering, then ALL punctuation and spaces
+                # (single word format like YouTube expects; trailing junk goes with it)
+                clean_line = _LEADING_JUNK_RE.sub('', line).translate(_TAG_STRIP_TABLE)
                 
                 if clean_line and len(clean_line) > 2:
                     tags.append(clean_line)
+                    if len(tags) >= 15:
+                        break
         
         return tags[:15]  # Limit to 15 tags
     
     def _clean_and_validate_tags(self, tags: List[str]) -> List[str]:
         """Clean and validate tags - convert to single word format like YouTube expects"""
         cleaned_tags = []
+        seen_tags = set()
         
         for tag in tags:
             if not tag or not isinstance(tag, str):
                 continue
                 
-            # Clean tag - remove all punctuation and special characters
-            clean_tag = tag.strip().lower()
-            
-            # Remove leading numbers, bullets, quotes, hashes, etc.
-            clean_tag = re.sub(r'^[#\-\*\d\.\s"\'\(\)\[\]]+', '', clean_tag)
-            
-            # Remove trailing punctuation, quotes, commas, periods, etc.
-            clean_tag = re.sub(r'["\'\,\.\!\?\;\:\(\)\[\]\s]*$', '', clean_tag)
-            
-            # ENHANCED: Remove ALL punctuation marks throughout the tag
-            # Remove periods, commas, and all special characters
-            clean_tag = re.sub(r'[\.]+', '', clean_tag)  # Remove all periods
-            clean_tag = re.sub(r'[,]+', '', clean_tag)   # Remove all commas
-            clean_tag = re.sub(r'[!@#$%^&*()_+=\[\]{}|;:\'",.<>?/\\`~]+', '', clean_tag)  # Remove special chars
-            
-            # ENHANCED: Also remove any remaining punctuation that might be missed
-            import string
-            # Remove all punctuation except hyphens (which will be removed later)
-            clean_tag = ''.join(char for char in clean_tag if char not in string.punctuation or char in ['-', ' '])
+            clean_tag = _clean_tag(tag)
             
-            # CRITICAL: Convert multi-word tags to single compound words (YouTube format)
-            # Remove spaces and hyphens to create compound words
-            clean_tag = clean_tag.replace(' ', '').replace('-', '')
-            
-            # Remove any remaining whitespace
-            clean_tag = clean_tag.strip()
-            
-            # Additional validation with enhanced stop words list
-            stop_words = [
-                'youtube', 'video', 'content', 'amazing', 'subscribe', 'like', 'share', 'comment',
-                'with', 'and', 'the', 'for', 'of', 'in', 'to', 'a', 'an', 'is', 'are', 'was', 'were',
-                'be', 'been', 'being', 'have', 'has', 'had', 'do', 'does', 'did', 'will', 'would',
-                'could', 'should', 'may', 'might', 'must', 'can', 'tag', 'tags', 'watch', 'now'
-            ]
-            
-            # Validate the cleaned tag
-            if (clean_tag and 
-                len(clean_tag) >= 2 and 
-                len(clean_tag) <= 50 and
-                clean_tag not in cleaned_tags and
-                not clean_tag.startswith('tag') and
-                clean_tag not in stop_words and
-                not clean_tag.isdigit() and  # Exclude pure numbers
-                len(clean_tag) >= 2):  # Must have at least 2 characters
+            # Validate the cleaned tag: độ dài 2-50, không phải số thuần, không bắt đầu bằng 'tag'
+            if len(clean_tag) < 2 or len(clean_tag) > 50 or clean_tag.isdigit() or clean_tag.startswith('tag'):
+                continue
+            if clean_tag in _STRICT_STOPWORDS:
+                continue
+            # set song song để check trùng O(1)
+            if clean_tag not in seen_tags:
                 cleaned_tags.append(clean_tag)
+                seen_tags.add(clean_tag)
+                if len(cleaned_tags) >= 15:
+                    break
         
         return cleaned_tags[:15]  # Limit to 15 tags
     
@@ -703,49 +1022,31 @@ Subscribe for more amazing videos!
         
         # Add channel-based tags (remove spaces and punctuation)
         if input_data.channel_name:
-            channel_tag = input_data.channel_name.lower().replace(" ", "").replace(".", "").replace(",", "")
+            channel_tag = input_data.channel_name.lower().translate(_CHANNEL_PUNCT)
             if channel_tag and len(channel_tag) > 2:
                 fallback_tags.append(channel_tag)
         
-        # Add topic-based tags (single words only)
+        # Add topic-based + title-based tags (single words only)
+        seen = set(fallback_tags)
         if input_data.video_topic:
-            topic_words = input_data.video_topic.lower().split()
-            stop_words = ['with', 'and', 'the', 'for', 'of', 'in', 'to', 'a', 'an', 'is', 'are', 'was', 'were']
-            for word in topic_words:
-                # Clean word and remove punctuation
-                clean_word = word.replace(".", "").replace(",", "").replace("!", "").replace("?", "")
-                if len(clean_word) > 2 and clean_word not in fallback_tags and clean_word not in stop_words:
-                    fallback_tags.append(clean_word)
-        
-        # Add title-based tags (single words only)
+            _extend_unique_tokens(fallback_tags, seen, input_data.video_topic, _GENERIC_STOPWORDS)
         if title:
-            title_words = title.lower().split()
-            stop_words = ['with', 'and', 'the', 'for', 'of', 'in', 'to', 'a', 'an', 'is', 'are', 'was', 'were']
-            for word in title_words:
-                # Clean word and remove punctuation
-                clean_word = word.replace(".", "").replace(",", "").replace("!", "").replace("?", "")
-                if len(clean_word) > 2 and clean_word not in fallback_tags and clean_word not in stop_words:
-                    fallback_tags.append(clean_word)
+            _extend_unique_tokens(fallback_tags, seen, title, _GENERIC_STOPWORDS)
         
         # Add common relaxation tags (SINGLE WORD FORMAT like your examples)
-        relaxation_tags = [
-            "music", "relax", "healingmusic", "piano", "watersounds", 
-            "relaxingcalming", "helios4k", "sleepmusic", "innerpeace", 
-            "relaxingmusic", "meditation", "mindfulness", "peaceful", 
-            "nature", "ambient", "calming", "soothing", "zen", "spa"
-        ]
-        
-        for tag in relaxation_tags:
-            if tag not in fallback_tags:
+        for tag in _RELAXATION_TAGS:
+            if len(fallback_tags) >= 12:
+                break
+            if tag not in seen:
+                seen.add(tag)
                 fallback_tags.append(tag)
-                if len(fallback_tags) >= 12:
-                    break
         
         return fallback_tags[:12]
     
     async def _generate_image_prompts(self, title: str, keywords: List[str]) -> List[str]:
         """
         Tạo image prompts sử dụng Midjourney system prompt
+        (title + keywords trùng được _generate_content trả về từ response cache)
         """
         try:
             midjourney_prompt = self.prompt_manager.get_midjourney_generation_prompt(
@@ -763,18 +1064,19 @@ Subscribe for more amazing videos!
             
             # Tạo prompt cho Gemini/OpenAI
             full_prompt = f"{messages[0]['content']}\n\n{midjourney_prompt}"
-            response_text = await self._generate_content(full_prompt)
+            stable_prefix = self._stable_prefix(messages[0]['content'], 'midjourney_generator')
+            response_text = await self._generate_content(full_prompt, stable_prefix=stable_prefix)
             
             # Parse prompts từ response
             prompts = []
             
-            # Tìm các prompt trong code blocks
-            import re
-            code_blocks = re.findall(r'```(.*?)```', response_text, re.DOTALL)
-            
-            for block in code_blocks:
-                if block.strip() and not block.strip().startswith('json'):
-                    prompts.append(block.strip())
+            # Tìm các prompt trong code blocks - dừng ngay khi đủ 3 prompts
+            for match in _CODE_BLOCK_RE.finditer(response_text):
+                block = match.group(1).strip()
+                if block and not block.startswith('json'):
+                    prompts.append(block)
+                    if len(prompts) == 3:
+                        break
             
             # Nếu không tìm thấy code blocks, parse theo format khác
             if not prompts:
@@ -784,11 +1086,13 @@ Subscribe for more amazing videos!
                         continue
                     elif line.strip() and len(line.strip()) > 50:  # Prompts thường dài
                         prompts.append(line.strip())
+                        if len(prompts) == 3:
+                            break
             
             # Đảm bảo có ít nhất 3 prompts
-            while len(prompts) < 3:
+            if len(prompts) < 3:
                 fallback_prompt = f"cinematic {title.lower()}, professional lighting, 16:9 composition, negative space for text overlay, high quality photography --ar 16:9 --v 7"
-                prompts.append(fallback_prompt)
+                prompts.extend([fallback_prompt] * (3 - len(prompts)))
             
             logger.info(f"Generated {len(prompts)} image prompts")
             return prompts[:3]  # Chỉ lấy 3 prompts
@@ -857,18 +1161,18 @@ Subscribe for more amazing videos!
                     content_data = json.loads(content_json)
                 except json.JSONDecodeError:
                     # Nếu response không phải JSON hợp lệ, thử extract JSON từ text
-                    import re
-                    json_match = re.search(r'\{.*\}', content_json, re.DOTALL)
+                    json_match = _JSON_OBJ_RE.search(content_json)
                     if json_match:
                         content_data = json.loads(json_match.group())
                     else:
                         raise ValueError("Không thể parse JSON từ AI response")
                 
                 # Validate và tạo GeneratedContent object
+                cfg = self.config
                 generated_content = GeneratedContent(
-                    title=content_data.get("title", "")[:self.config.max_title_length],
-                    description=content_data.get("description", "")[:self.config.max_description_length],
-                    tags=content_data.get("tags", [])[:self.config.number_of_tags],
+                    title=content_data.get("title", "")[:cfg.max_title_length],
+                    description=content_data.get("description", "")[:cfg.max_description_length],
+                    tags=content_data.get("tags", [])[:cfg.number_of_tags],
                     thumbnail_name=content_data.get("thumbnail_name", ""),
                     image_prompts=content_data.get("image_prompts", [])
                 )
@@ -926,6 +1230,84 @@ Subscribe for more amazing videos!
             raise
 
 
+    async def generate_optimized_content_batch(
+        self,
+        inputs: List[InputData],
+        images: Optional[List[Optional[str]]] = None
+    ) -> List[Any]:
+        """
+        Tạo nội dung cho nhiều video cùng lúc, giới hạn số video xử lý song song
+        theo config.max_concurrent_requests. Trả về kết quả theo thứ tự input
+        (Exception nếu video đó lỗi).
+        """
+        semaphore = asyncio.Semaphore(self.config.max_concurrent_requests)
+        images = images or [None] * len(inputs)
+        
+        async def _generate_one(input_data: InputData, image_base64: Optional[str]):
+            async with semaphore:
+                return await self.generate_optimized_content(input_data, image_base64)
+        
+        logger.info(f"Bắt đầu tạo nội dung cho {len(inputs)} video "
+                    f"(tối đa {self.config.max_concurrent_requests} song song)")
+        return await asyncio.gather(
+            *[_generate_one(input_data, image) for input_data, image in zip(inputs, images)],
+            return_exceptions=True
+        )
+
+    def _build_variation_inputs(self, input_data_list: List[InputData]) -> List[InputData]:
+        """Gắn approach khác nhau vào context của từng input để đảm bảo đa dạng"""
+        modified_inputs = []
+        for i, input_data in enumerate(input_data_list):
+            # Modify context based on approach
+            suffix = _APPROACH_SUFFIXES[_APPROACH_KEYS[i % len(_APPROACH_KEYS)]]
+            
+            # Tạo modified input với approach khác nhau (shallow copy, chỉ đổi context)
+            modified_inputs.append(input_data.model_copy(update={
+                'additional_context': (input_data.additional_context or '') + suffix
+            }))
+        return modified_inputs
+
+    async def iter_content_variations(
+        self,
+        input_data_list: List[InputData],
+        image_base64: Optional[str] = None
+    ) -> AsyncIterator[GeneratedContent]:
+        """
+        Tạo content variations và yield từng kết quả ngay khi xong (thứ tự hoàn thành),
+        để caller xử lý dần thay vì giữ toàn bộ kết quả trong bộ nhớ.
+        Variation lỗi được log và bỏ qua.
+        """
+        semaphore = asyncio.Semaphore(self.config.max_concurrent_requests)
+        
+        async def _generate_one(index: int, input_data: InputData):
+            # Chạy song song nhưng giới hạn số request đồng thời (tránh 429 từ AI provider)
+            async with semaphore:
+                try:
+                    return index, await self.generate_optimized_content(input_data, image_base64)
+                except Exception as e:
+                    return index, e
+        
+        logger.info(f"Bắt đầu tạo {len(input_data_list)} content variations")
+        tasks = [
+            asyncio.ensure_future(_generate_one(i, input_data))
+            for i, input_data in enumerate(self._build_variation_inputs(input_data_list))
+        ]
+        try:
+            for fut in asyncio.as_completed(tasks):
+                index, result = await fut
+                if isinstance(result, Exception):
+                    logger.error(f"Lỗi tạo variation {index+1}: {str(result)}")
+                    continue
+                logger.info(f"✅ Variation {index+1}: {result.title[:50]}...")
+                yield result
+        finally:
+            # Caller dừng sớm thì huỷ các variation còn đang chạy và chờ chúng dừng hẳn
+            pending = [task for task in tasks if not task.done()]
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
     async def generate_content_variations(
         self, 
         input_data_list: List[InputData], 
@@ -933,44 +1315,18 @@ Subscribe for more amazing videos!
     ) -> List[GeneratedContent]:
         """
         Tạo nhiều variations của content từ danh sách input data
-        Mỗi content sẽ có approach khác nhau để đảm bảo đa dạng
+        Mỗi content sẽ có approach khác nhau để đảm bảo đa dạng.
+        Trả về theo thứ tự input; cần nhận dần theo thứ tự hoàn thành thì dùng iter_content_variations.
         """
         try:
             logger.info(f"Bắt đầu tạo {len(input_data_list)} content variations")
+            modified_inputs = self._build_variation_inputs(input_data_list)
             
-            # Tạo các approach khác nhau cho mỗi variation
-            approaches = [
-                "detailed_analysis",    # Phân tích chi tiết
-                "quick_guide",         # Hướng dẫn nhanh
-                "beginner_tips",       # Tips cho người mới
-                "advanced_insights",   # Góc nhìn nâng cao
-                "practical_tutorial"   # Tutorial thực hành
-            ]
-            
-            tasks = []
-            for i, input_data in enumerate(input_data_list):
-                # Modify context based on approach
-                approach = approaches[i % len(approaches)]
-                
-                # Tạo modified input với approach khác nhau
-                modified_input = InputData(
-                    channel_id=input_data.channel_id,
-                    channel_name=input_data.channel_name,
-                    channel_description=input_data.channel_description,
-                    video_topic=input_data.video_topic,
-                    additional_context=f"{input_data.additional_context or ''} | Style: {approach} | Make content unique and different",
-                    video_frame_file=input_data.video_frame_file,
-                    video_frame_url=input_data.video_frame_url,
-                    created_by=input_data.created_by,
-                    created_at=input_data.created_at
-                )
-                
-                # Tạo task cho mỗi variation
-                task = self.generate_optimized_content(modified_input, image_base64)
-                tasks.append(task)
-            
-            # Chạy tất cả tasks song song
-            results = await asyncio.gather(*tasks, return_exceptions=True)
+            # Chạy song song nhưng giới hạn số request đồng thời (tránh 429 từ AI provider),
+            # kết quả giữ theo thứ tự input
+            results = await self.generate_optimized_content_batch(
+                modified_inputs, [image_base64] * len(modified_inputs)
+            )
             
             # Lọc ra kết quả thành công
             successful_results = []
@@ -988,6 +1344,5 @@ Subscribe for more amazing videos!
             logger.error(f"Lỗi khi tạo content variations: {str(e)}")
             return []
 
-
 # Singleton instance
 ai_generator = AIContentGenerator() 
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""
+Client Airtable REST bất đồng bộ (httpx) - cùng tên method với airtable-python-wrapper
+nhưng mỗi request là một coroutine thay vì chiếm một thread trong ThreadPoolExecutor
+"""
+
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import quote
+import asyncio
+import logging
+import random
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+_API_URL = "https://api.airtable.com/v0"
+_BATCH_SIZE = 10  # Airtable giới hạn 10 records mỗi request ghi
+_PAGE_SIZE = 100  # Airtable giới hạn 100 records mỗi trang khi đọc
+
+# Giới hạn request đồng thời; lỗi tạm thời (429/5xx, lỗi mạng) được retry với exponential backoff
+_CONCURRENCY = 10
+_MAX_TRIES = 5
+_RETRY_STATUS_CODES = (429, 500, 502, 503)
+# POST tạo record không idempotent: 5xx hay lỗi khi đang đọc response có thể xảy ra sau khi Airtable
+# đã tạo record, nên chỉ retry khi bị rate limit hoặc khi chưa kết nối được (request chưa được gửi)
+_POST_RETRY_STATUS_CODES = (429,)
+_POST_RETRY_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout)
+
+# Semaphore và client HTTP dùng chung cho mọi base/table (HTTP/2 để các request song song dùng chung
+# kết nối). Tạo lười trong event loop đang chạy và tạo lại khi loop đổi (test, reload)
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_semaphore: Optional[asyncio.Semaphore] = None
+_http: Optional[httpx.AsyncClient] = None
+
+
+def _loop_resources() -> Tuple[asyncio.Semaphore, httpx.AsyncClient]:
+    global _loop, _semaphore, _http
+    loop = asyncio.get_running_loop()
+    if _loop is not loop:
+        _loop = loop
+        _semaphore = asyncio.Semaphore(_CONCURRENCY)
+        _http = None
+    if _http is None or _http.is_closed:
+        _http = httpx.AsyncClient(
+            base_url=_API_URL,
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=20, keepalive_expiry=60.0),
+            timeout=httpx.Timeout(30.0)
+        )
+    return _semaphore, _http
+
+
+async def aclose():
+    """Đóng client HTTP dùng chung (gọi khi app shutdown)"""
+    global _http
+    if _http is not None:
+        await _http.aclose()
+        _http = None
+
+
+class AsyncAirtable:
+    """
+    Truy cập một table Airtable qua REST API
+    """
+
+    def __init__(self, base_id: str, table_name: str, api_key: str):
+        self.base_id = base_id
+        self.table_name = table_name
+        self._path = f"/{base_id}/{quote(table_name, safe='')}"
+        self._headers = {"Authorization": f"Bearer {api_key}"}
+
+    async def _request(self, method: str, path: str = "", **kwargs) -> Dict[str, Any]:
+        if method == "POST":
+            retry_status_codes, retry_errors = _POST_RETRY_STATUS_CODES, _POST_RETRY_ERRORS
+        else:
+            retry_status_codes, retry_errors = _RETRY_STATUS_CODES, httpx.TransportError
+        
+        for attempt in range(_MAX_TRIES):
+            try:
+                semaphore, http = _loop_resources()
+                async with semaphore:
+                    response = await http.request(method, self._path + path, headers=self._headers, **kwargs)
+                if response.status_code not in retry_status_codes or attempt == _MAX_TRIES - 1:
+                    response.raise_for_status()
+                    return response.json()
+                reason = response.status_code
+            except retry_errors as e:
+                if attempt == _MAX_TRIES - 1:
+                    raise
+                reason = str(e)
+            delay = min(2 ** attempt + random.random(), 60)
+            logger.warning(f"Airtable lỗi tạm thời ({reason}), thử lại sau {delay:.1f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+
+    async def get_all(self, formula: Optional[str] = None, fields: Optional[List[str]] = None,
+                      max_records: Optional[int] = None, sort: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Lấy tất cả records (tự phân trang).
+        sort: tên field (thêm '-' phía trước để giảm dần) hoặc tuple (field, "asc"/"desc")
+        """
+        params: List[tuple] = [("pageSize", _PAGE_SIZE)]
+        if formula:
+            params.append(("filterByFormula", formula))
+        if max_records:
+            params.append(("maxRecords", max_records))
+        for field in fields or []:
+            params.append(("fields[]", field))
+        for i, field in enumerate(sort or []):
+            if isinstance(field, tuple):
+                field, direction = field
+            else:
+                direction = "desc" if field.startswith("-") else "asc"
+                field = field.lstrip("-")
+            params.append((f"sort[{i}][field]", field))
+            params.append((f"sort[{i}][direction]", direction))
+
+        records: List[Dict[str, Any]] = []
+        offset = None
+        while True:
+            page = await self._request("GET", params=params + ([("offset", offset)] if offset else []))
+            records.extend(page.get("records", []))
+            offset = page.get("offset")
+            if not offset:
+                return records
+
+    async def insert(self, fields: Dict[str, Any], typecast: bool = False) -> Dict[str, Any]:
+        """Tạo một record, trả về record đã tạo"""
+        return await self._request("POST", json={"fields": fields, "typecast": typecast})
+
+    async def batch_insert(self, records: List[Dict[str, Any]], typecast: bool = False) -> List[Dict[str, Any]]:
+        """Tạo nhiều records (mỗi request tối đa 10), trả về các records đã tạo"""
+        created: List[Dict[str, Any]] = []
+        for start in range(0, len(records), _BATCH_SIZE):
+            chunk = records[start:start + _BATCH_SIZE]
+            result = await self._request(
+                "POST",
+                json={"records": [{"fields": fields} for fields in chunk], "typecast": typecast}
+            )
+            created.extend(result.get("records", []))
+        return created
+
+    async def update(self, record_id: str, fields: Dict[str, Any], typecast: bool = False) -> Dict[str, Any]:
+        """Cập nhật một phần các field của record"""
+        return await self._request("PATCH", f"/{record_id}", json={"fields": fields, "typecast": typecast})
+
+    async def batch_update(self, records: List[Dict[str, Any]], typecast: bool = False) -> List[Dict[str, Any]]:
+        """Cập nhật nhiều records dạng {"id": ..., "fields": {...}} (mỗi request tối đa 10)"""
+        updated: List[Dict[str, Any]] = []
+        for start in range(0, len(records), _BATCH_SIZE):
+            chunk = records[start:start + _BATCH_SIZE]
+            result = await self._request("PATCH", json={"records": chunk, "typecast": typecast})
+            updated.extend(result.get("records", []))
+        return updated
@@ -1,19 +1,39 @@
-import json
+import asyncio
+import atexit
+import mmap
 import os
-from typing import Dict, List, Optional
-import sys
-import pathlib
+import re
+import threading
+from contextlib import contextmanager
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional, Tuple
+import ijson
+import orjson
+from pydantic import ValidationError
 
-# Thêm thư mục gốc vào sys.path
-root_dir = str(pathlib.Path(__file__).parent.parent.absolute())
-if root_dir not in sys.path:
-    sys.path.append(root_dir)
-
-from src.models import ChannelConfig, InputData
+from src.models import ChannelConfig, ChannelDatabase, InputData
 from config.settings import settings
 import logging
 
 logger = logging.getLogger(__name__)
+# Bind sẵn các method log dùng trong module (bound method vẫn theo level/handler hiện tại của logger)
+_info = logger.info
+_warn = logger.warning
+_error = logger.error
+
+# GID của sheet tab trong Google Sheet URL
+_GID_RE = re.compile(r'[#&]gid=([0-9]+)')
+
+# Version format do _build_config_payload ghi ra. File khác version (vd. sửa tay) sẽ được validate khi load
+_CONFIG_SCHEMA_VERSION = 1
+
+# Đường dẫn file cấu hình (channel_mapping_config.json ở thư mục chạy), tính một lần khi import
+_CONFIG_FILE = "channel_mapping_config.json"
+_CONFIG_TMP_FILE = _CONFIG_FILE + ".tmp"
+_CHANGE_LOG_FILE = _CONFIG_FILE + "l"
+
+# Các trường chuỗi thường lặp lại giữa các kênh, được gộp chung một object khi load
+_INTERNED_FIELDS = ("channel_description", "content_style", "target_audience")
 
 
 class ChannelManager:
@@ -23,57 +43,226 @@ class ChannelManager:
     
     def __init__(self):
         # Sử dụng trực tiếp channel_mapping_config.json từ root
-        self.channels_config_file = "channel_mapping_config.json"
-        self.channels: Dict[str, ChannelConfig] = {}
-        self._load_channels_config()
+        self.channels_config_file = _CONFIG_FILE
+        self._channels_tmp_file = _CONFIG_TMP_FILE
+        # Log thay đổi append-only (mỗi dòng một op), gộp vào file config khi compact
+        self.channels_log_file = _CHANGE_LOG_FILE
+        self._log_entries = 0
+        # Ghi lại file config sau mỗi thay đổi để bản JSON sửa tay luôn cập nhật (mặc định tắt)
+        self.compact_every_change = settings.channel_config_compact_every_change
+        # Cache dict đã serialize theo format file config: channel_id -> (spreadsheet_id, dict)
+        self._serialized: Dict[str, Tuple[Optional[str], dict]] = {}
+        self._channels: Optional[Dict[str, ChannelConfig]] = None  # Load lười ở lần truy cập đầu
+        self._streamed_channels: Dict[str, ChannelConfig] = {}  # Kênh lẻ đọc bằng ijson trước khi load đầy đủ
+        self._active_ids: Dict[str, None] = {}  # Index các kênh đang hoạt động (dict giữ thứ tự)
+        self._channels_view: Optional[Mapping[str, ChannelConfig]] = None  # Snapshot cho get_all_channels
+        self._enrich_contexts: Dict[str, str] = {}  # Context dựng sẵn cho enrich_input_data theo channel_id
+        self._db_configs: Dict[str, ChannelDatabase] = {}  # ChannelDatabase đã dựng theo channel_id
+        
+        # Gộp nhiều lần compact liên tiếp thành một lần ghi file
+        self._dirty = False
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._flush_delay = 0.5
+        self._batch_depth = 0  # > 0 khi đang trong channel_manager.batch()
+        # Ghi file có thể chạy trong thread pool: lock file + số thứ tự snapshot để bản cũ không ghi đè bản mới
+        self._file_lock = threading.Lock()
+        self._snapshot_seq = 0
+        self._written_seq = 0
+    
+    @property
+    def channels(self) -> Dict[str, ChannelConfig]:
+        """Dict channel_id -> ChannelConfig, chỉ đọc file config ở lần truy cập đầu tiên"""
+        if self._channels is None:
+            self._channels = {}
+            self._streamed_channels.clear()
+            self._load_channels_config()
+            self._rebuild_active_index()
+        return self._channels
+    
+    def _rebuild_active_index(self):
+        """Dựng lại index kênh đang hoạt động sau khi load toàn bộ channels"""
+        self._channels_view = None
+        self._enrich_contexts.clear()
+        self._db_configs.clear()
+        self._active_ids = {channel_id: None for channel_id, channel in self.channels.items() if channel.is_active}
+    
+    def _on_channel_changed(self, channel_id: str, channel: Optional[ChannelConfig]):
+        """Cập nhật cache/index cho một kênh vừa được thêm, sửa (channel) hoặc xoá (None)"""
+        self._channels_view = None
+        self._serialized.pop(channel_id, None)
+        self._enrich_contexts.pop(channel_id, None)
+        self._db_configs.pop(channel_id, None)
+        if channel is not None and channel.is_active:
+            self._active_ids[channel_id] = None
+        else:
+            self._active_ids.pop(channel_id, None)
     
     def _load_channels_config(self):
         """
-        Load cấu hình channels từ channel_mapping_config.json
+        Load cấu hình channels từ channel_mapping_config.json rồi áp dụng change log lên trên
         """
+        snapshot_loaded = False
         try:
             if os.path.exists(self.channels_config_file):
-                with open(self.channels_config_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
+                with open(self.channels_config_file, 'rb') as f:
+                    try:
+                        # Parse thẳng trên vùng nhớ map từ file, không copy qua buffer đọc
+                        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    except (ValueError, OSError):
+                        # File rỗng hoặc hệ thống không hỗ trợ mmap
+                        data = orjson.loads(f.read())
+                    else:
+                        with mm, memoryview(mm) as view:
+                            data = orjson.loads(view)
                 
                 # Lấy spreadsheet_id chung
                 spreadsheet_id = data.get("spreadsheet_id")
                 
+                # File do chính _build_config_payload ghi ra (đúng version) thì bỏ qua validate
+                trusted = data.get("schema_version") == _CONFIG_SCHEMA_VERSION
+                
                 # Load channels từ array
+                pool: Dict[str, str] = {}
                 for channel_data in data.get('channels', []):
-                    # Bổ sung spreadsheet_id chung cho mỗi channel
-                    if spreadsheet_id and not channel_data.get('google_sheets_id'):
-                        channel_data['google_sheets_id'] = spreadsheet_id
-                    
-                    # Parse google_sheet_url để lấy gid nếu có
-                    if 'google_sheet_url' in channel_data:
-                        import re
-                        gid_match = re.search(r'[#&]gid=([0-9]+)', channel_data['google_sheet_url'])
-                        if gid_match and not channel_data.get('google_sheet_gid'):
-                            channel_data['google_sheet_gid'] = gid_match.group(1)
-                    
-                    # Đảm bảo các trường bắt buộc có giá trị mặc định
-                    if 'is_active' not in channel_data:
-                        channel_data['is_active'] = True
-                    if 'content_topics' not in channel_data:
-                        channel_data['content_topics'] = []
-                    
-                    channel = ChannelConfig(**channel_data)
+                    self._normalize_channel_data(channel_data, spreadsheet_id)
+                    self._intern_channel_strings(channel_data, pool)
+                    if trusted:
+                        channel = ChannelConfig.model_construct(**channel_data)
+                    else:
+                        channel = ChannelConfig.model_validate(channel_data)
                     self.channels[channel.channel_id] = channel
-                
-                logger.info(f"Đã load {len(self.channels)} channels từ channel_mapping_config.json")
-                
-                # Log danh sách channels
-                for channel_id, channel in self.channels.items():
-                    logger.info(f"  • {channel.channel_name} (ID: {channel_id}) → Sheet: {channel.google_sheet_name}")
-                    
+                snapshot_loaded = True
             else:
-                logger.warning("Không tìm thấy channel_mapping_config.json, tạo cấu hình mặc định")
-                self._create_default_config()
+                _warn("Không tìm thấy channel_mapping_config.json")
                 
         except Exception as e:
-            logger.error(f"Lỗi khi load channels config: {str(e)}")
+            _error("Lỗi khi load channels config: %s", e)
+            self.channels.clear()
+        
+        # Log vẫn được áp dụng khi snapshot thiếu/hỏng, nếu không lần compact sau sẽ xoá mất các thay đổi
+        self._replay_change_log()
+        
+        if not snapshot_loaded and not self.channels:
+            _warn("Không có cấu hình channels, tạo cấu hình mặc định")
             self._create_default_config()
+            return
+        
+        _info("Đã load %s channels từ channel_mapping_config.json", len(self.channels))
+        
+        # Log danh sách channels (bỏ qua cả vòng lặp nếu INFO bị tắt)
+        if logger.isEnabledFor(logging.INFO):
+            for channel_id, channel in self.channels.items():
+                _info("  • %s (ID: %s) → Sheet: %s", channel.channel_name, channel_id, channel.google_sheet_name)
+    
+    @staticmethod
+    def _normalize_channel_data(channel_data: dict, spreadsheet_id: Optional[str]) -> dict:
+        """Chuẩn hoá một entry trong channel_mapping_config.json trước khi tạo ChannelConfig"""
+        # Bổ sung spreadsheet_id chung cho mỗi channel
+        if spreadsheet_id and not channel_data.get('google_sheets_id'):
+            channel_data['google_sheets_id'] = spreadsheet_id
+        
+        # Parse google_sheet_url để lấy gid nếu có
+        if 'google_sheet_url' in channel_data:
+            gid_match = _GID_RE.search(channel_data['google_sheet_url'])
+            if gid_match and not channel_data.get('google_sheet_gid'):
+                channel_data['google_sheet_gid'] = gid_match.group(1)
+        
+        # Đảm bảo các trường bắt buộc có giá trị mặc định
+        if 'is_active' not in channel_data:
+            channel_data['is_active'] = True
+        if 'content_topics' not in channel_data:
+            channel_data['content_topics'] = []
+        
+        return channel_data
+    
+    @staticmethod
+    def _intern_channel_strings(channel_data: dict, pool: Dict[str, str]):
+        """Dùng chung một object str cho các giá trị trùng nhau giữa các kênh trong cùng lần load"""
+        for field in _INTERNED_FIELDS:
+            value = channel_data.get(field)
+            if isinstance(value, str):
+                channel_data[field] = pool.setdefault(value, value)
+        
+        topics = channel_data.get('content_topics')
+        if topics:
+            channel_data['content_topics'] = [
+                pool.setdefault(topic, topic) if isinstance(topic, str) else topic for topic in topics
+            ]
+    
+    def _stream_get_channel(self, channel_id: str) -> Optional[ChannelConfig]:
+        """
+        Tìm một kênh bằng cách stream file config (ijson) và dừng ngay khi gặp,
+        không parse toàn bộ file. Chỉ dùng khi chưa load đầy đủ channels.
+        """
+        if channel_id in self._streamed_channels:
+            return self._streamed_channels[channel_id]
+        
+        # Còn thay đổi trong log hoặc chưa có file thì snapshot không đủ, load đầy đủ
+        if os.path.exists(self.channels_log_file) or not os.path.exists(self.channels_config_file):
+            return self.channels.get(channel_id)
+        
+        try:
+            with open(self.channels_config_file, 'rb') as f:
+                spreadsheet_id = next(ijson.items(f, 'spreadsheet_id'), None)
+                f.seek(0)
+                for channel_data in ijson.items(f, 'channels.item', use_float=True):
+                    if channel_data.get('channel_id') == channel_id:
+                        # Chỉ một kênh nên validate luôn, không cần đọc thêm schema_version
+                        channel = ChannelConfig.model_validate(
+                            self._normalize_channel_data(channel_data, spreadsheet_id)
+                        )
+                        self._streamed_channels[channel_id] = channel
+                        return channel
+            return None
+            
+        except Exception as e:
+            _error("Lỗi khi stream channel config: %s", e)
+            return self.channels.get(channel_id)
+    
+    def _replay_change_log(self):
+        """Áp dụng các thay đổi trong log chưa được compact lên snapshot vừa load"""
+        if not os.path.exists(self.channels_log_file):
+            return
+        
+        try:
+            with open(self.channels_log_file, 'rb') as f:
+                for line in f:
+                    try:
+                        entry = orjson.loads(line)
+                        if entry["op"] == "upsert":
+                            # Dữ liệu đã qua JSON (datetime thành str...) nên phải validate lại
+                            self.channels[entry["id"]] = ChannelConfig.model_validate(entry["data"])
+                        elif entry["op"] == "remove":
+                            self.channels.pop(entry["id"], None)
+                    except (orjson.JSONDecodeError, KeyError, TypeError, ValidationError) as e:
+                        # Dòng cuối có thể bị ghi dở nếu process chết giữa chừng; entry lỗi bị bỏ qua riêng lẻ
+                        _warn("Bỏ qua dòng lỗi trong channel_mapping_config.jsonl: %s", e)
+                        continue
+                    self._log_entries += 1
+        except OSError as e:
+            _error("Lỗi khi đọc channel change log: %s", e)
+        
+        if self._log_entries:
+            _info("Đã áp dụng %s thay đổi từ channel_mapping_config.jsonl", self._log_entries)
+    
+    def _append_change_log(self, entries: List[dict]):
+        """
+        Ghi thêm các thay đổi vào log (chi phí tỉ lệ với số kênh thay đổi, không phải
+        toàn bộ config). Raise OSError nếu không ghi được, caller chưa áp dụng thay đổi.
+        """
+        payload = b"".join(orjson.dumps(entry, default=str) + b"\n" for entry in entries)
+        with self._file_lock:
+            with open(self.channels_log_file, 'ab') as f:
+                f.write(payload)
+            self._log_entries += len(entries)
+    
+    def _compact_if_needed(self):
+        """
+        Hẹn compact log vào file config khi log dài hơn 2 lần số kênh
+        (hoặc sau mỗi thay đổi nếu bật channel_config_compact_every_change)
+        """
+        if self.compact_every_change or self._log_entries > 2 * len(self.channels):
+            self._mark_dirty()
     
     def _create_default_config(self):
         """
@@ -92,126 +281,273 @@ class ChannelManager:
             )
             
             self.channels["default_channel"] = default_channel
-            logger.info("Đã tạo cấu hình mặc định")
+            _info("Đã tạo cấu hình mặc định")
             
         except Exception as e:
-            logger.error(f"Lỗi khi tạo cấu hình mặc định: {str(e)}")
+            _error("Lỗi khi tạo cấu hình mặc định: %s", e)
     
-    def _save_channels_config(self):
+    def _mark_dirty(self):
         """
-        Lưu cấu hình channels vào file channel_mapping_config.json
+        Đánh dấu cần compact log vào file config. Trong event loop thì debounce việc ghi file,
+        ngoài event loop (script đồng bộ) thì ghi ngay.
         """
+        self._dirty = True
+        if self._batch_depth:
+            # batch() sẽ flush một lần khi kết thúc
+            return
         try:
-            # Chuẩn bị dữ liệu theo format của channel_mapping_config.json
-            channels_data = []
-            spreadsheet_id = None
-            
-            for channel in self.channels.values():
-                # Lấy spreadsheet_id chung từ channel đầu tiên
-                if not spreadsheet_id and channel.google_sheets_id:
-                    spreadsheet_id = channel.google_sheets_id
-                
-                channel_data = {
-                    "channel_id": channel.channel_id,
-                    "channel_name": channel.channel_name,
-                    "channel_description": channel.channel_description,
-                    "google_sheet_name": channel.google_sheet_name,
-                    "google_sheet_gid": channel.google_sheet_gid,
-                    "content_style": channel.content_style,
-                    "target_audience": channel.target_audience,
-                    "content_topics": channel.content_topics
-                }
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.flush()
+            return
+        
+        if self._flush_handle is None:
+            self._flush_handle = loop.call_later(self._flush_delay, self._flush_in_background)
+    
+    @contextmanager
+    def batch(self):
+        """
+        Gộp mọi thay đổi bên trong thành một lần compact khi kết thúc:
+            with channel_manager.batch():
+                channel_manager.add_channel(...)
+                channel_manager.update_channel(...)
+        """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if not self._batch_depth:
+                self.flush()
+    
+    def flush(self):
+        """Compact các thay đổi chưa lưu vào file config (gọi khi shutdown)"""
+        snapshot = self._take_snapshot()
+        if snapshot:
+            self._write_snapshot(*snapshot)
+    
+    def _flush_in_background(self):
+        """Timer debounce: dựng payload trên event loop, phần ghi file + fsync chạy trong thread pool"""
+        self._flush_handle = None
+        snapshot = self._take_snapshot()
+        if snapshot:
+            asyncio.get_running_loop().run_in_executor(None, self._write_snapshot, *snapshot)
+    
+    @staticmethod
+    def _serialize_channel(channel: ChannelConfig, spreadsheet_id: Optional[str]) -> dict:
+        """Chuyển một kênh sang dict theo format của channel_mapping_config.json"""
+        channel_data = {
+            "channel_id": channel.channel_id,
+            "channel_name": channel.channel_name,
+            "channel_description": channel.channel_description,
+            "google_sheet_name": channel.google_sheet_name,
+            "google_sheet_gid": channel.google_sheet_gid,
+            "content_style": channel.content_style,
+            "target_audience": channel.target_audience,
+            "content_topics": channel.content_topics
+        }
+        
+        # Tạo google_sheet_url nếu có đủ thông tin
+        if spreadsheet_id and channel.google_sheet_gid:
+            channel_data["google_sheet_url"] = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit?gid={channel.google_sheet_gid}#gid={channel.google_sheet_gid}"
+        
+        return channel_data
+    
+    def _take_snapshot(self) -> Optional[Tuple[int, bytes, int]]:
+        """
+        Serialize channels hiện tại nếu có thay đổi chưa lưu.
+        Trả về (số thứ tự snapshot, payload, số dòng log đã gồm trong snapshot)
+        """
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        
+        if not (self._dirty or self._log_entries):
+            return None
+        
+        try:
+            payload = self._build_config_payload()
+        except Exception as e:
+            _error("Lỗi khi lưu channels config: %s", e)
+            return None
+        
+        self._dirty = False
+        self._snapshot_seq += 1
+        return self._snapshot_seq, payload, self._log_entries
+    
+    def _build_config_payload(self) -> bytes:
+        """
+        Dữ liệu channel_mapping_config.json đã encode
+        """
+        # Lấy spreadsheet_id chung từ channel đầu tiên có giá trị
+        spreadsheet_id = next(
+            (channel.google_sheets_id for channel in self.channels.values() if channel.google_sheets_id),
+            None
+        )
+        
+        # Chuẩn bị dữ liệu theo format của channel_mapping_config.json,
+        # chỉ serialize lại những kênh đã thay đổi kể từ lần lưu trước
+        channels_data = []
+        for channel_id, channel in self.channels.items():
+            cached = self._serialized.get(channel_id)
+            if cached is None or cached[0] != spreadsheet_id:
+                cached = (spreadsheet_id, self._serialize_channel(channel, spreadsheet_id))
+                self._serialized[channel_id] = cached
+            channels_data.append(cached[1])
+        
+        # Tạo data theo format channel_mapping_config.json
+        data = {
+            "schema_version": _CONFIG_SCHEMA_VERSION,
+            "spreadsheet_id": spreadsheet_id or settings.google_sheets_id,
+            "channels": channels_data
+        }
+        return orjson.dumps(data, default=str, option=orjson.OPT_INDENT_2)
+    
+    def _write_snapshot(self, seq: int, payload: bytes, log_entries: int):
+        """
+        Lưu snapshot vào file channel_mapping_config.json (chạy được ngoài event loop)
+        """
+        try:
+            with self._file_lock:
+                if seq <= self._written_seq:
+                    # Đã có snapshot mới hơn được ghi
+                    return
                 
-                # Tạo google_sheet_url nếu có đủ thông tin
-                if spreadsheet_id and channel.google_sheet_gid:
-                    channel_data["google_sheet_url"] = f"https://docs.google.com/spreadsheets/d/{spreadsheet_id}/edit?gid={channel.google_sheet_gid}#gid={channel.google_sheet_gid}"
+                # Ghi thẳng vào file tạm (fsync) rồi os.replace để không bao giờ để lại file bị ghi dở
+                view = memoryview(payload)
+                tmp_file = self._channels_tmp_file
+                fd = os.open(tmp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                try:
+                    while view:
+                        view = view[os.write(fd, view):]
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+                os.replace(tmp_file, self.channels_config_file)
+                self._written_seq = seq
                 
-                channels_data.append(channel_data)
+                # Snapshot đã chứa mọi thay đổi trong log thì xoá log; có dòng mới ghi sau snapshot
+                # thì giữ lại cho lần compact kế tiếp (replay lại cũng vô hại vì idempotent)
+                if self._log_entries == log_entries:
+                    if os.path.exists(self.channels_log_file):
+                        os.remove(self.channels_log_file)
+                    self._log_entries = 0
             
-            # Tạo data theo format channel_mapping_config.json
-            data = {
-                "spreadsheet_id": spreadsheet_id or settings.google_sheets_id,
-                "channels": channels_data
-            }
-            
-            # Lưu file
-            with open(self.channels_config_file, 'w', encoding='utf-8') as f:
-                json.dump(data, f, ensure_ascii=False, indent=2, default=str)
-            
-            logger.info("Đã lưu cấu hình channels vào channel_mapping_config.json")
+            _info("Đã lưu cấu hình channels vào channel_mapping_config.json")
             
         except Exception as e:
-            logger.error(f"Lỗi khi lưu channels config: {str(e)}")
+            self._dirty = True  # Để lần flush sau ghi lại
+            _error("Lỗi khi lưu channels config: %s", e)
     
     def add_channel(self, channel_config: ChannelConfig) -> bool:
         """
         Thêm kênh mới
         """
+        channels = self.channels
         try:
-            self.channels[channel_config.channel_id] = channel_config
-            
-            self._save_channels_config()
-            logger.info(f"Đã thêm kênh: {channel_config.channel_name}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Lỗi khi thêm kênh: {str(e)}")
+            # Ghi log trước khi sửa channels để lỗi không để lại trạng thái nửa vời
+            self._append_change_log([
+                {"op": "upsert", "id": channel_config.channel_id, "data": channel_config.model_dump()}
+            ])
+        except (ValidationError, TypeError, OSError) as e:
+            _error("Lỗi khi thêm kênh: %s", e)
             return False
+        
+        channels[channel_config.channel_id] = channel_config
+        self._on_channel_changed(channel_config.channel_id, channel_config)
+        self._compact_if_needed()
+        _info("Đã thêm kênh: %s", channel_config.channel_name)
+        return True
+    
+    def add_channels_bulk(self, channel_configs: List[ChannelConfig]) -> int:
+        """
+        Thêm nhiều kênh cùng lúc, chỉ ghi log một lần cho cả batch
+        """
+        if not channel_configs:
+            return 0
+        
+        channels = self.channels
+        try:
+            self._append_change_log([
+                {"op": "upsert", "id": channel_config.channel_id, "data": channel_config.model_dump()}
+                for channel_config in channel_configs
+            ])
+        except (ValidationError, TypeError, OSError) as e:
+            _error("Lỗi khi thêm kênh: %s", e)
+            return 0
+        
+        for channel_config in channel_configs:
+            channels[channel_config.channel_id] = channel_config
+            self._on_channel_changed(channel_config.channel_id, channel_config)
+        self._compact_if_needed()
+        _info("Đã thêm %s kênh", len(channel_configs))
+        return len(channel_configs)
     
     def update_channel(self, channel_id: str, channel_config: ChannelConfig) -> bool:
         """
         Cập nhật kênh
         """
+        channels = self.channels
+        if channel_id not in channels:
+            _warn("Không tìm thấy kênh: %s", channel_id)
+            return False
+        
         try:
-            if channel_id in self.channels:
-                self.channels[channel_id] = channel_config
-                self._save_channels_config()
-                logger.info(f"Đã cập nhật kênh: {channel_config.channel_name}")
-                return True
-            else:
-                logger.warning(f"Không tìm thấy kênh: {channel_id}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Lỗi khi cập nhật kênh: {str(e)}")
+            self._append_change_log([{"op": "upsert", "id": channel_id, "data": channel_config.model_dump()}])
+        except (ValidationError, TypeError, OSError) as e:
+            _error("Lỗi khi cập nhật kênh: %s", e)
             return False
+        
+        channels[channel_id] = channel_config
+        self._on_channel_changed(channel_id, channel_config)
+        self._compact_if_needed()
+        _info("Đã cập nhật kênh: %s", channel_config.channel_name)
+        return True
     
     def remove_channel(self, channel_id: str) -> bool:
         """
         Xóa kênh
         """
+        channels = self.channels
+        if channel_id not in channels:
+            _warn("Không tìm thấy kênh: %s", channel_id)
+            return False
+        
         try:
-            if channel_id in self.channels:
-                del self.channels[channel_id]
-                
-                self._save_channels_config()
-                logger.info(f"Đã xóa kênh: {channel_id}")
-                return True
-            else:
-                logger.warning(f"Không tìm thấy kênh: {channel_id}")
-                return False
-                
-        except Exception as e:
-            logger.error(f"Lỗi khi xóa kênh: {str(e)}")
+            self._append_change_log([{"op": "remove", "id": channel_id}])
+        except OSError as e:
+            _error("Lỗi khi xóa kênh: %s", e)
             return False
+        
+        del channels[channel_id]
+        self._on_channel_changed(channel_id, None)
+        self._compact_if_needed()
+        _info("Đã xóa kênh: %s", channel_id)
+        return True
     
     def get_channel(self, channel_id: str) -> Optional[ChannelConfig]:
         """
         Lấy thông tin kênh
         """
-        return self.channels.get(channel_id)
+        if self._channels is None:
+            return self._stream_get_channel(channel_id)
+        return self._channels.get(channel_id)
     
-    def get_all_channels(self) -> Dict[str, ChannelConfig]:
+    def get_all_channels(self) -> Mapping[str, ChannelConfig]:
         """
-        Lấy tất cả kênh
+        Lấy tất cả kênh - snapshot chỉ đọc, chỉ tạo lại sau khi channels thay đổi
+        (an toàn khi duyệt xen await). Cần sửa thì dùng dict(...)
         """
-        return self.channels.copy()
+        if self._channels_view is None:
+            self._channels_view = MappingProxyType(dict(self.channels))
+        return self._channels_view
     
     def get_active_channels(self) -> List[ChannelConfig]:
         """
         Lấy các kênh đang hoạt động
         """
-        return [channel for channel in self.channels.values() if channel.is_active]
+        channels = self.channels  # Đảm bảo đã load (index được dựng cùng lúc)
+        return [channels[channel_id] for channel_id in self._active_ids]
     
     def enrich_input_data(self, input_data: InputData) -> InputData:
         """
@@ -227,16 +563,20 @@ class ChannelManager:
                 
                 # Nếu không có context, dùng thông tin từ channel
                 if not input_data.additional_context and channel.content_style:
-                    input_data.additional_context = f"Phong cách: {channel.content_style}. Đối tượng: {channel.target_audience}"
+                    context = self._enrich_contexts.get(channel.channel_id)
+                    if context is None:
+                        context = f"Phong cách: {channel.content_style}. Đối tượng: {channel.target_audience}"
+                        self._enrich_contexts[channel.channel_id] = context
+                    input_data.additional_context = context
                 
-                logger.info(f"Đã enrich input data cho kênh: {channel.channel_name}")
+                _info("Đã enrich input data cho kênh: %s", channel.channel_name)
             else:
-                logger.warning(f"Không tìm thấy kênh: {input_data.channel_id}")
+                _warn("Không tìm thấy kênh: %s", input_data.channel_id)
             
             return input_data
             
         except Exception as e:
-            logger.error(f"Lỗi khi enrich input data: {str(e)}")
+            _error("Lỗi khi enrich input data: %s", e)
             return input_data
     
     def validate_channel_setup(self, channel_id: str) -> Dict[str, bool]:
@@ -254,21 +594,25 @@ class ChannelManager:
                 result["channel_exists"] = True
             
         except Exception as e:
-            logger.error(f"Lỗi khi validate channel setup: {str(e)}")
+            _error("Lỗi khi validate channel setup: %s", e)
         
         return result
 
 
-    def get_channel_database(self, channel_id: str) -> Optional['ChannelDatabase']:
+    def get_channel_database(self, channel_id: str) -> Optional[ChannelDatabase]:
         """
-        Lấy cấu hình database cho kênh
+        Lấy cấu hình database cho kênh (cache tới khi kênh thay đổi - cùng object
+        nghĩa là cấu hình chưa đổi, nơi gọi có thể dùng lại client đã tạo)
         """
         try:
-            from src.models import ChannelDatabase
+            db_config = self._db_configs.get(channel_id)
+            if db_config is not None:
+                return db_config
+            
             channel = self.get_channel(channel_id)
             
             if channel:
-                return ChannelDatabase(
+                db_config = self._db_configs[channel_id] = ChannelDatabase(
                     channel_id=channel_id,
                     google_sheets_id=channel.google_sheets_id,
                     google_sheet_name=channel.google_sheet_name,
@@ -277,13 +621,37 @@ class ChannelManager:
                     airtable_base_id=channel.airtable_base_id,
                     airtable_table_name=channel.airtable_table_name or "Content"
                 )
+                return db_config
             
             return None
             
         except Exception as e:
-            logger.error(f"Lỗi khi lấy channel database config: {str(e)}")
+            _error("Lỗi khi lấy channel database config: %s", e)
             return None
 
 
-# Singleton instance
-channel_manager = ChannelManager() 
\ No newline at end of file
+_channel_manager_lock = threading.Lock()
+_channel_manager: Optional[ChannelManager] = None
+
+
+def get_channel_manager() -> ChannelManager:
+    """
+    Singleton ChannelManager, tạo ở lần gọi đầu tiên. Đã tạo thì trả về ngay không cần lock,
+    lock chỉ để nhiều thread gọi lần đầu cùng lúc vẫn chỉ tạo một instance.
+    """
+    global _channel_manager
+    if _channel_manager is not None:
+        return _channel_manager
+    with _channel_manager_lock:
+        if _channel_manager is None:
+            _channel_manager = ChannelManager()
+            # Thay đổi còn treo (timer debounce chưa chạy) vẫn được ghi khi process thoát
+            atexit.register(_channel_manager.flush)
+        return _channel_manager
+
+
+def __getattr__(name: str):
+    # Tương thích ngược với `from src.channel_manager import channel_manager`
+    if name == "channel_manager":
+        return get_channel_manager()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
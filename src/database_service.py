@@ -1,20 +1,159 @@
 import gspread
+from gspread.cell import Cell
 from google.oauth2.service_account import Credentials
-from airtable import Airtable
+from requests.adapters import HTTPAdapter
 import pandas as pd
 import asyncio
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import json
 import os
+import random
+import time
 
 from src.models import ContentPackage, DatabaseRecord, GeneratedContent, GeneratedImages, ChannelDatabase
 from config.settings import settings
 import logging
-from src.channel_manager import channel_manager
+from src.channel_manager import get_channel_manager
+from src.airtable_client import AsyncAirtable
 
 logger = logging.getLogger(__name__)
 
+# Airtable cho phép tối đa 10 records mỗi request batch
+_AIRTABLE_BATCH_SIZE = 10
+
+# Gom các row Google Sheets đang chờ ghi: flush sau 2s hoặc khi đủ 50 rows
+_SHEET_FLUSH_DELAY = 2.0
+_SHEET_FLUSH_MAX_ROWS = 50
+# Số lần flush lỗi liên tiếp tối đa của một hàng đợi trước khi bỏ và báo lỗi cho caller
+_FLUSH_MAX_ATTEMPTS = 3
+# Worksheet handle và vị trí ghi được cache, dò lại sau 60s (hoặc khi ghi lỗi)
+_SHEET_CACHE_TTL = 60.0
+# Số range tối đa mỗi request batch_get
+_SHEETS_BATCH_GET_SIZE = 100
+# Số request ghi database chạy song song tối đa khi lưu nhiều package
+_DB_WRITE_CONCURRENCY = 5
+
+# Giới hạn số request Google Sheets đồng thời; lỗi tạm thời (429/5xx) được retry với exponential backoff
+_SHEETS_CONCURRENCY = 10
+_SHEETS_MAX_TRIES = 5
+_RETRY_STATUS_CODES = (429, 500, 502, 503)
+
+
+def _authorize_google(creds):
+    """
+    Tạo gspread client; mọi sheet/kênh dùng chung session của client này, pool kết nối
+    đủ lớn cho số request đồng thời để không phải bắt tay TLS lại
+    """
+    client = gspread.authorize(creds)
+    adapter = HTTPAdapter(pool_connections=_SHEETS_CONCURRENCY, pool_maxsize=_SHEETS_CONCURRENCY)
+    client.session.mount("https://", adapter)
+    return client
+
+
+# Semaphore tạo lười trong event loop đang chạy, tạo lại khi loop đổi (test, reload)
+_sheets_loop: Optional[asyncio.AbstractEventLoop] = None
+_sheets_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def _get_sheets_semaphore() -> asyncio.Semaphore:
+    global _sheets_loop, _sheets_semaphore
+    loop = asyncio.get_running_loop()
+    if _sheets_loop is not loop:
+        _sheets_loop = loop
+        _sheets_semaphore = asyncio.Semaphore(_SHEETS_CONCURRENCY)
+    return _sheets_semaphore
+
+
+async def _sheets_call(fn, *args, **kwargs):
+    """Gọi hàm gspread (blocking) trong thread, retry khi Google trả về lỗi tạm thời"""
+    for attempt in range(_SHEETS_MAX_TRIES):
+        try:
+            async with _get_sheets_semaphore():
+                return await asyncio.to_thread(fn, *args, **kwargs)
+        except gspread.exceptions.APIError as e:
+            status = getattr(e.response, "status_code", None)
+            if status not in _RETRY_STATUS_CODES or attempt == _SHEETS_MAX_TRIES - 1:
+                raise
+            delay = min(2 ** attempt + random.random(), 60)
+            logger.warning(f"Google Sheets trả về {status}, thử lại sau {delay:.1f}s (attempt {attempt + 1})")
+            await asyncio.sleep(delay)
+
+
+# Header sheet YouTube_Content (GoogleSheetsService)
+_SHEETS_HEADERS = (
+    "Package ID", "Channel Name", "Video Title", "Thumbnail Name",
+    "Video Description", "Video Tags", "Thumbnail Image URL",
+    "Video URL", "Status", "Created By", "Created At", "Updated At"
+)
+
+# Header sheet theo format tùy chỉnh của từng kênh
+_CUSTOM_SHEET_HEADERS = (
+    "STT", "Ảnh gen title", "Title Video", "Tên Thumb",
+    "Description", "Tags", "Ảnh Thumb", "Ảnh Select", "Package ID"
+)
+
+# Cột của các field được phép cập nhật trong sheet YouTube_Content (Package ID ở cột A)
+_SHEETS_UPDATE_COLUMNS = {
+    "video_url": 8,    # H: Video URL column
+    "status": 9,       # I: Status column
+    "updated_at": 12   # L: Updated At column
+}
+
+# Tên field Airtable của các field được phép cập nhật
+_AIRTABLE_UPDATE_FIELDS = {
+    "video_url": "Video URL",
+    "status": "Status",
+    "updated_at": "Updated At"
+}
+
+
+# Cột sheet YouTube_Content -> field Airtable khi đồng bộ (các cột khác trong sheet bị bỏ qua)
+_SHEETS_TO_AIRTABLE_FIELDS = {
+    "Package ID": "Package ID",
+    "Channel Name": "Channel Name",
+    "Video Title": "Video Title",
+    "Thumbnail Name": "Thumbnail Name",
+    "Video Description": "Video Description",
+    "Video Tags": "Video Tags",
+    "Thumbnail Image URL": "Thumbnail Image URL",
+    "Video URL": "Video URL",
+    "Status": "Status",
+    "Created By": "Created By",
+    "Created At": "Created At",
+    "Updated At": "Updated At"
+}
+
+# Airtable giới hạn độ dài description; cắt sẵn khi tạo record để Sheets và Airtable dùng chung
+_DESCRIPTION_MAX_CHARS = 1000
+
+# Ký tự bị loại khỏi tag khi lưu (đảm bảo tag là một từ)
+_TAG_STRIP = str.maketrans('', '', ' -.,!?;:')
+
+
+def _chunked(items: List[Any], size: int = _AIRTABLE_BATCH_SIZE):
+    """Chia list thành các phần có tối đa size phần tử"""
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _package_id_formula(package_id: str) -> str:
+    """Formula Airtable khớp Package ID (giá trị được escape dạng chuỗi JSON, an toàn với dấu nháy)"""
+    return f"{{Package ID}} = {json.dumps(package_id)}"
+
+
+def _package_ids_formula(package_ids: List[str]) -> str:
+    """Formula Airtable khớp bất kỳ Package ID nào trong danh sách"""
+    return "OR(" + ",".join(_package_id_formula(package_id) for package_id in package_ids) + ")"
+
+
+def _set_results(futures, result: bool):
+    """Báo kết quả ghi cho các caller đang chờ"""
+    for future in futures:
+        if not future.done():
+            future.set_result(result)
+
+
 
 class GoogleSheetsService:
     """
@@ -26,15 +165,36 @@ class GoogleSheetsService:
         self.sheets_id = settings.google_sheets_id
         self.client = None
         self.worksheet = None
+        # Index package_id -> số row, nạp một lần từ cột Package ID rồi cập nhật dần khi ghi
+        self._row_index: Dict[str, int] = {}
+        self._next_row = 1
+        self._index_loaded = False
+        # Các coroutine gọi đồng thời dùng chung một lần khởi tạo
+        self._init_lock = asyncio.Lock()
+        self._initialized = False
+        
+    async def _ensure_initialized(self):
+        """Khởi tạo kết nối một lần (thành công hoặc thiếu credentials thì không thử lại)"""
+        if self._initialized:
+            return
+        async with self._init_lock:
+            if not self._initialized:
+                await self.initialize()
         
     async def initialize(self):
         """Khởi tạo kết nối Google Sheets"""
+        self._index_loaded = False
+        await asyncio.to_thread(self._connect)
+    
+    def _connect(self):
+        """Kết nối tới Google Sheets (blocking, chạy trong thread)"""
         try:
             # Nếu không có credentials file, chỉ cảnh báo và bỏ qua
             if not self.credentials_file or not os.path.exists(self.credentials_file):
                 logger.warning("Không tìm thấy Google credentials file. Google Sheets sẽ bị vô hiệu hóa.")
                 self.client = None
                 self.worksheet = None
+                self._initialized = True
                 return
             # Định nghĩa scope cho Google Sheets API
             scope = [
@@ -47,7 +207,7 @@ class GoogleSheetsService:
                 scopes=scope
             )
             # Tạo client
-            self.client = gspread.authorize(creds)
+            self.client = _authorize_google(creds)
             # Mở spreadsheet
             spreadsheet = self.client.open_by_key(self.sheets_id)
             # Sử dụng worksheet đầu tiên hoặc tạo mới
@@ -60,12 +220,8 @@ class GoogleSheetsService:
                     cols="12"
                 )
                 # Thêm header
-                headers = [
-                    "Package ID", "Channel Name", "Video Title", "Thumbnail Name",
-                    "Video Description", "Video Tags", "Thumbnail Image URL",
-                    "Video URL", "Status", "Created By", "Created At", "Updated At"
-                ]
-                self.worksheet.append_row(headers)
+                self.worksheet.append_row(list(_SHEETS_HEADERS))
+            self._initialized = True
             logger.info("Đã khởi tạo kết nối Google Sheets thành công")
         except Exception as e:
             logger.error(f"Lỗi khi khởi tạo Google Sheets: {str(e)}")
@@ -77,8 +233,7 @@ class GoogleSheetsService:
     async def save_record(self, record: DatabaseRecord) -> bool:
         """Lưu record vào Google Sheets"""
         try:
-            if not self.worksheet:
-                await self.initialize()
+            await self._ensure_initialized()
             if not self.worksheet:
                 logger.warning("Google Sheets chưa được cấu hình hoặc không khả dụng. Bỏ qua lưu dữ liệu.")
                 return False
@@ -98,7 +253,10 @@ class GoogleSheetsService:
                 record.updated_at
             ]
             # Thêm row vào sheet
-            await asyncio.to_thread(self.worksheet.append_row, row_data)
+            await self._ensure_index()
+            await _sheets_call(self.worksheet.append_row, row_data)
+            self._row_index[record.package_id] = self._next_row
+            self._next_row += 1
             logger.info(f"Đã lưu record vào Google Sheets: {record.package_id}")
             return True
         except Exception as e:
@@ -108,42 +266,86 @@ class GoogleSheetsService:
     async def update_record(self, package_id: str, updates: Dict[str, Any]) -> bool:
         """Cập nhật record trong Google Sheets"""
         try:
-            if not self.worksheet:
-                await self.initialize()
+            await self._ensure_initialized()
             if not self.worksheet:
                 logger.warning("Google Sheets chưa được cấu hình hoặc không khả dụng. Bỏ qua cập nhật dữ liệu.")
                 return False
-            # Tìm row có package_id tương ứng
-            all_records = await asyncio.to_thread(self.worksheet.get_all_records)
-            for i, record in enumerate(all_records, start=2):  # Start=2 vì row 1 là header
-                if record.get("Package ID") == package_id:
-                    # Cập nhật các field
-                    for field, value in updates.items():
-                        col_map = {
-                            "video_url": "H",  # Video URL column
-                            "status": "I",     # Status column
-                            "updated_at": "L"  # Updated At column
-                        }
-                        if field in col_map:
-                            cell = f"{col_map[field]}{i}"
-                            await asyncio.to_thread(self.worksheet.update, cell, value)
-                    logger.info(f"Đã cập nhật record trong Google Sheets: {package_id}")
-                    return True
-            logger.warning(f"Không tìm thấy record để cập nhật: {package_id}")
-            return False
+            # Tìm row có package_id tương ứng: tra index, không có thì tìm phía server
+            await self._ensure_index()
+            row = self._row_index.get(package_id)
+            if row is None:
+                cell = await _sheets_call(self.worksheet.find, package_id, in_column=1)
+                if cell is None:
+                    logger.warning(f"Không tìm thấy record để cập nhật: {package_id}")
+                    return False
+                row = self._row_index[package_id] = cell.row
+            # Cập nhật tất cả field trong một request
+            cells = [
+                Cell(row=row, col=_SHEETS_UPDATE_COLUMNS[field], value=value)
+                for field, value in updates.items()
+                if field in _SHEETS_UPDATE_COLUMNS
+            ]
+            if cells:
+                await _sheets_call(self.worksheet.update_cells, cells, value_input_option='RAW')
+            logger.info(f"Đã cập nhật record trong Google Sheets: {package_id}")
+            return True
         except Exception as e:
             logger.error(f"Lỗi khi cập nhật Google Sheets: {str(e)}")
             return False
     
+    async def _ensure_index(self):
+        """Nạp index package_id -> row từ cột Package ID (chỉ một lần)"""
+        if not self._index_loaded:
+            await self._load_package_id_column()
+    
+    async def _load_package_id_column(self) -> List[str]:
+        """Đọc cột Package ID (cột A) và dựng lại index package_id -> row"""
+        package_ids = await _sheets_call(self.worksheet.col_values, 1)
+        self._row_index = {package_id: row for row, package_id in enumerate(package_ids, start=1) if package_id}
+        self._next_row = len(package_ids) + 1
+        self._index_loaded = True
+        return package_ids
+    
+    async def get_package_id_column(self) -> List[str]:
+        """Lấy cột Package ID (gồm cả header ở row 1) thay vì tải toàn bộ records"""
+        try:
+            await self._ensure_initialized()
+            if not self.worksheet:
+                return []
+            return await self._load_package_id_column()
+        except Exception as e:
+            logger.error(f"Lỗi khi lấy cột Package ID từ Google Sheets: {str(e)}")
+            return []
+    
+    async def get_records_at_rows(self, rows: List[int]) -> List[Dict[str, Any]]:
+        """Lấy riêng các row cần thiết (batch_get theo nhóm 100 range), trả về dict theo header"""
+        try:
+            await self._ensure_initialized()
+            if not self.worksheet or not rows:
+                return []
+            last_col = chr(ord("A") + len(_SHEETS_HEADERS) - 1)
+            records = []
+            for chunk in _chunked(rows, _SHEETS_BATCH_GET_SIZE):
+                value_ranges = await _sheets_call(
+                    self.worksheet.batch_get,
+                    [f"A{row}:{last_col}{row}" for row in chunk]
+                )
+                for value_range in value_ranges:
+                    values = value_range[0] if value_range else []
+                    records.append(dict(zip(_SHEETS_HEADERS, values)))
+            return records
+        except Exception as e:
+            logger.error(f"Lỗi khi lấy rows từ Google Sheets: {str(e)}")
+            return []
+    
     async def get_all_records(self) -> List[Dict[str, Any]]:
         """Lấy tất cả records từ Google Sheets"""
         try:
-            if not self.worksheet:
-                await self.initialize()
+            await self._ensure_initialized()
             if not self.worksheet:
                 logger.warning("Google Sheets chưa được cấu hình hoặc không khả dụng. Trả về danh sách rỗng.")
                 return []
-            records = await asyncio.to_thread(self.worksheet.get_all_records)
+            records = await _sheets_call(self.worksheet.get_all_records)
             return records
         except Exception as e:
             logger.error(f"Lỗi khi lấy records từ Google Sheets: {str(e)}")
@@ -164,7 +366,7 @@ class AirtableService:
     def initialize(self):
         """Khởi tạo kết nối Airtable"""
         try:
-            self.airtable = Airtable(self.base_id, self.table_name, self.api_key)
+            self.airtable = AsyncAirtable(self.base_id, self.table_name, self.api_key)
             logger.info("Đã khởi tạo kết nối Airtable thành công")
             
         except Exception as e:
@@ -194,7 +396,7 @@ class AirtableService:
             }
             
             # Tạo record trong Airtable
-            result = await asyncio.to_thread(self.airtable.insert, airtable_data)
+            result = await self.airtable.insert(airtable_data)
             
             logger.info(f"Đã lưu record vào Airtable: {record.package_id}")
             return result.get("id")
@@ -210,19 +412,14 @@ class AirtableService:
                 self.initialize()
             
             # Chuẩn bị dữ liệu cập nhật
-            update_data = {}
-            field_mapping = {
-                "video_url": "Video URL",
-                "status": "Status",
-                "updated_at": "Updated At"
+            update_data = {
+                _AIRTABLE_UPDATE_FIELDS[field]: value
+                for field, value in updates.items()
+                if field in _AIRTABLE_UPDATE_FIELDS
             }
             
-            for field, value in updates.items():
-                if field in field_mapping:
-                    update_data[field_mapping[field]] = value
-            
             # Cập nhật record
-            await asyncio.to_thread(self.airtable.update, airtable_record_id, update_data)
+            await self.airtable.update(airtable_record_id, update_data)
             
             logger.info(f"Đã cập nhật record trong Airtable: {airtable_record_id}")
             return True
@@ -238,10 +435,11 @@ class AirtableService:
                 self.initialize()
             
             # Tìm kiếm record
-            formula = f"{{Package ID}} = '{package_id}'"
-            records = await asyncio.to_thread(
-                self.airtable.get_all, 
-                formula=formula
+            # Chỉ lấy field Package ID của 1 record để giảm payload
+            records = await self.airtable.get_all(
+                formula=_package_id_formula(package_id),
+                fields=["Package ID"],
+                max_records=1
             )
             
             if records:
@@ -253,44 +451,65 @@ class AirtableService:
             logger.error(f"Lỗi khi tìm record trong Airtable: {str(e)}")
             return None
     
+    async def _get_existing_package_ids(self) -> set:
+        """Lấy một lần tất cả Package ID đã tồn tại trong Airtable"""
+        if not self.airtable:
+            self.initialize()
+        existing = await self.airtable.get_all(fields=["Package ID"])
+        return {r["fields"].get("Package ID") for r in existing}
+    
+    async def _insert_missing_records(self, sheets_records: List[Dict[str, Any]], existing_ids: set) -> int:
+        """Batch insert các records chưa có trong Airtable (10 records/request)"""
+        to_insert = []
+        for sheets_record in sheets_records:
+            package_id = sheets_record.get("Package ID")
+            if not package_id or package_id in existing_ids:
+                continue
+            existing_ids.add(package_id)  # Bỏ qua row trùng Package ID trong sheet
+            to_insert.append({
+                airtable_field: sheets_record.get(column, "")
+                for column, airtable_field in _SHEETS_TO_AIRTABLE_FIELDS.items()
+            })
+        
+        if not to_insert:
+            return 0
+        # Lưu vào Airtable
+        inserted = await self.airtable.batch_insert(to_insert)
+        return len(inserted)
+    
     async def sync_from_sheets(self, sheets_records: List[Dict[str, Any]]) -> int:
-        """Đồng bộ dữ liệu từ Google Sheets sang Airtable"""
+        """
+        Đồng bộ dữ liệu từ Google Sheets sang Airtable.
+        Chỉ 1 lượt đọc danh sách Package ID đã có, rồi batch insert phần còn thiếu (10 records/request).
+        """
         try:
-            if not self.airtable:
-                self.initialize()
-            
-            synced_count = 0
-            
-            for sheets_record in sheets_records:
-                package_id = sheets_record.get("Package ID")
-                if not package_id:
-                    continue
-                
-                # Kiểm tra xem record đã tồn tại trong Airtable chưa
-                existing_record = await self.find_record_by_package_id(package_id)
-                
-                if not existing_record:
-                    # Tạo DatabaseRecord từ sheets_record
-                    db_record = DatabaseRecord(
-                        package_id=package_id,
-                        channel_name=sheets_record.get("Channel Name", ""),
-                        video_title=sheets_record.get("Video Title", ""),
-                        thumbnail_name=sheets_record.get("Thumbnail Name", ""),
-                        video_description=sheets_record.get("Video Description", ""),
-                        video_tags=sheets_record.get("Video Tags", ""),
-                        thumbnail_image_url=sheets_record.get("Thumbnail Image URL", ""),
-                        video_url=sheets_record.get("Video URL", ""),
-                        status=sheets_record.get("Status", ""),
-                        created_by=sheets_record.get("Created By", ""),
-                        created_at=sheets_record.get("Created At", ""),
-                        updated_at=sheets_record.get("Updated At", "")
-                    )
-                    
-                    # Lưu vào Airtable
-                    airtable_id = await self.save_record(db_record)
-                    if airtable_id:
-                        synced_count += 1
+            existing_ids = await self._get_existing_package_ids()
+            synced_count = await self._insert_missing_records(sheets_records, existing_ids)
+            logger.info(f"Đã đồng bộ {synced_count} records từ Sheets sang Airtable")
+            return synced_count
             
+        except Exception as e:
+            logger.error(f"Lỗi khi đồng bộ từ Sheets: {str(e)}")
+            return 0
+    
+    async def sync_from_sheets_service(self, sheets_service: GoogleSheetsService) -> int:
+        """
+        Đồng bộ trực tiếp từ GoogleSheetsService mà không tải toàn bộ sheet:
+        chỉ đọc cột Package ID, rồi lấy riêng các row còn thiếu trong Airtable.
+        """
+        try:
+            existing_ids = await self._get_existing_package_ids()
+            package_ids = await sheets_service.get_package_id_column()
+            
+            missing_rows = []
+            seen = set(existing_ids)
+            for row, package_id in enumerate(package_ids[1:], start=2):  # Row 1 là header
+                if package_id and package_id not in seen:
+                    seen.add(package_id)
+                    missing_rows.append(row)
+            
+            sheets_records = await sheets_service.get_records_at_rows(missing_rows)
+            synced_count = await self._insert_missing_records(sheets_records, existing_ids)
             logger.info(f"Đã đồng bộ {synced_count} records từ Sheets sang Airtable")
             return synced_count
             
@@ -307,7 +526,29 @@ class DatabaseManager:
     
     def __init__(self):
         self.google_client = None
-        self.airtable_clients: Dict[str, Airtable] = {}  # channel_id -> Airtable client
+        self.airtable_clients: Dict[str, AsyncAirtable] = {}  # channel_id -> Airtable client
+        self._airtable_client_configs: Dict[str, ChannelDatabase] = {}  # Cấu hình đã dùng để tạo client
+        
+        # Hàng đợi ghi Google Sheets theo kênh: channel_id -> [(row, future báo kết quả cho caller)]
+        self._pending_rows: Dict[str, List[Tuple[List[Any], asyncio.Future]]] = {}
+        # Các lệnh cập nhật range đang chờ, ghi gộp bằng một batch_update: channel_id -> [({range, values}, future)]
+        self._pending_sheet_updates: Dict[str, List[Tuple[Dict[str, Any], asyncio.Future]]] = {}
+        self._sheet_locks: Dict[str, asyncio.Lock] = {}
+        # Trạng thái sheet đã dò: channel_id -> [row ghi tiếp theo, STT tiếp theo, thời điểm dò]
+        self._sheet_state: Dict[str, List[Any]] = {}
+        self._header_checked: set = set()  # ID các worksheet đã đảm bảo có header
+        self._sheet_resync: set = set()  # Kênh cần dò lại vị trí ghi trước lần flush tới (sau khi ghi lỗi)
+        self._worksheets: Dict[str, Tuple[Any, float, ChannelDatabase]] = {}  # channel_id -> (worksheet, thời điểm mở, cấu hình)
+        self._sheet_flush_task: Optional[asyncio.Task] = None
+        # Số lần flush lỗi liên tiếp: (loại hàng đợi, channel_id) -> số lần
+        self._flush_failures: Dict[Tuple[str, str], int] = {}
+        # Ghi Airtable đang chờ, gửi theo batch 10 records: channel_id -> {package_id: (fields, futures)}
+        self._airtable_pending: Dict[str, Dict[str, Tuple[Dict[str, Any], List[asyncio.Future]]]] = {}
+        self._airtable_locks: Dict[str, asyncio.Lock] = {}
+        # Airtable record id đã biết: channel_id -> {package_id: record_id}
+        self._airtable_record_ids: Dict[str, Dict[str, str]] = {}
+        # Tra cứu row theo kênh: channel_id -> (thời điểm đọc, package_id -> row, video_title -> row)
+        self._sheet_lookups: Dict[str, Tuple[float, Dict[str, int], Dict[str, int]]] = {}
         self._setup_google_sheets()
     
     def _setup_google_sheets(self):
@@ -326,7 +567,7 @@ class DatabaseManager:
                     scopes=scope
                 )
                 
-                self.google_client = gspread.authorize(creds)
+                self.google_client = _authorize_google(creds)
                 logger.info("Đã kết nối Google Sheets thành công")
             else:
                 logger.warning("Không tìm thấy Google credentials file")
@@ -334,17 +575,17 @@ class DatabaseManager:
         except Exception as e:
             logger.error(f"Lỗi khi setup Google Sheets: {str(e)}")
     
-    def _get_airtable_client(self, channel_id: str) -> Optional[Airtable]:
+    def _get_airtable_client(self, channel_id: str) -> Optional[AsyncAirtable]:
         """
         Lấy Airtable client cho kênh cụ thể
         """
         try:
-            # Kiểm tra cache
-            if channel_id in self.airtable_clients:
-                return self.airtable_clients[channel_id]
+            # Lấy cấu hình database cho kênh (đã cache trong channel manager)
+            db_config = get_channel_manager().get_channel_database(channel_id)
             
-            # Lấy cấu hình database cho kênh
-            db_config = channel_manager.get_channel_database(channel_id)
+            # Dùng lại client nếu cấu hình kênh chưa đổi từ lần tạo trước
+            if channel_id in self.airtable_clients and self._airtable_client_configs.get(channel_id) is db_config:
+                return self.airtable_clients[channel_id]
             
             if not db_config or not db_config.airtable_base_id:
                 logger.warning(f"Không có cấu hình Airtable cho kênh: {channel_id}")
@@ -355,7 +596,7 @@ class DatabaseManager:
                 return None
             
             # Tạo client mới
-            client = Airtable(
+            client = AsyncAirtable(
                 base_id=db_config.airtable_base_id,
                 table_name=db_config.airtable_table_name,
                 api_key=settings.airtable_api_key
@@ -363,6 +604,7 @@ class DatabaseManager:
             
             # Cache client
             self.airtable_clients[channel_id] = client
+            self._airtable_client_configs[channel_id] = db_config
             logger.info(f"Đã tạo Airtable client cho kênh: {channel_id}")
             
             return client
@@ -373,14 +615,36 @@ class DatabaseManager:
     
     def _get_google_sheet(self, channel_id: str):
         """
-        Lấy Google Sheet cho kênh cụ thể - hỗ trợ URL với GID và multi-sheet
+        Lấy Google Sheet cho kênh cụ thể (cache handle trong _SHEET_CACHE_TTL giây,
+        mở lại ngay nếu cấu hình database của kênh thay đổi)
+        """
+        db_config = get_channel_manager().get_channel_database(channel_id)
+        cached = self._worksheets.get(channel_id)
+        if cached and cached[2] is db_config and time.monotonic() - cached[1] < _SHEET_CACHE_TTL:
+            return cached[0]
+        if cached and cached[2] is not db_config and not self._pending_rows.get(channel_id):
+            # Kênh đổi sheet: vị trí ghi cũ không còn đúng
+            self._sheet_state.pop(channel_id, None)
+        
+        worksheet = self._open_google_sheet(channel_id, db_config)
+        if worksheet:
+            self._worksheets[channel_id] = (worksheet, time.monotonic(), db_config)
+        return worksheet
+    
+    def _invalidate_google_sheet(self, channel_id: str):
+        """Bỏ cache worksheet và vị trí ghi của kênh (khi ghi lỗi)"""
+        self._worksheets.pop(channel_id, None)
+        self._sheet_state.pop(channel_id, None)
+        self._sheet_resync.discard(channel_id)
+    
+    def _open_google_sheet(self, channel_id: str, db_config: Optional[ChannelDatabase]):
+        """
+        Mở Google Sheet cho kênh cụ thể - hỗ trợ URL với GID và multi-sheet
         """
         try:
             if not self.google_client:
                 return None
             
-            # Lấy cấu hình database cho kênh
-            db_config = channel_manager.get_channel_database(channel_id)
             logger.info(f"Debug - Channel ID: {channel_id}, DB Config: {db_config}")
             
             # Parse Google Sheet URL hoặc sử dụng ID trực tiếp
@@ -464,17 +728,16 @@ class DatabaseManager:
                 # Fallback về thumbnail_url đơn lẻ
                 thumbnail_image_url = package.generated_images.thumbnail_url
         
+        content = package.generated_content
+        
         # Clean tags before saving to database (ensure single-word format)
-        cleaned_tags = []
-        if package.generated_content and package.generated_content.tags:
-            for tag in package.generated_content.tags:
-                if tag and isinstance(tag, str):
-                    # Remove any remaining spaces, punctuation, and convert to single word
-                    clean_tag = tag.strip().lower()
-                    clean_tag = clean_tag.replace(" ", "").replace("-", "").replace(".", "").replace(",", "")
-                    clean_tag = clean_tag.replace("!", "").replace("?", "").replace(";", "").replace(":", "")
-                    if clean_tag and len(clean_tag) > 1:
-                        cleaned_tags.append(clean_tag)
+        cleaned_tags = [
+            clean_tag for clean_tag in (
+                tag.strip().lower().translate(_TAG_STRIP)
+                for tag in (content.tags if content else [])
+                if tag and isinstance(tag, str)
+            ) if len(clean_tag) > 1
+        ]
         
         # Lấy selected_image_url từ generated_images
         selected_image_url = ""
@@ -485,17 +748,17 @@ class DatabaseManager:
             package_id=package.id,
             channel_id=package.channel_id,
             channel_name=package.input_data.channel_name or "Unknown Channel",
-            video_title=package.generated_content.title if package.generated_content else "No Title",
-            thumbnail_name=package.generated_content.thumbnail_name if package.generated_content else "No Thumbnail",
-            video_description=package.generated_content.description if package.generated_content else "No Description",
+            video_title=content.title if content else "No Title",
+            thumbnail_name=content.thumbnail_name if content else "No Thumbnail",
+            video_description=(content.description if content else "No Description")[:_DESCRIPTION_MAX_CHARS],
             video_tags=", ".join(cleaned_tags),
             thumbnail_image_url=thumbnail_image_url,
             selected_image_url=selected_image_url,
-            video_url=package.youtube_data.video_url if package.youtube_data else "",
+            video_url=(package.youtube_data.video_url if package.youtube_data else None) or "",
             status=package.status.value,
             created_by=package.input_data.created_by,
-            created_at=package.created_at.isoformat(),
-            updated_at=package.updated_at.isoformat()
+            created_at=package.created_at_iso,
+            updated_at=package.updated_at_iso
         )
     
     async def save_content_package(self, package: ContentPackage) -> bool:
@@ -508,14 +771,15 @@ class DatabaseManager:
             # Chuyển package thành record
             record = self._package_to_record(package)
             
-            # Lưu vào Google Sheets
-            google_success = await self._save_to_google_sheets(package.channel_id, record)
-            
-            # Lưu vào Airtable của kênh tương ứng
-            airtable_success = await self._save_to_airtable(package.channel_id, record)
+            # Lưu song song vào Google Sheets và Airtable của kênh tương ứng
+            results = await asyncio.gather(
+                self._save_to_google_sheets(package.channel_id, record),
+                self._save_to_airtable(package.channel_id, record),
+                return_exceptions=True
+            )
             
             # Thành công nếu ít nhất 1 database lưu được
-            success = google_success or airtable_success
+            success = any(result is True for result in results)
             
             if success:
                 logger.info(f"Đã lưu package {package.id} thành công")
@@ -528,116 +792,313 @@ class DatabaseManager:
             logger.error(f"Lỗi khi lưu content package: {str(e)}")
             return False
     
+    async def save_content_packages(self, packages: List[ContentPackage]) -> int:
+        """
+        Lưu nhiều ContentPackage cùng lúc: Google Sheets xếp hàng tất cả rows rồi flush ngay
+        theo kênh, Airtable gom theo kênh để insert theo batch (tối đa _DB_WRITE_CONCURRENCY
+        batch song song). Trả về số package lưu được.
+        """
+        records_by_channel: Dict[str, List[DatabaseRecord]] = {}
+        for package in packages:
+            records_by_channel.setdefault(package.channel_id, []).append(self._package_to_record(package))
+        
+        semaphore = asyncio.Semaphore(_DB_WRITE_CONCURRENCY)
+        saved_ids = set()
+        
+        async def save_sheet_rows(channel_id: str, records: List[DatabaseRecord]):
+            futures = [await self._queue_sheet_row(channel_id, record) for record in records]
+            await self.flush_sheet_rows(channel_id)
+            for record, future in zip(records, futures):
+                if future is not None and await future:
+                    saved_ids.add(record.package_id)
+        
+        async def save_airtable_batch(channel_id: str, records: List[DatabaseRecord]):
+            async with semaphore:
+                if await self._save_to_airtable_batch(channel_id, records) == len(records):
+                    saved_ids.update(record.package_id for record in records)
+        
+        tasks = [
+            save_sheet_rows(channel_id, records)
+            for channel_id, records in records_by_channel.items()
+        ]
+        tasks.extend(
+            save_airtable_batch(channel_id, records)
+            for channel_id, records in records_by_channel.items()
+        )
+        for result in await asyncio.gather(*tasks, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"Lỗi khi lưu packages: {str(result)}")
+        
+        logger.info(f"Đã lưu {len(saved_ids)}/{len(packages)} packages")
+        return len(saved_ids)
+    
+    def _get_sheet_lock(self, channel_id: str) -> asyncio.Lock:
+        """Lock theo kênh để dò header, xếp hàng và flush rows không chen nhau"""
+        lock = self._sheet_locks.get(channel_id)
+        if lock is None:
+            lock = self._sheet_locks[channel_id] = asyncio.Lock()
+        return lock
+    
+    async def _ensure_header(self, worksheet):
+        """
+        Đảm bảo worksheet có header theo format tùy chỉnh (chỉ quét toàn sheet một lần cho mỗi worksheet)
+        """
+        if worksheet.id in self._header_checked:
+            return
+        
+        all_values = await _sheets_call(worksheet.get_all_values)
+        
+        # Tìm header thực tế (có chứa "STT" và "Title Video") thay vì chỉ row 1
+        header_found = False
+        for i, row in enumerate(all_values):
+            if len(row) >= 3 and "STT" in str(row[0]) and "Title Video" in str(row[2]):
+                header_found = True
+                logger.info(f"📋 Found existing header at row {i+1}: {row[:3]}")
+                break
+        
+        if not header_found:
+            # Chỉ tạo header mới nếu thực sự không có, và KHÔNG clear dữ liệu
+            logger.info("📋 No proper header found, adding header to existing data")
+            headers = list(_CUSTOM_SHEET_HEADERS)
+            # Insert header ở đầu nếu sheet trống, hoặc tìm vị trí phù hợp
+            if len(all_values) == 0:
+                await _sheets_call(worksheet.append_row, headers)
+            else:
+                # Tìm vị trí trống để insert header
+                insert_pos = 1
+                for i, row in enumerate(all_values):
+                    if not any(cell.strip() for cell in row if cell):  # Row trống
+                        insert_pos = i + 1
+                        break
+                await _sheets_call(worksheet.insert_row, headers, insert_pos)
+                logger.info(f"📋 Inserted header at row {insert_pos}")
+        
+        self._header_checked.add(worksheet.id)
+    
+    async def _probe_sheet_state(self, worksheet) -> List[Any]:
+        """
+        Dò vị trí ghi: [row ghi tiếp theo, STT tiếp theo, thời điểm dò].
+        Chỉ đọc cột A (STT) thay vì toàn bộ sheet.
+        """
+        await self._ensure_header(worksheet)
+        col_a = await _sheets_call(worksheet.col_values, 1)
+        max_stt = max((int(value) for value in col_a if value.isdigit()), default=0)
+        logger.info(f"Calculated next STT: {max_stt + 1} (from {len(col_a)} rows)")
+        return [len(col_a) + 1, max_stt + 1, time.monotonic()]
+    
     async def _save_to_google_sheets_custom_format(self, channel_id: str, record: DatabaseRecord) -> bool:
         """
         Lưu record vào Google Sheets với format tùy chỉnh của user
         Cấu trúc: STT | Ảnh gen title | Title Video | Tên Thumb | Description | Tags | Ảnh Thumb
+        Row chỉ có một mình trong hàng đợi thì ghi ngay; khi đang có lượt ghi khác hoặc rows khác
+        đang chờ thì ghi theo lô bởi flush_sheet_rows (sau 2s hoặc khi đủ 50 rows).
+        Trả về kết quả thực tế của lần ghi chứa row này.
+        """
+        # Lock đang bị giữ: có lượt ghi khác đang chạy, row này gộp vào lô kế tiếp
+        flush_in_flight = self._get_sheet_lock(channel_id).locked()
+        future = await self._queue_sheet_row(channel_id, record)
+        if future is None:
+            return False
+        
+        pending_count = len(self._pending_rows.get(channel_id, ()))
+        if pending_count >= _SHEET_FLUSH_MAX_ROWS or (pending_count == 1 and not flush_in_flight):
+            # Lưu đơn lẻ (tương tác) không phải chờ _SHEET_FLUSH_DELAY
+            await self.flush_sheet_rows(channel_id)
+        else:
+            self._schedule_flush()
+        return await future
+    
+    async def _queue_sheet_row(self, channel_id: str, record: DatabaseRecord) -> Optional[asyncio.Future]:
+        """
+        Cấp STT và đưa row vào hàng đợi ghi của kênh.
+        Trả về future nhận kết quả ghi, None nếu không mở được sheet.
         """
         try:
             worksheet = self._get_google_sheet(channel_id)
             
             if not worksheet:
-                return False
+                return None
             
-            # Kiểm tra header có tồn tại không - tìm header thực tế thay vì chỉ row 1
-            all_values = worksheet.get_all_values()
-            header_found = False
-            header_row_index = -1
-            
-            # Tìm header thực tế (có chứa "STT" và "Title Video")
-            for i, row in enumerate(all_values):
-                if len(row) >= 3 and "STT" in str(row[0]) and "Title Video" in str(row[2]):
-                    header_found = True
-                    header_row_index = i
-                    logger.info(f"📋 Found existing header at row {i+1}: {row[:3]}")
-                    break
-            
-            if not header_found:
-                # Chỉ tạo header mới nếu thực sự không có, và KHÔNG clear dữ liệu
-                logger.info("📋 No proper header found, adding header to existing data")
-                headers = [
-                    "STT", "Ảnh gen title", "Title Video", "Tên Thumb", 
-                    "Description", "Tags", "Ảnh Thumb", "Ảnh Select", "Package ID"
+            async with self._get_sheet_lock(channel_id):
+                state = self._sheet_state.get(channel_id)
+                # Dò lại khi hết hạn cache, nhưng chỉ khi không còn row chờ (STT đã cấp theo state cũ)
+                if state is None or (
+                    time.monotonic() - state[2] >= _SHEET_CACHE_TTL and not self._pending_rows.get(channel_id)
+                ):
+                    state = self._sheet_state[channel_id] = await self._probe_sheet_state(worksheet)
+                
+                stt = state[1]
+                state[1] += 1
+                
+                # Tạo dữ liệu theo format của user + package_id ẩn để tracking
+                row_data = [
+                    stt,                                                    # A: STT
+                    record.thumbnail_image_url,                             # B: Ảnh gen title (tạm dùng thumbnail URL)
+                    record.video_title,                                     # C: Title Video
+                    record.thumbnail_name,                                  # D: Tên Thumb  
+                    record.video_description,                               # E: Description (đã giới hạn 1000 ký tự)
+                    record.video_tags,                                      # F: Tags
+                    record.thumbnail_image_url,                             # G: Ảnh Thumb
+                    record.selected_image_url,                              # H: Ảnh Select
+                    record.package_id                                       # I: Package ID (ẩn để tracking)
                 ]
-                # Insert header ở đầu nếu sheet trống, hoặc tìm vị trí phù hợp
-                if len(all_values) == 0:
-                    worksheet.append_row(headers)
-                else:
-                    # Tìm vị trí trống để insert header
-                    insert_pos = 1
-                    for i, row in enumerate(all_values):
-                        if not any(cell.strip() for cell in row if cell):  # Row trống
-                            insert_pos = i + 1
-                            break
-                    worksheet.insert_row(headers, insert_pos)
-                    logger.info(f"📋 Inserted header at row {insert_pos}")
-            else:
-                logger.info(f"📋 Using existing header at row {header_row_index + 1}")
+                future = asyncio.get_running_loop().create_future()
+                self._pending_rows.setdefault(channel_id, []).append((row_data, future))
             
-            # Tính STT (số thứ tự) dựa trên dữ liệu hiện có (sử dụng all_values đã load)
-            stt = self._calculate_next_stt_from_values(all_values)
+            logger.info(f"📝 Queued row STT={stt}, Title='{record.video_title[:50]}...' for channel {channel_id}")
+            return future
             
-            # Log thông tin worksheet để debug
-            worksheet_title = worksheet.title
-            worksheet_id = worksheet.id
-            logger.info(f"📊 Saving to worksheet: '{worksheet_title}' (ID: {worksheet_id}, GID: {worksheet_id}) for channel: {channel_id}")
-            
-            # Tạo dữ liệu theo format của user + package_id ẩn để tracking
-            row_data = [
-                stt,                                                    # A: STT
-                record.thumbnail_image_url or "",                       # B: Ảnh gen title (tạm dùng thumbnail URL)
-                record.video_title,                                     # C: Title Video
-                record.thumbnail_name,                                  # D: Tên Thumb  
-                record.video_description[:1000],                       # E: Description (giới hạn 1000 ký tự)
-                record.video_tags,                                      # F: Tags
-                record.thumbnail_image_url or "",                       # G: Ảnh Thumb
-                record.selected_image_url or "",                        # H: Ảnh Select
-                record.package_id                                       # I: Package ID (ẩn để tracking)
-            ]
-            
-            logger.info(f"📝 Appending row with STT={stt}, Title='{record.video_title[:50]}...' to sheet '{worksheet_title}'")
-            
-            # Debug: Current state
-            logger.info(f"🔍 Current sheet state: {len(all_values)} rows, last row: {all_values[-1][:3] if all_values else 'EMPTY'}")
-            
-            # Thay vì append_row, dùng insert vào vị trí cụ thể để tránh confusion do multiple headers
-            current_rows = len(all_values)
-            target_row = current_rows + 1
-            
-            logger.info(f"📍 Inserting at specific row {target_row} to avoid header confusion")
-            logger.info(f"🎯 Row data to insert: {row_data[:3]}...")
+        except Exception as e:
+            logger.error(f"Lỗi khi lưu vào Google Sheets (custom format) cho kênh {channel_id}: {str(e)}")
+            if not self._pending_rows.get(channel_id):
+                self._invalidate_google_sheet(channel_id)
+            return None
+    
+    def _schedule_flush(self):
+        """Hẹn flush toàn bộ hàng đợi (Sheets + Airtable) sau _SHEET_FLUSH_DELAY giây (nếu chưa hẹn)"""
+        if self._sheet_flush_task is None or self._sheet_flush_task.done():
+            self._sheet_flush_task = asyncio.create_task(self._delayed_flush())
+    
+    async def _delayed_flush(self):
+        # Lặp đến khi hết dữ liệu chờ: gồm cả phần flush lỗi được trả về hàng đợi để thử lại
+        while True:
+            await asyncio.sleep(_SHEET_FLUSH_DELAY)
+            await self.flush_all()
+            if not self._has_pending_writes():
+                return
+    
+    def _has_pending_writes(self) -> bool:
+        return any(self._pending_rows.values()) or any(self._pending_sheet_updates.values()) \
+            or any(self._airtable_pending.values())
+    
+    def _retry_flush(self, kind: str, channel_id: str) -> bool:
+        """
+        Đếm lần flush lỗi liên tiếp của hàng đợi. True: còn lượt thử (đã hẹn flush lại),
+        False: đã hết _FLUSH_MAX_ATTEMPTS lần, caller phải bỏ dữ liệu và báo lỗi.
+        """
+        key = (kind, channel_id)
+        attempts = self._flush_failures.get(key, 0) + 1
+        if attempts < _FLUSH_MAX_ATTEMPTS:
+            self._flush_failures[key] = attempts
+            self._schedule_flush()
+            return True
+        self._flush_failures.pop(key, None)
+        return False
+    
+    async def flush_all(self):
+        """Ghi tất cả dữ liệu đang chờ vào Google Sheets và Airtable (gọi khi shutdown)"""
+        await self.flush_all_sheet_rows()
+        await self.flush_all_airtable()
+    
+    async def flush_all_sheet_rows(self):
+        """Ghi tất cả rows và cập nhật Google Sheets đang chờ của mọi kênh"""
+        for channel_id in list(self._pending_rows):
+            await self.flush_sheet_rows(channel_id)
+        for channel_id in list(self._pending_sheet_updates):
+            await self.flush_sheet_updates(channel_id)
+    
+    async def flush_sheet_rows(self, channel_id: str) -> bool:
+        """
+        Ghi các rows đang chờ của kênh bằng một request insert_rows,
+        chèn ngay sau dữ liệu hiện có để tránh nhầm lẫn do nhiều header
+        """
+        async with self._get_sheet_lock(channel_id):
+            entries = self._pending_rows.pop(channel_id, None)
+            if not entries:
+                return True
+            rows = [row for row, _ in entries]
             
-            # Insert vào row cụ thể
             try:
-                await asyncio.to_thread(
-                    worksheet.insert_row, 
-                    row_data, 
-                    target_row
+                worksheet = self._get_google_sheet(channel_id)
+                if not worksheet:
+                    raise RuntimeError("Không mở được worksheet")
+                
+                state = self._sheet_state.get(channel_id)
+                if state is None or channel_id in self._sheet_resync:
+                    # Lần ghi trước lỗi: lấy lại row cuối thực tế, STT không lùi vì rows chờ đã được cấp STT
+                    probed = await self._probe_sheet_state(worksheet)
+                    if state is None:
+                        state = self._sheet_state[channel_id] = probed
+                    else:
+                        state[0] = probed[0]
+                        state[1] = max(state[1], probed[1])
+                    self._sheet_resync.discard(channel_id)
+                
+                await _sheets_call(
+                    worksheet.insert_rows,
+                    rows,
+                    state[0],
+                    value_input_option='RAW'
                 )
-                logger.info(f"✅ insert_row completed successfully")
+                logger.info(f"✅ Saved {len(rows)} rows to Google Sheets for channel {channel_id} in sheet '{worksheet.title}' at row {state[0]}")
+                state[0] += len(rows)
+                self._sheet_lookups.pop(channel_id, None)
+                self._flush_failures.pop(("rows", channel_id), None)
+                _set_results((future for _, future in entries), True)
+                return True
                 
-                # Verify result (refresh data)
-                all_values_after = worksheet.get_all_values() 
-                logger.info(f"🔍 AFTER insert: {len(all_values_after)} rows (was {current_rows})")
-                if len(all_values_after) > current_rows:
-                    logger.info(f"✅ Row count increased! Last row: {all_values_after[-1][:3]}")
+            except Exception as e:
+                self._worksheets.pop(channel_id, None)
+                if self._retry_flush("rows", channel_id):
+                    # Trả rows về hàng đợi để lần flush sau ghi lại (mở lại worksheet, giữ vị trí ghi vì STT đã cấp)
+                    self._pending_rows[channel_id] = entries + self._pending_rows.get(channel_id, [])
+                    self._sheet_resync.add(channel_id)
+                    logger.error(f"Lỗi khi ghi {len(rows)} rows vào Google Sheets cho kênh {channel_id}, sẽ thử lại: {str(e)}")
                 else:
-                    logger.error(f"❌ Row count did NOT increase! Possible conflict or error.")
-                    # Log all rows for debugging
-                    for i, row in enumerate(all_values_after[-5:], len(all_values_after)-4):
-                        logger.error(f"   Row {i}: {row[:3]}")
-                    
-            except Exception as insert_error:
-                logger.error(f"❌ insert_row failed: {insert_error}")
-                raise insert_error
-            
-            logger.info(f"✅ Successfully saved to Google Sheets (custom format) for channel {channel_id} in sheet '{worksheet_title}' at row {target_row}")
-            return True
-            
-        except Exception as e:
-            logger.error(f"Lỗi khi lưu vào Google Sheets (custom format) cho kênh {channel_id}: {str(e)}")
-            return False
+                    # Hết lượt thử: bỏ rows, STT đã cấp không còn đúng nên dò lại từ đầu
+                    _set_results((future for _, future in entries), False)
+                    self._invalidate_google_sheet(channel_id)
+                    logger.error(f"Bỏ {len(rows)} rows Google Sheets của kênh {channel_id} sau {_FLUSH_MAX_ATTEMPTS} lần ghi lỗi: {str(e)}")
+                return False
 
+    async def _queue_sheet_update(self, channel_id: str, cell_range: str, values: List[List[Any]],
+                                  flush_now: bool = False) -> bool:
+        """
+        Đưa một lệnh cập nhật range vào hàng đợi rồi chờ kết quả ghi.
+        Ghi ngay khi flush_now hoặc đủ _SHEET_FLUSH_MAX_ROWS lệnh, không thì chờ lượt flush hẹn giờ.
+        """
+        async with self._get_sheet_lock(channel_id):
+            future = asyncio.get_running_loop().create_future()
+            pending = self._pending_sheet_updates.setdefault(channel_id, [])
+            pending.append(({"range": cell_range, "values": values}, future))
+            pending_count = len(pending)
+        
+        if flush_now or pending_count >= _SHEET_FLUSH_MAX_ROWS:
+            await self.flush_sheet_updates(channel_id)
+        else:
+            self._schedule_flush()
+        return await future
+    
+    async def flush_sheet_updates(self, channel_id: str) -> bool:
+        """Ghi các lệnh cập nhật đang chờ của kênh bằng một request batch_update"""
+        async with self._get_sheet_lock(channel_id):
+            entries = self._pending_sheet_updates.pop(channel_id, None)
+            if not entries:
+                return True
+            updates = [update for update, _ in entries]
+            
+            try:
+                worksheet = self._get_google_sheet(channel_id)
+                if not worksheet:
+                    raise RuntimeError("Không mở được worksheet")
+                
+                await _sheets_call(worksheet.batch_update, updates, value_input_option='RAW')
+                logger.info(f"✅ Applied {len(updates)} updates to Google Sheets for channel {channel_id}")
+                self._flush_failures.pop(("updates", channel_id), None)
+                _set_results((future for _, future in entries), True)
+                return True
+                
+            except Exception as e:
+                self._worksheets.pop(channel_id, None)
+                if self._retry_flush("updates", channel_id):
+                    # Trả về hàng đợi, lệnh mới hơn vẫn đứng sau để giữ thứ tự ghi
+                    self._pending_sheet_updates[channel_id] = entries + self._pending_sheet_updates.get(channel_id, [])
+                    logger.error(f"Lỗi khi cập nhật {len(updates)} range trong Google Sheets cho kênh {channel_id}, sẽ thử lại: {str(e)}")
+                else:
+                    _set_results((future for _, future in entries), False)
+                    logger.error(f"Bỏ {len(updates)} cập nhật Google Sheets của kênh {channel_id} sau {_FLUSH_MAX_ATTEMPTS} lần ghi lỗi: {str(e)}")
+                return False
+    
     async def _save_to_google_sheets(self, channel_id: str, record: DatabaseRecord) -> bool:
         """
         Lưu record vào Google Sheets - sử dụng format tùy chỉnh của user
@@ -645,41 +1106,57 @@ class DatabaseManager:
         # Ưu tiên sử dụng format tùy chỉnh
         return await self._save_to_google_sheets_custom_format(channel_id, record)
     
+    def _record_to_airtable_fields(self, record: DatabaseRecord) -> Dict[str, Any]:
+        """
+        Chuẩn bị data cho Airtable từ DatabaseRecord
+        """
+        return {
+            "Package ID": record.package_id,
+            "Channel ID": record.channel_id,
+            "Channel Name": record.channel_name,
+            "Video Title": record.video_title,
+            "Thumbnail Name": record.thumbnail_name,
+            "Video Description": record.video_description,  # Đã cắt theo giới hạn Airtable
+            "Video Tags": record.video_tags,
+            "Thumbnail Image URL": record.thumbnail_image_url,
+            "Video URL": record.video_url,
+            "Status": record.status,
+            "Created By": record.created_by,
+            "Created At": record.created_at,
+            "Updated At": record.updated_at
+        }
+    
     async def _save_to_airtable(self, channel_id: str, record: DatabaseRecord) -> bool:
         """
         Lưu record vào Airtable của kênh
         """
+        return await self._save_to_airtable_batch(channel_id, [record]) == 1
+    
+    async def _save_to_airtable_batch(self, channel_id: str, records: List[DatabaseRecord]) -> int:
+        """
+        Lưu nhiều records vào Airtable của kênh, mỗi request insert tối đa 10 records.
+        Trả về số records đã lưu.
+        """
         try:
             airtable_client = self._get_airtable_client(channel_id)
             
             if not airtable_client:
-                return False
+                return 0
             
-            # Chuẩn bị data cho Airtable
-            airtable_data = {
-                "Package ID": record.package_id,
-                "Channel ID": record.channel_id,
-                "Channel Name": record.channel_name,
-                "Video Title": record.video_title,
-                "Thumbnail Name": record.thumbnail_name,
-                "Video Description": record.video_description[:1000],  # Airtable limit
-                "Video Tags": record.video_tags,
-                "Thumbnail Image URL": record.thumbnail_image_url,
-                "Video URL": record.video_url or "",
-                "Status": record.status,
-                "Created By": record.created_by,
-                "Created At": record.created_at,
-                "Updated At": record.updated_at
-            }
+            saved = 0
+            for chunk in _chunked(records):
+                inserted = await airtable_client.batch_insert(
+                    [self._record_to_airtable_fields(record) for record in chunk]
+                )
+                self._remember_airtable_ids(channel_id, inserted)
+                saved += len(inserted)
             
-            # Insert vào Airtable
-            await asyncio.to_thread(airtable_client.insert, airtable_data)
-            logger.info(f"Đã lưu vào Airtable cho kênh {channel_id}")
-            return True
+            logger.info(f"Đã lưu {saved} records vào Airtable cho kênh {channel_id}")
+            return saved
             
         except Exception as e:
             logger.error(f"Lỗi khi lưu vào Airtable cho kênh {channel_id}: {str(e)}")
-            return False
+            return 0
     
     async def update_content_package(self, package: ContentPackage) -> bool:
         """
@@ -691,11 +1168,14 @@ class DatabaseManager:
             # Chuyển package thành record
             record = self._package_to_record(package)
             
-            # Cập nhật trong cả 2 databases
-            google_success = await self._update_in_google_sheets(package.channel_id, record)
-            airtable_success = await self._update_in_airtable(package.channel_id, record)
+            # Cập nhật song song trong cả 2 databases
+            results = await asyncio.gather(
+                self._update_in_google_sheets(package.channel_id, record),
+                self._update_in_airtable(package.channel_id, record),
+                return_exceptions=True
+            )
             
-            success = google_success or airtable_success
+            success = any(result is True for result in results)
             
             if success:
                 logger.info(f"Đã cập nhật package {package.id} thành công")
@@ -713,34 +1193,25 @@ class DatabaseManager:
         try:
             logger.info(f"Cập nhật ảnh được chọn cho package {package_id} trong kênh {channel_id}")
             
+            # Row của package có thể vẫn nằm trong hàng đợi
+            await self.flush_sheet_rows(channel_id)
+            
             worksheet = self._get_google_sheet(channel_id)
             if not worksheet:
                 logger.warning(f"Không tìm thấy worksheet cho kênh {channel_id}")
                 return False
             
-            # Tìm row dựa trên package_id
-            all_values = worksheet.get_all_values()
-            target_row_num = None
-            
-            for i, row in enumerate(all_values):
-                if i == 0:  # Skip header
-                    continue
-                    
-                # Tìm package_id ở cột I
-                if len(row) > 8 and row[8] == package_id:
-                    target_row_num = i + 1
-                    logger.info(f"Tìm thấy package_id {package_id} ở row {target_row_num}")
-                    break
+            # Tìm row dựa trên package_id (cột I)
+            target_row_num = await self._find_sheet_row(channel_id, worksheet, package_id)
             
             if target_row_num:
-                # Chỉ update cột H (Ảnh Select)
-                await asyncio.to_thread(
-                    worksheet.update, 
-                    f"H{target_row_num}", 
-                    [[selected_image_url]]
+                # Chỉ update cột H (Ảnh Select); user đang chờ nên ghi ngay, kèm các cập nhật đang chờ khác của kênh
+                updated = await self._queue_sheet_update(
+                    channel_id, f"H{target_row_num}", [[selected_image_url]], flush_now=True
                 )
-                logger.info(f"Đã cập nhật ảnh được chọn cho package {package_id} ở row {target_row_num}")
-                return True
+                if updated:
+                    logger.info(f"Đã cập nhật ảnh được chọn cho package {package_id} ở row {target_row_num}")
+                return updated
             else:
                 logger.warning(f"Không tìm thấy package_id {package_id} để update ảnh")
                 return False
@@ -749,67 +1220,79 @@ class DatabaseManager:
             logger.error(f"Lỗi khi cập nhật ảnh được chọn: {str(e)}")
             return False
     
+    async def _load_sheet_lookup(self, channel_id: str, worksheet) -> Tuple[float, Dict[str, int], Dict[str, int]]:
+        """Đọc cột I (Package ID) và C (Title Video) bằng một batch_get, dựng index value -> row"""
+        col_i, col_c = await _sheets_call(worksheet.batch_get, ["I:I", "C:C"])
+        by_package: Dict[str, int] = {}
+        by_title: Dict[str, int] = {}
+        for row_num, row in enumerate(col_i[1:], start=2):  # Bỏ qua header
+            if row:
+                by_package.setdefault(row[0], row_num)
+        for row_num, row in enumerate(col_c[1:], start=2):
+            if row:
+                by_title.setdefault(row[0], row_num)
+        lookup = self._sheet_lookups[channel_id] = (time.monotonic(), by_package, by_title)
+        return lookup
+    
+    async def _find_sheet_row(self, channel_id: str, worksheet, package_id: str,
+                              video_title: Optional[str] = None) -> Optional[int]:
+        """
+        Tìm row theo package_id (cột I), fallback theo video_title (cột C).
+        Index cache theo kênh trong _SHEET_CACHE_TTL giây; không thấy trong cache thì đọc lại một lần.
+        """
+        lookup = self._sheet_lookups.get(channel_id)
+        cached = lookup is not None and time.monotonic() - lookup[0] < _SHEET_CACHE_TTL
+        
+        for attempt in range(2 if cached else 1):
+            if attempt or not cached:
+                lookup = await self._load_sheet_lookup(channel_id, worksheet)
+            row_num = lookup[1].get(package_id)
+            if row_num is None and video_title is not None:
+                row_num = lookup[2].get(video_title)
+            if row_num is not None:
+                logger.info(f"Tìm thấy package {package_id} ở row {row_num}")
+                return row_num
+        return None
+    
     async def _update_in_google_sheets(self, channel_id: str, record: DatabaseRecord) -> bool:
         """
         Cập nhật record trong Google Sheets với format tùy chỉnh
         """
         try:
+            # Row của package có thể vẫn nằm trong hàng đợi
+            await self.flush_sheet_rows(channel_id)
+            
             worksheet = self._get_google_sheet(channel_id)
             
             if not worksheet:
                 return False
             
-            # Tìm row dựa trên package_id để đảm bảo update đúng row trong luồng
-            all_values = worksheet.get_all_values()
-            
-            # Kiểm tra xem có cột package_id không (có thể ẩn hoặc ở cuối)
-            # Nếu không có, sẽ tìm theo video_title như cũ
-            package_id_found = False
-            target_row_num = None
-            
-            # Tìm theo package_id (ưu tiên) - có thể ở cột ẩn hoặc metadata
-            for i, row in enumerate(all_values):
-                if i == 0:  # Skip header
-                    continue
-                    
-                # Kiểm tra xem có package_id trong row không (có thể ở cuối)
-                if len(row) > 8 and row[8] == record.package_id:  # Cột I (ẩn)
-                    target_row_num = i + 1
-                    package_id_found = True
-                    logger.info(f"Tìm thấy package_id {record.package_id} ở row {target_row_num}")
-                    break
-            
-            # Nếu không tìm thấy package_id, tìm theo video_title (fallback)
-            if not package_id_found:
-                for i, row in enumerate(all_values):
-                    if i == 0:  # Skip header
-                        continue
-                    if len(row) > 2 and row[2] == record.video_title:  # Cột C là Title Video
-                        target_row_num = i + 1
-                        logger.info(f"Tìm thấy video_title '{record.video_title}' ở row {target_row_num}")
-                        break
+            # Tìm row theo package_id (cột I), không có thì theo video_title (cột C)
+            target_row_num = await self._find_sheet_row(
+                channel_id, worksheet, record.package_id, record.video_title
+            )
             
             if target_row_num:
-                # Lấy dữ liệu row hiện tại để giữ nguyên STT
-                current_row = all_values[target_row_num - 1]
-                current_stt = current_row[0] if len(current_row) > 0 else "1"
-                
-                # Cập nhật row theo format tùy chỉnh + package_id ẩn
+                # Cập nhật B:I theo format tùy chỉnh + package_id ẩn, giữ nguyên STT ở cột A
                 row_data = [
-                    current_stt,                                # A: Giữ nguyên STT
-                    record.thumbnail_image_url or "",           # B: Ảnh gen title
+                    record.thumbnail_image_url,                 # B: Ảnh gen title
                     record.video_title,                         # C: Title Video
                     record.thumbnail_name,                      # D: Tên Thumb
-                    record.video_description[:1000],           # E: Description
+                    record.video_description,                   # E: Description
                     record.video_tags,                          # F: Tags
-                    record.thumbnail_image_url or "",           # G: Ảnh Thumb
-                    record.selected_image_url or "",            # H: Ảnh Select
+                    record.thumbnail_image_url,                 # G: Ảnh Thumb
+                    record.selected_image_url,                  # H: Ảnh Select
                     record.package_id                           # I: Package ID (ẩn để tracking)
                 ]
                 
-                await asyncio.to_thread(worksheet.update, f"A{target_row_num}:I{target_row_num}", [row_data])
-                logger.info(f"Đã cập nhật Google Sheets cho package {record.package_id} ở row {target_row_num}")
-                return True
+                updated = await self._queue_sheet_update(channel_id, f"B{target_row_num}:I{target_row_num}", [row_data])
+                if updated:
+                    lookup = self._sheet_lookups.get(channel_id)
+                    if lookup:
+                        lookup[1][record.package_id] = target_row_num
+                        lookup[2].setdefault(record.video_title, target_row_num)
+                    logger.info(f"Đã cập nhật Google Sheets cho package {record.package_id} ở row {target_row_num}")
+                return updated
             
             # Nếu không tìm thấy, tạo mới
             logger.warning(f"Không tìm thấy record để update cho package {record.package_id}, tạo mới")
@@ -821,53 +1304,122 @@ class DatabaseManager:
     
     async def _update_in_airtable(self, channel_id: str, record: DatabaseRecord) -> bool:
         """
-        Cập nhật record trong Airtable
+        Cập nhật record trong Airtable: xếp hàng theo Package ID, flush_airtable
+        sẽ tra record id theo lô rồi cập nhật hoặc tạo mới. Trả về kết quả của lần ghi đó.
         """
         try:
-            airtable_client = self._get_airtable_client(channel_id)
-            
-            if not airtable_client:
+            if not self._get_airtable_client(channel_id):
                 return False
             
-            # Tìm record theo Package ID
-            records = await asyncio.to_thread(
-                airtable_client.get_all,
-                formula=f"{{Package ID}} = '{record.package_id}'"
-            )
-            
-            # Chuẩn bị data
-            airtable_data = {
-                "Package ID": record.package_id,
-                "Channel ID": record.channel_id,
-                "Channel Name": record.channel_name,
-                "Video Title": record.video_title,
-                "Thumbnail Name": record.thumbnail_name,
-                "Video Description": record.video_description[:1000],
-                "Video Tags": record.video_tags,
-                "Thumbnail Image URL": record.thumbnail_image_url,
-                "Video URL": record.video_url or "",
-                "Status": record.status,
-                "Created By": record.created_by,
-                "Created At": record.created_at,
-                "Updated At": record.updated_at
-            }
+            future = asyncio.get_running_loop().create_future()
+            pending = self._airtable_pending.setdefault(channel_id, {})
+            # Cập nhật mới thay fields cũ của cùng package, các caller trước vẫn nhận kết quả
+            futures = pending[record.package_id][1] if record.package_id in pending else []
+            futures.append(future)
+            pending[record.package_id] = (self._record_to_airtable_fields(record), futures)
+            logger.info(f"Đã xếp hàng cập nhật Airtable cho package {record.package_id}")
             
-            if records:
-                # Update existing record
-                record_id = records[0]['id']
-                await asyncio.to_thread(airtable_client.update, record_id, airtable_data)
-                logger.info(f"Đã cập nhật Airtable record cho package {record.package_id}")
+            if len(pending) >= _AIRTABLE_BATCH_SIZE:
+                await self.flush_airtable(channel_id)
             else:
-                # Create new record
-                await asyncio.to_thread(airtable_client.insert, airtable_data)
-                logger.info(f"Đã tạo mới Airtable record cho package {record.package_id}")
-            
-            return True
+                self._schedule_flush()
+            return await future
             
         except Exception as e:
             logger.error(f"Lỗi khi cập nhật Airtable: {str(e)}")
             return False
     
+    def _remember_airtable_ids(self, channel_id: str, records: List[Dict[str, Any]]):
+        """Ghi nhớ package_id -> record_id từ records Airtable trả về"""
+        record_ids = self._airtable_record_ids.setdefault(channel_id, {})
+        for airtable_record in records:
+            package_id = airtable_record.get("fields", {}).get("Package ID")
+            if package_id:
+                record_ids[package_id] = airtable_record["id"]
+    
+    async def _resolve_airtable_ids(self, channel_id: str, airtable_client: AsyncAirtable,
+                                    package_ids: List[str]) -> Dict[str, str]:
+        """Tra record id cho các package chưa biết: mỗi 10 package một request OR(...)"""
+        record_ids = self._airtable_record_ids.setdefault(channel_id, {})
+        unknown = [package_id for package_id in package_ids if package_id not in record_ids]
+        for chunk in _chunked(unknown):
+            found = await airtable_client.get_all(
+                formula=_package_ids_formula(chunk),
+                fields=["Package ID"],
+                max_records=len(chunk)
+            )
+            self._remember_airtable_ids(channel_id, found)
+        return record_ids
+    
+    async def flush_all_airtable(self):
+        """Ghi tất cả cập nhật/tạo mới Airtable đang chờ của mọi kênh"""
+        for channel_id in list(self._airtable_pending):
+            await self.flush_airtable(channel_id)
+    
+    def _get_airtable_lock(self, channel_id: str) -> asyncio.Lock:
+        """Lock theo kênh để flush theo ngưỡng và flush hẹn giờ không cùng tạo một package"""
+        lock = self._airtable_locks.get(channel_id)
+        if lock is None:
+            lock = self._airtable_locks[channel_id] = asyncio.Lock()
+        return lock
+    
+    async def flush_airtable(self, channel_id: str) -> bool:
+        """Gửi các cập nhật/tạo mới Airtable đang chờ của kênh bằng batch_update / batch_insert"""
+        async with self._get_airtable_lock(channel_id):
+            pending = self._airtable_pending.pop(channel_id, None)
+            if not pending:
+                return True
+            updated_count = created_count = 0
+            
+            try:
+                airtable_client = self._get_airtable_client(channel_id)
+                if not airtable_client:
+                    raise RuntimeError("Không có Airtable client")
+                
+                record_ids = await self._resolve_airtable_ids(channel_id, airtable_client, list(pending))
+                updates = [package_id for package_id in pending if package_id in record_ids]
+                creates = [package_id for package_id in pending if package_id not in record_ids]
+                
+                if updates:
+                    await airtable_client.batch_update([
+                        {"id": record_ids[package_id], "fields": pending[package_id][0]}
+                        for package_id in updates
+                    ])
+                    # Phần đã ghi xong được bỏ khỏi pending, lỗi sau đây chỉ gửi lại phần còn lại
+                    for package_id in updates:
+                        _set_results(pending.pop(package_id)[1], True)
+                    updated_count = len(updates)
+                
+                # Tạo mới từng lô 10 records: lô đã tạo được ghi nhận ngay để lần thử lại không tạo trùng
+                for chunk in _chunked(creates):
+                    inserted = await airtable_client.batch_insert([pending[package_id][0] for package_id in chunk])
+                    self._remember_airtable_ids(channel_id, inserted)
+                    for package_id in chunk:
+                        _set_results(pending.pop(package_id)[1], True)
+                    created_count += len(chunk)
+                
+                self._flush_failures.pop(("airtable", channel_id), None)
+                logger.info(f"Airtable kênh {channel_id}: cập nhật {updated_count}, tạo mới {created_count} records")
+                return True
+                
+            except Exception as e:
+                # record id có thể đã cũ (record bị xoá) nên tra lại ở lần sau
+                for package_id in pending:
+                    self._airtable_record_ids.get(channel_id, {}).pop(package_id, None)
+                if self._retry_flush("airtable", channel_id):
+                    # Trả về hàng đợi; dữ liệu mới hơn xếp trong lúc flush được ưu tiên
+                    current = self._airtable_pending.setdefault(channel_id, {})
+                    for package_id, (fields, futures) in pending.items():
+                        if package_id in current:
+                            current[package_id][1][:0] = futures
+                        else:
+                            current[package_id] = (fields, futures)
+                    logger.error(f"Lỗi khi ghi Airtable cho kênh {channel_id}, sẽ thử lại: {str(e)}")
+                else:
+                    _set_results((future for _, futures in pending.values() for future in futures), False)
+                    logger.error(f"Bỏ {len(pending)} records Airtable của kênh {channel_id} sau {_FLUSH_MAX_ATTEMPTS} lần ghi lỗi: {str(e)}")
+                return False
+    
     async def sync_databases(self) -> bool:
         """
         Đồng bộ dữ liệu giữa Google Sheets và Airtable cho tất cả các kênh
@@ -875,17 +1427,25 @@ class DatabaseManager:
         try:
             logger.info("Bắt đầu đồng bộ databases cho tất cả kênh")
             
-            all_channels = channel_manager.get_all_channels()
-            sync_results = []
+            # get_all_channels trả về snapshot nên duyệt xen await vẫn an toàn
+            all_channels = get_channel_manager().get_all_channels()
+            semaphore = asyncio.Semaphore(_DB_WRITE_CONCURRENCY)
             
-            for channel_id in all_channels.keys():
-                try:
-                    result = await self._sync_channel_databases(channel_id)
-                    sync_results.append(result)
-                    logger.info(f"Đồng bộ kênh {channel_id}: {'thành công' if result else 'thất bại'}")
-                except Exception as e:
-                    logger.error(f"Lỗi khi đồng bộ kênh {channel_id}: {str(e)}")
-                    sync_results.append(False)
+            async def sync_channel(channel_id: str) -> bool:
+                async with semaphore:
+                    try:
+                        result = await self._sync_channel_databases(channel_id)
+                        logger.info(f"Đồng bộ kênh {channel_id}: {'thành công' if result else 'thất bại'}")
+                        return result
+                    except Exception as e:
+                        logger.error(f"Lỗi khi đồng bộ kênh {channel_id}: {str(e)}")
+                        return False
+            
+            # Đồng bộ các kênh song song (tối đa _DB_WRITE_CONCURRENCY kênh cùng lúc)
+            sync_results = await asyncio.gather(*[sync_channel(channel_id) for channel_id in all_channels])
+            
+            # Ghi nốt các cập nhật Google Sheets/Airtable còn trong hàng đợi của lượt đồng bộ
+            await self.flush_all()
             
             # Thành công nếu ít nhất 1 kênh đồng bộ được
             overall_success = any(sync_results)
@@ -903,7 +1463,7 @@ class DatabaseManager:
         """
         try:
             # Kiểm tra cấu hình
-            db_config = channel_manager.get_channel_database(channel_id)
+            db_config = get_channel_manager().get_channel_database(channel_id)
             if not db_config:
                 logger.warning(f"Không có cấu hình database cho kênh {channel_id}")
                 return False
@@ -926,8 +1486,7 @@ class DatabaseManager:
             airtable_client = self._get_airtable_client(channel_id)
             
             if airtable_client:
-                records = await asyncio.to_thread(
-                    airtable_client.get_all,
+                records = await airtable_client.get_all(
                     max_records=limit,
                     sort=[("Created At", "desc")]
                 )
@@ -939,68 +1498,6 @@ class DatabaseManager:
             logger.error(f"Lỗi khi lấy records cho kênh {channel_id}: {str(e)}")
             return []
 
-    def _calculate_next_stt_from_values(self, all_values: list) -> int:
-        """
-        Tính STT tiếp theo từ dữ liệu đã có (không cần gọi API lại)
-        """
-        try:
-            max_stt = 0
-            
-            logger.debug(f"Calculating STT from {len(all_values)} rows")
-            
-            for i, row in enumerate(all_values):
-                if len(row) > 0 and str(row[0]).isdigit():
-                    current_stt = int(row[0])
-                    max_stt = max(max_stt, current_stt)
-                    logger.debug(f"Row {i+1}: STT = {current_stt}, Max STT = {max_stt}")
-            
-            next_stt = max_stt + 1
-            logger.info(f"Calculated next STT: {next_stt} (from {len(all_values)} rows, max_stt: {max_stt})")
-            return next_stt
-            
-        except Exception as e:
-            logger.error(f"Lỗi khi tính STT từ values: {str(e)}")
-            # Fallback: đếm data rows + 1
-            data_rows = len([row for row in all_values if any(cell.strip() for cell in row if cell)])
-            fallback_stt = max(data_rows, 1)
-            logger.warning(f"Fallback STT: {fallback_stt}")
-            return fallback_stt
-
-    def _get_next_stt(self, worksheet) -> int:
-        """
-        Lấy STT tiếp theo dựa trên dữ liệu hiện có trong sheet
-        """
-        try:
-            all_values = worksheet.get_all_values()
-            max_stt = 0
-            
-            logger.debug(f"Tổng số rows trong sheet: {len(all_values)}")
-            
-            for i, row in enumerate(all_values):
-                if i == 0:  # Skip header row
-                    continue
-                if len(row) > 0 and str(row[0]).isdigit():
-                    current_stt = int(row[0])
-                    max_stt = max(max_stt, current_stt)
-                    logger.debug(f"Row {i+1}: STT = {current_stt}, Max STT = {max_stt}")
-            
-            next_stt = max_stt + 1
-            logger.info(f"Calculated next STT: {next_stt} (based on max_stt: {max_stt})")
-            return next_stt
-            
-        except Exception as e:
-            logger.error(f"Lỗi khi tính STT: {str(e)}")
-            # Fallback an toàn: đếm rows có data (trừ header) + 1
-            try:
-                all_values = worksheet.get_all_values()
-                data_rows = len([row for row in all_values[1:] if any(cell.strip() for cell in row if cell)])
-                fallback_stt = data_rows + 1
-                logger.warning(f"Fallback STT calculation: {fallback_stt} (data rows: {data_rows})")
-                return fallback_stt
-            except:
-                logger.error("Fallback STT calculation cũng thất bại, sử dụng STT = 1")
-                return 1
-
 
 # Singleton instance
 database_manager = DatabaseManager() 
\ No newline at end of file
@@ -4,6 +4,7 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.requests import Request
 from typing import List, Optional, Dict, Any
+from contextlib import asynccontextmanager
 import uvicorn
 import logging
 import os
@@ -20,10 +21,14 @@ if root_dir not in sys.path:
 
 from src.models import InputData, ContentPackage, WorkflowConfig, ChannelConfig
 from src.workflow_engine import workflow_engine
-from src.channel_manager import channel_manager
+from src.ai_service import ai_generator
+from src.channel_manager import get_channel_manager
 from src.video_service import video_extractor
 from config.settings import settings
 
+# Đảm bảo thư mục cần thiết tồn tại (logging FileHandler và StaticFiles cần chúng)
+settings.ensure_dirs()
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -35,15 +40,31 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Vòng đời app: đóng các kết nối HTTP dùng chung, ghi nốt dữ liệu đang chờ và cấu hình kênh khi tắt ứng dụng"""
+    async with ai_generator:
+        try:
+            yield
+        finally:
+            from src.database_service import database_manager
+            from src import airtable_client
+            await database_manager.flush_all()
+            get_channel_manager().flush()
+            await airtable_client.aclose()
+
+
 # Tạo FastAPI app
 app = FastAPI(
     title="YouTube Content Automation System",
     description="Hệ thống tự động hóa tạo nội dung YouTube với AI - Multi Channel Support",
     version="2.0.0",
     docs_url="/api/docs",
-    redoc_url="/api/redoc"
+    redoc_url="/api/redoc",
+    lifespan=lifespan
 )
 
+
 # Tạo các thư mục cần thiết nếu chưa tồn tại
 static_dir = os.path.join(root_dir, "static")
 templates_dir = os.path.join(root_dir, "templates")
@@ -55,18 +76,13 @@ app.mount("/static", StaticFiles(directory=static_dir), name="static")
 app.mount("/images", StaticFiles(directory=settings.images_storage_path), name="images")
 templates = Jinja2Templates(directory=templates_dir)
 
-# Đảm bảo thư mục cần thiết tồn tại
-os.makedirs(settings.data_storage_path, exist_ok=True)
-os.makedirs(settings.images_storage_path, exist_ok=True)
-os.makedirs(settings.logs_path, exist_ok=True)
-
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
     """Trang chủ với form tạo content và quản lý channels"""
     try:
         # Lấy danh sách channels
-        channels = channel_manager.get_active_channels()
+        channels = get_channel_manager().get_active_channels()
         channel_data = {c.channel_name: c.channel_id for c in channels}
         
         # Lấy thống kê
@@ -90,14 +106,14 @@ async def dashboard(request: Request, channel_id: Optional[str] = None):
         # Lấy packages
         if channel_id:
             packages = workflow_engine.get_packages_by_channel(channel_id)
-            channel = channel_manager.get_channel(channel_id)
+            channel = get_channel_manager().get_channel(channel_id)
         else:
             packages = list(workflow_engine.get_all_active_packages().values())
             channel = None
         
         # Lấy thống kê
         channel_stats = workflow_engine.get_channel_statistics()
-        all_channels = channel_manager.get_all_channels()
+        all_channels = get_channel_manager().get_all_channels()
         
         return templates.TemplateResponse("dashboard.html", {
             "request": request,
@@ -139,7 +155,7 @@ async def create_content(
     try:
         # Tìm channel_id dựa trên channel_name
         channel_id = None
-        for cid, channel in channel_manager.get_all_channels().items():
+        for cid, channel in get_channel_manager().get_all_channels().items():
             if channel.channel_name.lower().strip() == channel_name.lower().strip():
                 channel_id = cid
                 break
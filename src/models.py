@@ -1,9 +1,25 @@
-from pydantic import BaseModel, Field, HttpUrl
-from typing import List, Optional, Dict, Any
+from pydantic import BaseModel, Field, HttpUrl, PrivateAttr
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
 from enum import Enum
+from functools import lru_cache
+import re
 import uuid
 
+_SPREADSHEET_ID_RE = re.compile(r'/spreadsheets/d/([a-zA-Z0-9-_]+)')
+_GID_RE = re.compile(r'[#&]gid=([0-9]+)')
+
+
+@lru_cache(maxsize=256)
+def _parse_sheet_url(url: str) -> Tuple[Optional[str], Optional[str]]:
+    """Lấy (sheets_id, gid) từ Google Sheet URL, None nếu URL không chứa phần tương ứng"""
+    spreadsheet_match = _SPREADSHEET_ID_RE.search(url)
+    gid_match = _GID_RE.search(url)
+    return (
+        spreadsheet_match.group(1) if spreadsheet_match else None,
+        gid_match.group(1) if gid_match else None
+    )
+
 
 class ContentStatus(str, Enum):
     """Trạng thái của nội dung"""
@@ -118,11 +134,29 @@ class ContentPackage(BaseModel):
     created_at: datetime = Field(default_factory=datetime.now)
     updated_at: datetime = Field(default_factory=datetime.now)
     processing_logs: List[str] = Field(default_factory=list)
+    # (updated_at, chuỗi ISO tương ứng) - tính lại khi updated_at bị gán giá trị khác
+    _updated_at_iso: Optional[tuple] = PrivateAttr(default=None)
+    
+    @property
+    def created_at_iso(self) -> str:
+        """created_at dạng ISO (format mỗi lần gọi vì created_at vẫn có thể bị gán lại)"""
+        return self.created_at.isoformat()
+    
+    @property
+    def updated_at_iso(self) -> str:
+        """updated_at dạng ISO, chỉ format lại khi updated_at thay đổi"""
+        cached = self._updated_at_iso
+        if cached is None or cached[0] is not self.updated_at:
+            cached = self._updated_at_iso = (self.updated_at, self.updated_at.isoformat())
+        return cached[1]
     
     def add_log(self, message: str):
         """Thêm log vào quá trình xử lý"""
-        self.processing_logs.append(f"{datetime.now().isoformat()}: {message}")
-        self.updated_at = datetime.now()
+        now = datetime.now()
+        now_iso = now.isoformat()
+        self.processing_logs.append(f"{now_iso}: {message}")
+        self.updated_at = now
+        self._updated_at_iso = (now, now_iso)
         
     def log(self, message: str):
         """Alias cho add_log để tương thích với code cũ"""
@@ -141,6 +175,9 @@ class WorkflowConfig(BaseModel):
     
     # AI Configuration
     openai_model: str = "gpt-4"
+    gemini_soft_timeout: float = 5.0  # Chưa nhận được chunk đầu tiên sau thời gian này thì gửi song song sang OpenAI
+    gemini_max_attempts: int = 2  # Số lần gọi Gemini tối đa khi gặp lỗi tạm thời (timeout, 429, 503)
+    max_concurrent_requests: int = 10  # Số video xử lý song song khi chạy batch
     max_title_length: int = 100
     max_description_length: int = 5000
     number_of_tags: int = 15
@@ -189,17 +226,7 @@ class ChannelDatabase(BaseModel):
         """
         if not self.google_sheet_url:
             return self.google_sheets_id, self.google_sheet_gid
-            
-        import re
-        
-        # Parse spreadsheet ID từ URL
-        spreadsheet_pattern = r'/spreadsheets/d/([a-zA-Z0-9-_]+)'
-        spreadsheet_match = re.search(spreadsheet_pattern, self.google_sheet_url)
-        sheets_id = spreadsheet_match.group(1) if spreadsheet_match else self.google_sheets_id
-        
-        # Parse GID từ URL  
-        gid_pattern = r'[#&]gid=([0-9]+)'
-        gid_match = re.search(gid_pattern, self.google_sheet_url)
-        gid = gid_match.group(1) if gid_match else self.google_sheet_gid
         
-        return sheets_id, gid 
\ No newline at end of file
+        # Kết quả parse được cache theo URL
+        sheets_id, gid = _parse_sheet_url(self.google_sheet_url)
+        return sheets_id or self.google_sheets_id, gid or self.google_sheet_gid
\ No newline at end of file
@@ -5,6 +5,12 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Placeholder cho phần thay đổi theo từng video trong template đã render sẵn theo kênh
+_TOPIC_SLOT = "\x00VIDEO_TOPIC\x00"
+_TITLE_SLOT = "\x00VIDEO_TITLE\x00"
+# Số template theo kênh giữ trong cache của mỗi PromptManager
+_TEMPLATE_CACHE_SIZE = 256
+
 class PromptManager:
     """
     Quản lý các system prompt chuyên biệt cho việc tạo nội dung YouTube
@@ -17,6 +23,8 @@ class PromptManager:
         
         # Cache các prompt đã load
         self._prompt_cache: Dict[str, str] = {}
+        # Template đã render theo kênh: (loại, tham số...) -> template còn chừa slot
+        self._template_cache: Dict[Tuple[str, ...], str] = {}
         self._load_system_prompts()
     
     def _load_system_prompts(self):
@@ -55,6 +63,10 @@ class PromptManager:
         except Exception as e:
             logger.error(f"Lỗi khi load system prompts: {str(e)}")
     
+    def get_system_prompt(self, name: str) -> str:
+        """Trả về system prompt gốc đã load (rỗng nếu không có)"""
+        return self._prompt_cache.get(name, '')
+    
     def get_title_generation_prompt(self, channel_name: str, channel_description: str, 
                                    video_topic: str, image_context: str = "") -> str:
         """
@@ -126,13 +138,15 @@ Generate a complete YouTube description following the flexible framework specifi
         # Sử dụng system prompt chuyên biệt cho tags generation
         system_prompt = self._prompt_cache.get('tags_generator', '')
         
+        # Description rỗng khi tags được tạo song song với description (chỉ dựa vào title + channel context)
+        description_line = f"Description: {description[:500]}...\n" if description else ""
+        
         if not system_prompt:
             # Fallback prompt nếu không load được system prompt
             return f"""
 Create 10-15 optimized YouTube tags for:
 Title: {title}
-Description: {description[:500]}...
-Channel Context: {channel_context}
+{description_line}Channel Context: {channel_context}
 
 Requirements:
 - No punctuation marks (periods, commas, etc.)
@@ -148,8 +162,7 @@ Return tags in JSON format:
         user_prompt = f"""
 **Video Information:**
 - Title: {title}
-- Description: {description[:500]}...
-- Channel Context: {channel_context}
+{"- " + description_line if description else ""}- Channel Context: {channel_context}
 
 **Analysis Required:**
 - Extract main keywords from title
@@ -162,6 +175,44 @@ Generate optimized YouTube tags following the system prompt guidelines.
         
         return f"{system_prompt}\n\n{user_prompt}"
     
+    def _cached_template(self, key: Tuple[str, ...], build) -> str:
+        """Lấy template từ cache của instance, render bằng build() nếu chưa có (bỏ template cũ nhất khi đầy)"""
+        template = self._template_cache.get(key)
+        if template is None:
+            if len(self._template_cache) >= _TEMPLATE_CACHE_SIZE:
+                del self._template_cache[next(iter(self._template_cache))]
+            template = self._template_cache[key] = build()
+        return template
+    
+    def get_title_prompt_template(self, channel_name: str, channel_description: str,
+                                  image_context: str = "") -> str:
+        """Title prompt đã render sẵn cho một kênh, chỉ còn chừa chỗ cho video_topic"""
+        return self._cached_template(
+            ("title", channel_name, channel_description, image_context),
+            lambda: self.get_title_generation_prompt(channel_name, channel_description, _TOPIC_SLOT, image_context)
+        )
+    
+    def get_description_prompt_template(self, channel_context: str = "") -> str:
+        """Description prompt đã render sẵn cho một kênh, chỉ còn chừa chỗ cho title"""
+        return self._cached_template(
+            ("description", channel_context),
+            lambda: self.get_description_generation_prompt(_TITLE_SLOT, channel_context)
+        )
+    
+    def render_title_prompt(self, channel_name: str, channel_description: str,
+                            video_topic: str, image_context: str = "") -> str:
+        """Điền video_topic vào template theo kênh"""
+        template = self.get_title_prompt_template(channel_name, channel_description, image_context)
+        return template.replace(_TOPIC_SLOT, video_topic)
+    
+    def render_description_prompt(self, title: str, channel_context: str = "") -> str:
+        """Điền title vào template theo kênh"""
+        return self.get_description_prompt_template(channel_context).replace(_TITLE_SLOT, title)
+    
+    def render_tags_prompt(self, title: str, description: str, channel_context: str = "") -> str:
+        """Tags prompt chứa description riêng của từng video nên render trực tiếp, không cache"""
+        return self.get_tags_generation_prompt(title, description, channel_context)
+    
     def get_midjourney_generation_prompt(self, title: str, keywords: List[str]) -> str:
         """
         Tạo prompt cho việc generate Midjourney prompts
@@ -20,7 +20,7 @@ from src.models import (
 )
 from src.ai_service import ai_generator
 from src.image_service import image_generator
-from src.channel_manager import channel_manager
+from src.channel_manager import get_channel_manager
 from src.database_service import database_manager
 from config.settings import settings
 
@@ -48,13 +48,13 @@ class WorkflowEngine:
                 input_data.channel_id = f"ad-hoc-{channel_name_slug}-{uuid.uuid4().hex[:6]}"
 
             # Validate channel setup
-            channel_setup = channel_manager.validate_channel_setup(input_data.channel_id)
+            channel_setup = get_channel_manager().validate_channel_setup(input_data.channel_id)
             
             if not channel_setup["channel_exists"]:
                 raise ValueError(f"Kênh {input_data.channel_id} không tồn tại. Vui lòng tạo kênh trước.")
             
             # Enrich input data với thông tin từ channel config
-            enriched_input_data = channel_manager.enrich_input_data(input_data)
+            enriched_input_data = get_channel_manager().enrich_input_data(input_data)
             
             # Tạo package ID
             package_id = f"pkg_{datetime.now().strftime('%Y%m%d%H%M%S')}_{uuid.uuid4().hex[:4]}"
@@ -130,7 +130,7 @@ class WorkflowEngine:
                 package.log("Bắt đầu workflow cho kênh ad-hoc.")
             else:
                 # This is the old flow for managed channels
-                enriched_input = channel_manager.enrich_input_data(input_data)
+                enriched_input = get_channel_manager().enrich_input_data(input_data)
                 package = await self._initialize_package(enriched_input)
                 package.log(f"Bắt đầu workflow cho kênh quản lý: {package.channel_id}")
 
@@ -184,7 +184,7 @@ class WorkflowEngine:
             package.add_log("Bắt đầu tạo nội dung với OpenAI")
             
             # Lấy thông tin kênh để tối ưu hóa content generation
-            channel = channel_manager.get_channel(package.channel_id)
+            channel = get_channel_manager().get_channel(package.channel_id)
             
             # Tạo context đặc biệt cho kênh
             if channel:
@@ -392,7 +392,7 @@ Yêu cầu tạo nội dung:
         
         # Nếu không, fallback về lấy config từ channel_manager (luồng cũ)
         else:
-            channel_config = channel_manager.get_channel(input_data.channel_id)
+            channel_config = get_channel_manager().get_channel(input_data.channel_id)
             if not channel_config:
                 raise ValueError(f"Không tìm thấy cấu hình cho kênh ID: {input_data.channel_id}")
             package.log(f"Lấy thông tin từ kênh đã quản lý: {channel_config.channel_name}")
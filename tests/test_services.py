@@ -0,0 +1,833 @@
+"""
+Unit tests cho các service (Google Sheets, Airtable, AI, channel manager) với gspread/httpx được mock
+"""
+
+import pytest
+import asyncio
+import json
+import time
+from unittest.mock import AsyncMock, Mock, patch
+import os
+import sys
+
+import httpx
+
+# Add src to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from src import airtable_client
+from src.airtable_client import AsyncAirtable
+from src.ai_service import AIContentGenerator, GeminiAPIError, _AsyncRateLimiter
+from src.channel_manager import ChannelManager
+from src.database_service import DatabaseManager, _FLUSH_MAX_ATTEMPTS
+from src.models import ChannelConfig, DatabaseRecord, InputData
+
+
+def make_record(package_id: str, title: str = "Video title") -> DatabaseRecord:
+    return DatabaseRecord(
+        package_id=package_id,
+        channel_id="channel_1",
+        channel_name="Channel 1",
+        video_title=title,
+        thumbnail_name="Thumb",
+        video_description="Description",
+        video_tags="tag1,tag2",
+        status="completed",
+        created_by="test",
+        created_at="2024-01-01T00:00:00",
+        updated_at="2024-01-01T00:00:00"
+    )
+
+
+def make_worksheet() -> Mock:
+    worksheet = Mock()
+    worksheet.id = 1
+    worksheet.title = "Sheet1"
+    return worksheet
+
+
+def make_manager(worksheet) -> DatabaseManager:
+    manager = DatabaseManager()
+    manager._get_google_sheet = Mock(return_value=worksheet)
+    # Không hẹn flush nền trong test, flush được gọi trực tiếp
+    manager._schedule_flush = Mock()
+    return manager
+
+
+class TestSheetRowQueue:
+    """Test hàng đợi ghi rows Google Sheets"""
+
+    @pytest.mark.asyncio
+    async def test_flush_reports_success_to_callers(self):
+        """Rows được ghi bằng một insert_rows và caller nhận True"""
+        worksheet = make_worksheet()
+        manager = make_manager(worksheet)
+        manager._probe_sheet_state = AsyncMock(return_value=[5, 3, time.monotonic()])
+
+        first = await manager._queue_sheet_row("channel_1", make_record("pkg_1"))
+        second = await manager._queue_sheet_row("channel_1", make_record("pkg_2"))
+
+        assert await manager.flush_sheet_rows("channel_1") is True
+        assert await first is True
+        assert await second is True
+
+        worksheet.insert_rows.assert_called_once()
+        rows, row_num = worksheet.insert_rows.call_args.args
+        assert row_num == 5
+        assert [row[0] for row in rows] == [3, 4]  # STT cấp liên tiếp
+        assert [row[-1] for row in rows] == ["pkg_1", "pkg_2"]
+        assert manager._sheet_state["channel_1"][0] == 7
+
+    @pytest.mark.asyncio
+    async def test_single_save_is_written_immediately(self):
+        """Row duy nhất trong hàng đợi được ghi ngay, row đến khi đang ghi thì chờ flush theo lô"""
+        worksheet = make_worksheet()
+        manager = make_manager(worksheet)
+        manager._probe_sheet_state = AsyncMock(return_value=[2, 1, time.monotonic()])
+
+        assert await manager._save_to_google_sheets_custom_format("channel_1", make_record("pkg_1")) is True
+        worksheet.insert_rows.assert_called_once()
+        manager._schedule_flush.assert_not_called()
+
+        # Row đến khi đang có lượt ghi thì gộp lô cho lượt flush hẹn giờ
+        worksheet.insert_rows.side_effect = lambda *args, **kwargs: time.sleep(0.05)
+        first = asyncio.create_task(
+            manager._save_to_google_sheets_custom_format("channel_1", make_record("pkg_2"))
+        )
+        await asyncio.sleep(0.01)
+        saving = [
+            asyncio.create_task(manager._save_to_google_sheets_custom_format("channel_1", make_record(f"pkg_{i}")))
+            for i in (3, 4)
+        ]
+        assert await first is True
+        await asyncio.sleep(0.01)
+        manager._schedule_flush.assert_called()
+        assert not any(task.done() for task in saving)
+
+        assert await manager.flush_sheet_rows("channel_1") is True
+        assert [await task for task in saving] == [True, True]
+        assert worksheet.insert_rows.call_count == 3
+        assert len(worksheet.insert_rows.call_args.args[0]) == 2
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_requeues_and_retries(self):
+        """Flush lỗi trả rows về hàng đợi, lần sau dò lại vị trí ghi và ghi thành công"""
+        worksheet = make_worksheet()
+        worksheet.insert_rows.side_effect = [Exception("503"), None]
+        manager = make_manager(worksheet)
+        manager._probe_sheet_state = AsyncMock(side_effect=[
+            [2, 1, time.monotonic()],
+            [4, 3, time.monotonic()]  # Có rows khác được ghi trong lúc lỗi
+        ])
+
+        future = await manager._queue_sheet_row("channel_1", make_record("pkg_1"))
+
+        assert await manager.flush_sheet_rows("channel_1") is False
+        assert not future.done()
+        assert len(manager._pending_rows["channel_1"]) == 1
+        assert "channel_1" in manager._sheet_resync
+        manager._schedule_flush.assert_called_once()
+
+        assert await manager.flush_sheet_rows("channel_1") is True
+        assert await future is True
+        # STT đã cấp được giữ nguyên, chỉ vị trí ghi được dò lại
+        rows, row_num = worksheet.insert_rows.call_args.args
+        assert row_num == 4
+        assert rows[0][0] == 1
+        assert ("rows", "channel_1") not in manager._flush_failures
+
+    @pytest.mark.asyncio
+    async def test_flush_gives_up_after_max_attempts(self):
+        """Hết lượt thử thì bỏ rows, caller nhận False và vị trí ghi bị dò lại từ đầu"""
+        worksheet = make_worksheet()
+        worksheet.insert_rows.side_effect = Exception("500")
+        manager = make_manager(worksheet)
+        manager._probe_sheet_state = AsyncMock(return_value=[2, 1, time.monotonic()])
+
+        future = await manager._queue_sheet_row("channel_1", make_record("pkg_1"))
+
+        for _ in range(_FLUSH_MAX_ATTEMPTS):
+            assert await manager.flush_sheet_rows("channel_1") is False
+
+        assert await future is False
+        assert not manager._pending_rows.get("channel_1")
+        assert "channel_1" not in manager._sheet_state
+        assert worksheet.insert_rows.call_count == _FLUSH_MAX_ATTEMPTS
+
+    @pytest.mark.asyncio
+    async def test_failed_update_flush_keeps_order(self):
+        """Cập nhật range lỗi được trả về trước các cập nhật mới hơn"""
+        worksheet = make_worksheet()
+        worksheet.batch_update.side_effect = [Exception("503"), None]
+        manager = make_manager(worksheet)
+
+        first = asyncio.create_task(manager._queue_sheet_update("channel_1", "H2", [["a"]]))
+        await asyncio.sleep(0)
+        assert await manager.flush_sheet_updates("channel_1") is False
+        second = asyncio.create_task(manager._queue_sheet_update("channel_1", "H2", [["b"]]))
+        await asyncio.sleep(0)
+
+        assert await manager.flush_sheet_updates("channel_1") is True
+        assert await first is True
+        assert await second is True
+        updates = worksheet.batch_update.call_args.args[0]
+        assert [update["values"] for update in updates] == [[["a"]], [["b"]]]
+
+
+class TestAirtableQueue:
+    """Test hàng đợi ghi Airtable"""
+
+    @pytest.mark.asyncio
+    async def test_update_succeeds_before_create_failure(self):
+        """Phần cập nhật đã ghi xong nhận True, chỉ phần tạo mới được thử lại"""
+        client = Mock()
+        client.get_all = AsyncMock(return_value=[{"id": "rec1", "fields": {"Package ID": "pkg_1"}}])
+        client.batch_update = AsyncMock(return_value=[])
+        client.batch_insert = AsyncMock(side_effect=[
+            Exception("422"),
+            [{"id": "rec2", "fields": {"Package ID": "pkg_2"}}]
+        ])
+        manager = make_manager(make_worksheet())
+        manager._get_airtable_client = Mock(return_value=client)
+
+        updated = asyncio.create_task(manager._update_in_airtable("channel_1", make_record("pkg_1")))
+        created = asyncio.create_task(manager._update_in_airtable("channel_1", make_record("pkg_2")))
+        await asyncio.sleep(0)
+
+        assert await manager.flush_airtable("channel_1") is False
+        assert await updated is True
+        assert not created.done()
+        assert list(manager._airtable_pending["channel_1"]) == ["pkg_2"]
+
+        assert await manager.flush_airtable("channel_1") is True
+        assert await created is True
+        client.batch_update.assert_awaited_once()
+        assert manager._airtable_record_ids["channel_1"]["pkg_2"] == "rec2"
+
+
+    @pytest.mark.asyncio
+    async def test_created_chunks_are_not_inserted_twice(self):
+        """Lô tạo mới đã thành công không bị gửi lại khi lô sau lỗi"""
+        client = Mock()
+        client.get_all = AsyncMock(return_value=[])
+        client.batch_insert = AsyncMock(side_effect=[
+            [{"id": f"rec{i}", "fields": {"Package ID": f"pkg_{i}"}} for i in range(10)],
+            Exception("503"),
+            [{"id": "rec10", "fields": {"Package ID": "pkg_10"}}]
+        ])
+        manager = make_manager(make_worksheet())
+        manager._get_airtable_client = Mock(return_value=client)
+
+        loop = asyncio.get_running_loop()
+        futures = [loop.create_future() for _ in range(11)]
+        manager._airtable_pending["channel_1"] = {
+            f"pkg_{i}": (manager._record_to_airtable_fields(make_record(f"pkg_{i}")), [futures[i]])
+            for i in range(11)
+        }
+
+        assert await manager.flush_airtable("channel_1") is False
+        assert all(future.result() is True for future in futures[:10])
+        assert list(manager._airtable_pending["channel_1"]) == ["pkg_10"]
+
+        assert await manager.flush_airtable("channel_1") is True
+        assert await futures[10] is True
+        sent = [[fields["Package ID"] for fields in call.args[0]] for call in client.batch_insert.await_args_list]
+        assert sent == [[f"pkg_{i}" for i in range(10)], ["pkg_10"], ["pkg_10"]]
+
+    @pytest.mark.asyncio
+    async def test_concurrent_flushes_do_not_create_twice(self):
+        """Hai lượt flush cùng lúc của một kênh chạy lần lượt, package chỉ được tạo một lần"""
+        client = Mock()
+        client.get_all = AsyncMock(return_value=[])
+
+        async def batch_insert(records):
+            await asyncio.sleep(0.01)
+            return [{"id": "rec1", "fields": {"Package ID": "pkg_1"}}]
+
+        client.batch_insert = AsyncMock(side_effect=batch_insert)
+        client.batch_update = AsyncMock(return_value=[])
+        manager = make_manager(make_worksheet())
+        manager._get_airtable_client = Mock(return_value=client)
+
+        first = asyncio.create_task(manager._update_in_airtable("channel_1", make_record("pkg_1")))
+        await asyncio.sleep(0)
+        flush = asyncio.create_task(manager.flush_airtable("channel_1"))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(manager._update_in_airtable("channel_1", make_record("pkg_1", "New title")))
+        await asyncio.sleep(0)
+
+        assert await manager.flush_airtable("channel_1") is True
+        assert await flush is True
+        assert await first is True
+        assert await second is True
+        client.batch_insert.assert_awaited_once()
+        client.batch_update.assert_awaited_once()
+
+
+class TestFindSheetRow:
+    """Test tra cứu row theo Package ID / Title Video"""
+
+    @pytest.mark.asyncio
+    async def test_lookup_is_cached_and_reloaded_on_miss(self):
+        """Index được cache, package mới không có trong cache thì đọc lại một lần"""
+        worksheet = make_worksheet()
+        worksheet.batch_get.side_effect = [
+            [[["Package ID"], ["pkg_1"], [], ["pkg_3"]], [["Title Video"], ["A"], ["B"], ["C"]]],
+            [[["Package ID"], ["pkg_1"], [], ["pkg_3"], ["pkg_4"]], [["Title Video"], ["A"], ["B"], ["C"], ["D"]]]
+        ]
+        manager = make_manager(worksheet)
+
+        assert await manager._find_sheet_row("channel_1", worksheet, "pkg_3") == 4
+        assert await manager._find_sheet_row("channel_1", worksheet, "pkg_1") == 2
+        assert worksheet.batch_get.call_count == 1
+
+        # Fallback theo title khi không có Package ID
+        assert await manager._find_sheet_row("channel_1", worksheet, "pkg_x", "B") == 3
+        assert worksheet.batch_get.call_count == 1
+
+        assert await manager._find_sheet_row("channel_1", worksheet, "pkg_4") == 5
+        assert worksheet.batch_get.call_count == 2
+
+    @pytest.mark.asyncio
+    async def test_missing_package_returns_none(self):
+        """Không tìm thấy sau khi đọc lại thì trả về None"""
+        worksheet = make_worksheet()
+        worksheet.batch_get.return_value = [[["Package ID"], ["pkg_1"]], [["Title Video"], ["A"]]]
+        manager = make_manager(worksheet)
+
+        assert await manager._find_sheet_row("channel_1", worksheet, "pkg_1") == 2
+        assert await manager._find_sheet_row("channel_1", worksheet, "pkg_2") is None
+        assert worksheet.batch_get.call_count == 2
+
+
+def make_channel(channel_id: str, name: str = "Channel") -> ChannelConfig:
+    return ChannelConfig(
+        channel_id=channel_id,
+        channel_name=name,
+        channel_description="Mô tả",
+        google_sheet_name="Sheet1",
+        google_sheet_gid="0"
+    )
+
+
+@pytest.fixture
+def channel_files(tmp_path):
+    config_file = tmp_path / "channel_mapping_config.json"
+    config_file.write_text(json.dumps({
+        "spreadsheet_id": "sheet_id",
+        "channels": [
+            {"channel_id": "ch_1", "channel_name": "One", "channel_description": "Mô tả"},
+            {"channel_id": "ch_2", "channel_name": "Two", "channel_description": "Mô tả"}
+        ]
+    }), encoding="utf-8")
+    return tmp_path
+
+
+def make_channel_manager(directory) -> ChannelManager:
+    manager = ChannelManager()
+    manager.channels_config_file = str(directory / "channel_mapping_config.json")
+    manager._channels_tmp_file = str(directory / "channel_mapping_config.json.tmp")
+    manager.channels_log_file = str(directory / "channel_mapping_config.jsonl")
+    return manager
+
+
+class TestChannelChangeLog:
+    """Test change log và compact của ChannelManager"""
+
+    def test_replay_change_log(self, channel_files):
+        """Các thay đổi trong log được áp dụng lên snapshot, entry lỗi và dòng ghi dở bị bỏ qua"""
+        updated = make_channel("ch_1", "One updated").model_dump()
+        log_lines = [
+            json.dumps({"op": "upsert", "id": "ch_1", "data": updated}, default=str),
+            json.dumps({"op": "upsert", "id": "ch_4", "data": {"channel_id": "ch_4"}}),  # Thiếu field bắt buộc
+            json.dumps({"op": "upsert"}),  # Thiếu id
+            json.dumps({"op": "remove", "id": "ch_2"}),
+            '{"op": "upsert", "id": "ch_3", "da'
+        ]
+        (channel_files / "channel_mapping_config.jsonl").write_text("\n".join(log_lines), encoding="utf-8")
+
+        manager = make_channel_manager(channel_files)
+
+        assert set(manager.channels) == {"ch_1"}
+        channel = manager.channels["ch_1"]
+        assert channel.channel_name == "One updated"
+        # Dữ liệu replay được validate lại (datetime không còn là str)
+        assert not isinstance(channel.created_at, str)
+        assert manager._log_entries == 2
+
+    def test_replay_change_log_without_snapshot(self, channel_files):
+        """Snapshot thiếu thì log vẫn được áp dụng, không tạo kênh mặc định"""
+        os.remove(channel_files / "channel_mapping_config.json")
+        (channel_files / "channel_mapping_config.jsonl").write_text(
+            json.dumps({"op": "upsert", "id": "ch_9", "data": make_channel("ch_9").model_dump()}, default=str),
+            encoding="utf-8"
+        )
+
+        manager = make_channel_manager(channel_files)
+
+        assert set(manager.channels) == {"ch_9"}
+
+    def test_changes_are_compacted_when_log_grows(self, channel_files):
+        """Mỗi thay đổi chỉ ghi thêm log, compact khi log dài hơn 2 lần số kênh hoặc khi flush"""
+        manager = make_channel_manager(channel_files)
+        config_file = channel_files / "channel_mapping_config.json"
+        original = config_file.read_bytes()
+
+        assert manager.add_channel(make_channel("ch_3", "Three")) is True
+        assert manager.remove_channel("ch_2") is True
+        assert manager.remove_channel("missing") is False
+        assert manager._log_entries == 2
+        assert config_file.read_bytes() == original
+
+        for i in range(3):
+            assert manager.update_channel("ch_3", make_channel("ch_3", f"Three v{i}")) is True
+        # 5 entries > 2 * 2 kênh
+        assert not os.path.exists(manager.channels_log_file)
+        data = json.loads(config_file.read_text(encoding="utf-8"))
+        assert [channel["channel_id"] for channel in data["channels"]] == ["ch_1", "ch_3"]
+
+        assert manager.update_channel("ch_1", make_channel("ch_1", "One v2")) is True
+        assert os.path.exists(manager.channels_log_file)
+        manager.flush()
+        assert not os.path.exists(manager.channels_log_file)
+
+        reloaded = make_channel_manager(channel_files)
+        assert set(reloaded.channels) == {"ch_1", "ch_3"}
+        assert reloaded.channels["ch_3"].channel_name == "Three v2"
+        assert reloaded.channels["ch_1"].channel_name == "One v2"
+
+    def test_failed_log_write_leaves_channels_unchanged(self, channel_files):
+        """Không ghi được log thì trả về False và không áp dụng thay đổi"""
+        manager = make_channel_manager(channel_files)
+        manager.channels_log_file = str(channel_files / "missing_dir" / "channel_mapping_config.jsonl")
+
+        assert manager.add_channel(make_channel("ch_3")) is False
+        assert manager.add_channels_bulk([make_channel("ch_4")]) == 0
+        assert manager.update_channel("ch_1", make_channel("ch_1", "Changed")) is False
+        assert manager.remove_channel("ch_2") is False
+
+        assert set(manager.channels) == {"ch_1", "ch_2"}
+        assert manager.channels["ch_1"].channel_name == "One"
+
+    @pytest.mark.asyncio
+    async def test_compact_every_change_is_debounced(self, channel_files):
+        """Bật compact_every_change thì trong event loop nhiều thay đổi chỉ compact một lần sau debounce"""
+        manager = make_channel_manager(channel_files)
+        manager.compact_every_change = True
+        manager._flush_delay = 0.01
+
+        with patch.object(manager, "_write_snapshot", wraps=manager._write_snapshot) as write_snapshot:
+            manager.add_channel(make_channel("ch_3"))
+            manager.add_channel(make_channel("ch_4"))
+            assert os.path.exists(manager.channels_log_file)
+
+            for _ in range(100):
+                await asyncio.sleep(0.01)
+                if not os.path.exists(manager.channels_log_file):
+                    break
+
+        assert write_snapshot.call_count == 1
+        assert not os.path.exists(manager.channels_log_file)
+        reloaded = make_channel_manager(channel_files)
+        assert {"ch_3", "ch_4"} <= set(reloaded.channels)
+
+
+class TestAsyncRateLimiter:
+    """Test token bucket giới hạn request AI"""
+
+    @pytest.mark.asyncio
+    async def test_acquire_waits_when_bucket_is_empty(self):
+        """Hết token thì caller chờ đến lượt của mình"""
+        limiter = _AsyncRateLimiter(rate=2, period=0.2)
+
+        start = time.monotonic()
+        await limiter.acquire()
+        await limiter.acquire()
+        assert time.monotonic() - start < 0.05
+
+        await limiter.acquire()
+        assert time.monotonic() - start >= 0.08
+
+    @pytest.mark.asyncio
+    async def test_concurrent_callers_sleep_in_parallel(self):
+        """Các caller giữ chỗ trước rồi ngủ song song, không xếp hàng sau người đang ngủ"""
+        limiter = _AsyncRateLimiter(rate=1, period=0.1)
+        await limiter.acquire()
+
+        start = time.monotonic()
+        await asyncio.gather(*(limiter.acquire() for _ in range(3)))
+        elapsed = time.monotonic() - start
+        # Lượt cuối đến sau 3 * 0.1s kể từ khi hết token
+        assert 0.25 <= elapsed < 0.5
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_returns_its_token(self):
+        """Caller bị huỷ khi đang chờ trả lại lượt đã giữ"""
+        limiter = _AsyncRateLimiter(rate=1, period=10)
+        await limiter.acquire()
+
+        waiter = asyncio.create_task(limiter.acquire())
+        await asyncio.sleep(0.01)
+        assert limiter._tokens < 0
+        waiter.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiter
+
+        assert limiter._tokens >= -0.01
+
+
+@pytest.fixture
+def generator():
+    generator = AIContentGenerator()
+    generator.config.gemini_soft_timeout = 0.05
+    return generator
+
+
+class TestCallWithFallback:
+    """Test hedge Gemini -> OpenAI"""
+
+    @pytest.mark.asyncio
+    async def test_gemini_result_within_soft_timeout(self, generator):
+        """Gemini trả về trong soft timeout thì không gọi OpenAI"""
+        generator._generate_with_gemini_retry = AsyncMock(return_value="gemini")
+        generator._generate_with_openai = AsyncMock(return_value="openai")
+
+        assert await generator._call_with_fallback("prompt") == "gemini"
+        generator._generate_with_openai.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_gemini_error_falls_back_to_openai(self, generator):
+        """Gemini lỗi thì chuyển sang OpenAI"""
+        generator._generate_with_gemini_retry = AsyncMock(side_effect=Exception("quota"))
+        generator._generate_with_openai = AsyncMock(return_value="openai")
+
+        assert await generator._call_with_fallback("prompt") == "openai"
+
+    @pytest.mark.asyncio
+    async def test_slow_gemini_is_hedged_and_cancelled(self, generator):
+        """Gemini chậm thì gửi song song sang OpenAI, request thua bị huỷ"""
+        gemini_cancelled = asyncio.Event()
+
+        async def slow_gemini(*args):
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                gemini_cancelled.set()
+                raise
+
+        generator._generate_with_gemini_retry = slow_gemini
+        generator._generate_with_openai = AsyncMock(return_value="openai")
+
+        assert await generator._call_with_fallback("prompt") == "openai"
+        assert gemini_cancelled.is_set()
+
+    @pytest.mark.asyncio
+    async def test_streaming_gemini_is_not_hedged(self, generator):
+        """Gemini đã stream chunk đầu trong soft timeout thì chờ hết response, không gọi OpenAI"""
+        async def streaming_gemini(prompt, temperature, stable_prefix, first_chunk, hedge_started):
+            await asyncio.sleep(0.01)
+            first_chunk.set()
+            await asyncio.sleep(0.1)  # Response dài hơn soft timeout
+            return "gemini"
+
+        generator._generate_with_gemini_retry = streaming_gemini
+        generator._generate_with_openai = AsyncMock(return_value="openai")
+
+        assert await generator._call_with_fallback("prompt") == "gemini"
+        generator._generate_with_openai.assert_not_awaited()
+
+    @pytest.mark.asyncio
+    async def test_gemini_is_not_retried_after_hedge(self, generator):
+        """Sau khi đã gửi song song sang OpenAI, Gemini lỗi 429 không retry nữa"""
+        generator.config.gemini_max_attempts = 3
+
+        async def rate_limited_gemini(*args):
+            await asyncio.sleep(0.1)
+            raise GeminiAPIError(429)
+
+        async def openai(*args):
+            await asyncio.sleep(0.2)
+            return "openai"
+
+        generator._generate_with_gemini = AsyncMock(side_effect=rate_limited_gemini)
+        generator._generate_with_openai = openai
+
+        assert await generator._call_with_fallback("prompt") == "openai"
+        assert generator._generate_with_gemini.await_count == 1
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_cancels_both_requests(self, generator):
+        """Caller bị huỷ thì cả request Gemini và OpenAI đang chạy đều bị huỷ"""
+        cancelled = []
+
+        def slow(name):
+            async def call(*args):
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.append(name)
+                    raise
+            return call
+
+        generator._generate_with_gemini_retry = slow("gemini")
+        generator._generate_with_openai = slow("openai")
+
+        task = asyncio.create_task(generator._call_with_fallback("prompt"))
+        await asyncio.sleep(0.1)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+        assert sorted(cancelled) == ["gemini", "openai"]
+
+
+class TestGeminiCachedContent:
+    """Test Gemini context caching cho phần prompt cố định"""
+
+    @pytest.mark.asyncio
+    async def test_short_prefix_is_not_sent(self, generator, caplog):
+        """Prefix dưới số token tối thiểu không gửi request tạo cache, chỉ log INFO một lần"""
+        generator._gemini_http_client = Mock(is_closed=False)
+        generator._gemini_http_client.post = AsyncMock()
+
+        with caplog.at_level("INFO", logger="src.ai_service"):
+            assert await generator._get_gemini_cached_content("short prefix") is None
+            assert await generator._get_gemini_cached_content("short prefix") is None
+
+        generator._gemini_http.post.assert_not_awaited()
+        assert len([r for r in caplog.records if "context caching" in r.getMessage()]) == 1
+
+    @pytest.mark.asyncio
+    async def test_failure_is_remembered_briefly(self, generator):
+        """Lỗi tạo cache (kể cả 400) chỉ được nhớ _gemini_cache_failure_ttl giây"""
+        prefix = "x" * 20000
+        generator._gemini_http_client = Mock(is_closed=False)
+        generator._gemini_http_client.post = AsyncMock(side_effect=[
+            httpx.Response(400),
+            httpx.Response(200, json={"name": "cachedContents/abc"})
+        ])
+
+        assert await generator._get_gemini_cached_content(prefix) is None
+        assert await generator._get_gemini_cached_content(prefix) is None
+        assert generator._gemini_http.post.await_count == 1
+
+        key = next(iter(generator._gemini_cached_contents))
+        name, expires_at = generator._gemini_cached_contents[key]
+        assert expires_at - time.monotonic() <= generator._gemini_cache_failure_ttl
+        generator._gemini_cached_contents[key] = (name, time.monotonic() - 1)
+
+        assert await generator._get_gemini_cached_content(prefix) == "cachedContents/abc"
+        assert generator._gemini_http.post.await_count == 2
+
+
+class TestClientLifecycle:
+    """Test đóng/mở lại client dùng chung giữa các lifespan của app"""
+
+    @pytest.mark.asyncio
+    async def test_generator_is_usable_after_close(self, generator):
+        """Sau aclose (hết lifespan) client được tạo lại ở lần dùng tiếp theo"""
+        openai_client = Mock(close=AsyncMock())
+        generator._openai_client = openai_client
+
+        async with generator:
+            gemini_http = generator._gemini_http
+        assert gemini_http.is_closed
+        openai_client.close.assert_awaited_once()
+
+        assert generator._gemini_http is not gemini_http
+        assert not generator._gemini_http.is_closed
+        assert generator.openai_client is not openai_client
+        await generator.aclose()
+
+    @pytest.mark.asyncio
+    async def test_airtable_client_is_usable_after_close(self):
+        """airtable_client.aclose() không làm hỏng các request sau đó"""
+        _, http = airtable_client._loop_resources()
+        await airtable_client.aclose()
+        assert http.is_closed
+
+        _, reopened = airtable_client._loop_resources()
+        assert reopened is not http
+        assert not reopened.is_closed
+        await airtable_client.aclose()
+
+
+class TestGenerateOptimizedContent:
+    """Test thứ tự các bước tạo nội dung"""
+
+    @pytest.mark.asyncio
+    async def test_description_overlaps_tags_and_image_prompts(self, generator):
+        """Description chạy song song với nhánh tags -> image prompts, tags không chờ description"""
+        events = []
+
+        async def step(name, delay, result):
+            events.append(f"{name}:start")
+            await asyncio.sleep(delay)
+            events.append(f"{name}:end")
+            return result
+
+        generator._generate_title_and_thumbnail = AsyncMock(return_value={"title": "Title", "thumbnail_text": "Thumb"})
+        generator._generate_description = lambda title, input_data: step("description", 0.1, "Description")
+        generator._generate_tags = lambda title, description, input_data: step("tags", 0.03, ["a", "b"])
+        generator._generate_image_prompts = lambda title, tags: step("images", 0.03, ["prompt"])
+
+        input_data = InputData(channel_name="Channel", channel_description="Mô tả")
+        start = time.monotonic()
+        content = await generator.generate_optimized_content(input_data)
+
+        assert time.monotonic() - start < 0.15
+        assert content.description == "Description"
+        assert content.tags == ["a", "b"]
+        assert content.image_prompts == ["prompt"]
+        assert events.index("tags:start") < events.index("description:end")
+        assert events.index("images:end") < events.index("description:end")
+
+
+class TestContentVariations:
+    """Test stream content variations"""
+
+    @pytest.mark.asyncio
+    async def test_closing_stream_cancels_and_awaits_remaining(self, generator):
+        """Caller dừng sớm thì các variation còn lại bị huỷ và đã dừng hẳn khi aclose() trả về"""
+        cancelled = []
+
+        async def generate(input_data, image_base64=None):
+            if input_data.channel_name == "fast":
+                return Mock(title="Fast title")
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                await asyncio.sleep(0)  # Dọn dẹp có await vẫn được chờ xong
+                cancelled.append(input_data.channel_name)
+                raise
+
+        generator.generate_optimized_content = generate
+        generator._build_variation_inputs = lambda inputs: inputs
+
+        stream = generator.iter_content_variations([
+            InputData(channel_name="fast"),
+            InputData(channel_name="slow_1"),
+            InputData(channel_name="slow_2")
+        ])
+        first = await stream.__anext__()
+        await stream.aclose()
+
+        assert first.title == "Fast title"
+        assert sorted(cancelled) == ["slow_1", "slow_2"]
+
+
+@pytest.fixture
+def airtable_transport():
+    """Gắn client HTTP dùng MockTransport vào airtable_client cho event loop của test"""
+    requests = []
+    responses = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    async def install():
+        airtable_client._loop_resources()
+        airtable_client._http = httpx.AsyncClient(
+            base_url=airtable_client._API_URL,
+            transport=httpx.MockTransport(handler)
+        )
+
+    yield install, requests, responses
+    airtable_client._loop = None
+    airtable_client._http = None
+
+
+class TestAsyncAirtable:
+    """Test client Airtable REST"""
+
+    @pytest.mark.asyncio
+    async def test_get_all_follows_offset(self, airtable_transport):
+        """get_all đọc hết các trang theo offset"""
+        install, requests, responses = airtable_transport
+        await install()
+        responses.extend([
+            httpx.Response(200, json={"records": [{"id": "rec1"}], "offset": "page2"}),
+            httpx.Response(200, json={"records": [{"id": "rec2"}]})
+        ])
+
+        table = AsyncAirtable("base", "My Table", "key")
+        records = await table.get_all(formula="{Status} = 'done'", fields=["Package ID"], sort=["-Created At"])
+
+        assert [record["id"] for record in records] == ["rec1", "rec2"]
+        assert requests[0].url.raw_path.startswith(b"/v0/base/My%20Table?")
+        assert requests[0].headers["Authorization"] == "Bearer key"
+        assert "offset" not in requests[0].url.params
+        assert requests[0].url.params["fields[]"] == "Package ID"
+        assert requests[0].url.params["sort[0][direction]"] == "desc"
+        assert requests[1].url.params["offset"] == "page2"
+
+    @pytest.mark.asyncio
+    async def test_transient_errors_are_retried(self, airtable_transport):
+        """PATCH được retry khi 429/5xx và lỗi mạng, lỗi khác raise ngay"""
+        install, requests, responses = airtable_transport
+        await install()
+        responses.extend([
+            httpx.Response(429),
+            httpx.Response(503),
+            httpx.ReadTimeout("timeout"),
+            httpx.Response(200, json={"id": "rec1"})
+        ])
+
+        table = AsyncAirtable("base", "Content", "key")
+        with patch.object(airtable_client.asyncio, "sleep", new=AsyncMock()) as sleep:
+            assert (await table.update("rec1", {"Status": "done"}))["id"] == "rec1"
+            assert sleep.await_count == 3
+
+            responses.append(httpx.Response(422, json={"error": "INVALID"}))
+            with pytest.raises(httpx.HTTPStatusError):
+                await table.update("rec1", {"Status": "done"})
+            assert sleep.await_count == 3
+
+        assert len(requests) == 5
+
+    @pytest.mark.asyncio
+    async def test_post_is_retried_only_when_not_created(self, airtable_transport):
+        """POST chỉ retry khi 429 hoặc lỗi kết nối, 5xx/read timeout có thể đã tạo record nên raise"""
+        install, requests, responses = airtable_transport
+        await install()
+        responses.extend([
+            httpx.Response(429),
+            httpx.ConnectError("refused"),
+            httpx.Response(200, json={"id": "rec1"})
+        ])
+
+        table = AsyncAirtable("base", "Content", "key")
+        with patch.object(airtable_client.asyncio, "sleep", new=AsyncMock()) as sleep:
+            assert (await table.insert({"Package ID": "pkg_1"}))["id"] == "rec1"
+            assert sleep.await_count == 2
+
+            responses.append(httpx.Response(503))
+            with pytest.raises(httpx.HTTPStatusError):
+                await table.insert({"Package ID": "pkg_2"})
+
+            responses.append(httpx.ReadTimeout("timeout"))
+            with pytest.raises(httpx.ReadTimeout):
+                await table.batch_insert([{"Package ID": "pkg_3"}])
+            assert sleep.await_count == 2
+
+        assert len(requests) == 5
+
+    @pytest.mark.asyncio
+    async def test_batch_insert_chunks_by_ten(self, airtable_transport):
+        """batch_insert gửi tối đa 10 records mỗi request"""
+        install, requests, responses = airtable_transport
+        await install()
+        responses.extend([
+            httpx.Response(200, json={"records": [{"id": f"rec{i}"} for i in range(10)]}),
+            httpx.Response(200, json={"records": [{"id": "rec10"}]})
+        ])
+
+        table = AsyncAirtable("base", "Content", "key")
+        created = await table.batch_insert([{"Package ID": f"pkg_{i}"} for i in range(11)])
+
+        assert len(created) == 11
+        assert [len(json.loads(request.content)["records"]) for request in requests] == [10, 1]
@@ -106,6 +106,14 @@ class TestAIService:
         assert "Technology reviews" in prompt
         assert "JSON" in prompt
 
+    def test_clean_and_validate_tags(self):
+        """Test tag cleaning to single-word format"""
+        ai_gen = AIContentGenerator()
+        tags = ai_gen._clean_and_validate_tags(
+            ["1. Relaxing-Music!", "#helios 4K", "Sleep, music.", "the", "zen (spa)"]
+        )
+        assert tags == ["relaxingmusic", "helios4k", "sleepmusic", "zenspa"]
+
 
 class TestImageService:
     """Test image generation service"""